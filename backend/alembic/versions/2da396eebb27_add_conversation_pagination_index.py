@@ -0,0 +1,37 @@
+"""add conversation pagination index
+
+Revision ID: 2da396eebb27
+Revises: 9a8db3e0f453
+Create Date: 2026-10-17 22:49:22.784626
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2da396eebb27'
+down_revision: Union[str, None] = '9a8db3e0f453'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so that message writes are not blocked on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_pair_timestamp',
+            'messages',
+            ['sender_id', 'receiver_id', 'timestamp', 'message_id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_pair_timestamp', table_name='messages', postgresql_concurrently=True)
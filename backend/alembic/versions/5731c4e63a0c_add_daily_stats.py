@@ -0,0 +1,181 @@
+"""add daily stats
+
+Revision ID: 5731c4e63a0c
+Revises: f683a641bd14
+Create Date: 2026-10-17 23:19:51.172324
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '5731c4e63a0c'
+down_revision: Union[str, None] = 'f683a641bd14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Timestamps are stored as naive UTC, so days are UTC days
+CHANGE_COLUMNS = (
+    'receiver_id, sender_id, "timestamp"::date AS day, is_manipulative, techniques, vulnerabilities, confidence'
+)
+
+# Daily bucket tables and their keys
+BUCKETS = {
+    "pair_daily_stats": "receiver_id, sender_id, day",
+    "receiver_daily_stats": "receiver_id, day",
+}
+
+
+def apply_changes(table: str, keys: str, changes: str) -> str:
+    """Add the signed message rows selected by `changes` to the `keys` buckets of `table`"""
+    return f"""
+        WITH changes AS ({changes}),
+        totals AS (
+            SELECT {keys},
+                   sum(sign) AS total_messages,
+                   coalesce(sum(sign) FILTER (WHERE is_manipulative), 0) AS manipulative_count,
+                   coalesce(sum(sign * confidence) FILTER (WHERE is_manipulative), 0) AS confidence_sum,
+                   coalesce(sum(sign) FILTER (WHERE is_manipulative AND confidence IS NOT NULL), 0) AS confidence_count
+            FROM changes
+            GROUP BY {keys}
+        ),
+        technique_counts AS (
+            SELECT {keys}, jsonb_object_agg(name, count) AS counts
+            FROM (
+                SELECT {keys}, name, sum(sign) AS count
+                FROM changes, unnest(techniques) AS name
+                WHERE is_manipulative
+                GROUP BY {keys}, name
+            ) labels
+            GROUP BY {keys}
+        ),
+        vulnerability_counts AS (
+            SELECT {keys}, jsonb_object_agg(name, count) AS counts
+            FROM (
+                SELECT {keys}, name, sum(sign) AS count
+                FROM changes, unnest(vulnerabilities) AS name
+                WHERE is_manipulative
+                GROUP BY {keys}, name
+            ) labels
+            GROUP BY {keys}
+        )
+        INSERT INTO {table} AS p (
+            {keys}, total_messages, manipulative_count,
+            confidence_sum, confidence_count, techniques, vulnerabilities
+        )
+        SELECT totals.*, coalesce(tc.counts, '{{}}'::jsonb), coalesce(vc.counts, '{{}}'::jsonb)
+        FROM totals
+        LEFT JOIN technique_counts tc USING ({keys})
+        LEFT JOIN vulnerability_counts vc USING ({keys})
+        -- Lock buckets in a fixed order so concurrent batches cannot deadlock
+        ORDER BY {keys}
+        ON CONFLICT ({keys}) DO UPDATE SET
+            total_messages = p.total_messages + EXCLUDED.total_messages,
+            manipulative_count = p.manipulative_count + EXCLUDED.manipulative_count,
+            confidence_sum = p.confidence_sum + EXCLUDED.confidence_sum,
+            confidence_count = p.confidence_count + EXCLUDED.confidence_count,
+            techniques = pair_stats_merge_counts(p.techniques, EXCLUDED.techniques),
+            vulnerabilities = pair_stats_merge_counts(p.vulnerabilities, EXCLUDED.vulnerabilities);
+    """
+
+
+def apply_to_buckets(changes: str) -> str:
+    return "\n".join(apply_changes(table, keys, changes) for table, keys in BUCKETS.items())
+
+
+# Same shape as the `pair_stats` triggers; a message moved to another day
+# (or pair) is subtracted from its old bucket and added to the new one
+CREATE_TRIGGERS = f"""
+    CREATE FUNCTION daily_stats_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {apply_to_buckets(f"SELECT {CHANGE_COLUMNS}, 1 AS sign FROM new_rows")}
+        ELSIF TG_OP = 'DELETE' THEN
+            {apply_to_buckets(f"SELECT {CHANGE_COLUMNS}, -1 AS sign FROM old_rows")}
+        ELSE
+            {apply_to_buckets(f'''
+                SELECT n.*, 1 AS sign FROM (SELECT message_id, {CHANGE_COLUMNS} FROM new_rows) n
+                JOIN (SELECT message_id, {CHANGE_COLUMNS} FROM old_rows) o USING (message_id)
+                WHERE (n.*) IS DISTINCT FROM (o.*)
+                UNION ALL
+                SELECT o.*, -1 AS sign FROM (SELECT message_id, {CHANGE_COLUMNS} FROM old_rows) o
+                JOIN (SELECT message_id, {CHANGE_COLUMNS} FROM new_rows) n USING (message_id)
+                WHERE (n.*) IS DISTINCT FROM (o.*)
+            ''')}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER daily_stats_insert
+    AFTER INSERT ON messages REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION daily_stats_apply();
+
+    CREATE TRIGGER daily_stats_update
+    AFTER UPDATE ON messages REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION daily_stats_apply();
+
+    CREATE TRIGGER daily_stats_delete
+    AFTER DELETE ON messages REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION daily_stats_apply();
+"""
+
+# Regenerates both tables; writers to `messages` wait until it commits
+CREATE_REBUILD = f"""
+    CREATE FUNCTION daily_stats_rebuild() RETURNS bigint AS $$
+    BEGIN
+        LOCK TABLE messages IN SHARE ROW EXCLUSIVE MODE;
+        TRUNCATE pair_daily_stats, receiver_daily_stats;
+        {apply_to_buckets(f"SELECT {CHANGE_COLUMNS}, 1 AS sign FROM messages")}
+        RETURN (SELECT count(*) FROM pair_daily_stats);
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('pair_daily_stats',
+    sa.Column('receiver_id', sa.UUID(), nullable=False),
+    sa.Column('sender_id', sa.UUID(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total_messages', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('manipulative_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('confidence_sum', sa.Float(), server_default=sa.text('0'), nullable=False),
+    sa.Column('confidence_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('techniques', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+    sa.Column('vulnerabilities', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+    sa.ForeignKeyConstraint(['receiver_id'], ['users.user_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['sender_id'], ['users.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('receiver_id', 'sender_id', 'day')
+    )
+    op.create_table('receiver_daily_stats',
+    sa.Column('receiver_id', sa.UUID(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total_messages', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('manipulative_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('confidence_sum', sa.Float(), server_default=sa.text('0'), nullable=False),
+    sa.Column('confidence_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('techniques', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+    sa.Column('vulnerabilities', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+    sa.ForeignKeyConstraint(['receiver_id'], ['users.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('receiver_id', 'day')
+    )
+    op.execute(CREATE_TRIGGERS)
+    op.execute(CREATE_REBUILD)
+    # Same transaction as the triggers, so no message is counted twice or missed
+    op.execute("SELECT daily_stats_rebuild()")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER daily_stats_insert ON messages")
+    op.execute("DROP TRIGGER daily_stats_update ON messages")
+    op.execute("DROP TRIGGER daily_stats_delete ON messages")
+    op.execute("DROP FUNCTION daily_stats_apply()")
+    op.execute("DROP FUNCTION daily_stats_rebuild()")
+    op.drop_table('receiver_daily_stats')
+    op.drop_table('pair_daily_stats')
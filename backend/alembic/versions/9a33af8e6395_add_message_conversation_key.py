@@ -0,0 +1,91 @@
+"""add message conversation key
+
+Revision ID: 9a33af8e6395
+Revises: 2da396eebb27
+Create Date: 2026-10-17 22:51:57.766306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a33af8e6395'
+down_revision: Union[str, None] = '2da396eebb27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rows updated per backfill transaction
+BACKFILL_BATCH_SIZE = 10000
+
+# Must match `app.db.models.conversation_key`
+CONVERSATION_KEY_SQL = """
+    md5(least({row}.sender_id, {row}.receiver_id)::text || ':' || greatest({row}.sender_id, {row}.receiver_id)::text)::uuid
+"""
+
+CREATE_TRIGGER = f"""
+    CREATE FUNCTION messages_conversation_key() RETURNS trigger AS $$
+    BEGIN
+        NEW.conversation_key := {CONVERSATION_KEY_SQL.format(row="NEW")};
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER messages_conversation_key
+    BEFORE INSERT OR UPDATE OF sender_id, receiver_id ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_conversation_key();
+"""
+
+BACKFILL_BATCH = sa.text(f"""
+    WITH batch AS (
+        SELECT message_id FROM messages
+        WHERE message_id > :last_message_id
+        ORDER BY message_id
+        LIMIT :batch_size
+    )
+    UPDATE messages m
+    SET conversation_key = {CONVERSATION_KEY_SQL.format(row="m")}
+    FROM batch
+    WHERE m.message_id = batch.message_id
+    RETURNING m.message_id
+""")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable without a default, so adding the column does not rewrite the table
+    op.add_column('messages', sa.Column('conversation_key', sa.UUID(), nullable=True))
+    # New rows get their key from the trigger, existing rows from the backfill
+    op.execute(CREATE_TRIGGER)
+
+    with op.get_context().autocommit_block():
+        # Backfill in short transactions, walking the primary key
+        connection = op.get_bind()
+        last_message_id = '00000000-0000-0000-0000-000000000000'
+        while True:
+            rows = connection.execute(
+                BACKFILL_BATCH,
+                {"last_message_id": last_message_id, "batch_size": BACKFILL_BATCH_SIZE},
+            ).fetchall()
+            if not rows:
+                break
+            last_message_id = max(row.message_id for row in rows)
+
+        op.create_index(
+            'ix_messages_conversation_timestamp',
+            'messages',
+            ['conversation_key', sa.literal_column('"timestamp" DESC'), sa.literal_column('message_id DESC')],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_conversation_timestamp', table_name='messages', postgresql_concurrently=True)
+    op.execute("DROP TRIGGER messages_conversation_key ON messages")
+    op.execute("DROP FUNCTION messages_conversation_key()")
+    op.drop_column('messages', 'conversation_key')
@@ -0,0 +1,175 @@
+"""add pair stats
+
+Revision ID: f683a641bd14
+Revises: 9a33af8e6395
+Create Date: 2026-10-17 23:13:20.520181
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'f683a641bd14'
+down_revision: Union[str, None] = '9a33af8e6395'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHANGE_COLUMNS = "receiver_id, sender_id, is_manipulative, techniques, vulnerabilities, confidence"
+
+
+def apply_changes(changes: str) -> str:
+    """Add the signed message rows selected by `changes` to `pair_stats`"""
+    return f"""
+        WITH changes AS ({changes}),
+        totals AS (
+            SELECT receiver_id, sender_id,
+                   sum(sign) AS total_messages,
+                   coalesce(sum(sign) FILTER (WHERE is_manipulative), 0) AS manipulative_count,
+                   coalesce(sum(sign * confidence) FILTER (WHERE is_manipulative), 0) AS confidence_sum,
+                   coalesce(sum(sign) FILTER (WHERE is_manipulative AND confidence IS NOT NULL), 0) AS confidence_count
+            FROM changes
+            GROUP BY receiver_id, sender_id
+        ),
+        technique_counts AS (
+            SELECT receiver_id, sender_id, jsonb_object_agg(name, count) AS counts
+            FROM (
+                SELECT receiver_id, sender_id, name, sum(sign) AS count
+                FROM changes, unnest(techniques) AS name
+                WHERE is_manipulative
+                GROUP BY receiver_id, sender_id, name
+            ) labels
+            GROUP BY receiver_id, sender_id
+        ),
+        vulnerability_counts AS (
+            SELECT receiver_id, sender_id, jsonb_object_agg(name, count) AS counts
+            FROM (
+                SELECT receiver_id, sender_id, name, sum(sign) AS count
+                FROM changes, unnest(vulnerabilities) AS name
+                WHERE is_manipulative
+                GROUP BY receiver_id, sender_id, name
+            ) labels
+            GROUP BY receiver_id, sender_id
+        )
+        INSERT INTO pair_stats AS p (
+            receiver_id, sender_id, total_messages, manipulative_count,
+            confidence_sum, confidence_count, techniques, vulnerabilities
+        )
+        SELECT t.receiver_id, t.sender_id, t.total_messages, t.manipulative_count,
+               t.confidence_sum, t.confidence_count,
+               coalesce(tc.counts, '{{}}'::jsonb), coalesce(vc.counts, '{{}}'::jsonb)
+        FROM totals t
+        LEFT JOIN technique_counts tc USING (receiver_id, sender_id)
+        LEFT JOIN vulnerability_counts vc USING (receiver_id, sender_id)
+        -- Lock pairs in a fixed order so concurrent batches cannot deadlock
+        ORDER BY t.receiver_id, t.sender_id
+        ON CONFLICT (receiver_id, sender_id) DO UPDATE SET
+            total_messages = p.total_messages + EXCLUDED.total_messages,
+            manipulative_count = p.manipulative_count + EXCLUDED.manipulative_count,
+            confidence_sum = p.confidence_sum + EXCLUDED.confidence_sum,
+            confidence_count = p.confidence_count + EXCLUDED.confidence_count,
+            techniques = pair_stats_merge_counts(p.techniques, EXCLUDED.techniques),
+            vulnerabilities = pair_stats_merge_counts(p.vulnerabilities, EXCLUDED.vulnerabilities);
+    """
+
+
+# Adds two {label: count} maps, dropping labels that reach zero
+CREATE_MERGE_COUNTS = """
+    CREATE FUNCTION pair_stats_merge_counts(counts jsonb, delta jsonb) RETURNS jsonb AS $$
+        SELECT coalesce(jsonb_object_agg(name, total) FILTER (WHERE total <> 0), '{}'::jsonb)
+        FROM (
+            SELECT name, sum(count::bigint) AS total
+            FROM (
+                SELECT * FROM jsonb_each_text(counts)
+                UNION ALL
+                SELECT * FROM jsonb_each_text(delta)
+            ) AS entries(name, count)
+            GROUP BY name
+        ) totals
+    $$ LANGUAGE sql IMMUTABLE;
+"""
+
+# Statement-level, so a multi-row INSERT or a COPY updates each pair once.
+# Transition tables rule out `UPDATE OF <columns>`, so updates that leave
+# the counted columns alone are filtered out instead.
+CREATE_TRIGGERS = f"""
+    CREATE FUNCTION pair_stats_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {apply_changes(f"SELECT {CHANGE_COLUMNS}, 1 AS sign FROM new_rows")}
+        ELSIF TG_OP = 'DELETE' THEN
+            {apply_changes(f"SELECT {CHANGE_COLUMNS}, -1 AS sign FROM old_rows")}
+        ELSE
+            {apply_changes(f'''
+                SELECT n.*, 1 AS sign FROM (SELECT message_id, {CHANGE_COLUMNS} FROM new_rows) n
+                JOIN (SELECT message_id, {CHANGE_COLUMNS} FROM old_rows) o USING (message_id)
+                WHERE (n.*) IS DISTINCT FROM (o.*)
+                UNION ALL
+                SELECT o.*, -1 AS sign FROM (SELECT message_id, {CHANGE_COLUMNS} FROM old_rows) o
+                JOIN (SELECT message_id, {CHANGE_COLUMNS} FROM new_rows) n USING (message_id)
+                WHERE (n.*) IS DISTINCT FROM (o.*)
+            ''')}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER pair_stats_insert
+    AFTER INSERT ON messages REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION pair_stats_apply();
+
+    CREATE TRIGGER pair_stats_update
+    AFTER UPDATE ON messages REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION pair_stats_apply();
+
+    CREATE TRIGGER pair_stats_delete
+    AFTER DELETE ON messages REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION pair_stats_apply();
+"""
+
+# Regenerates the whole rollup; writers to `messages` wait until it commits
+CREATE_REBUILD = f"""
+    CREATE FUNCTION pair_stats_rebuild() RETURNS bigint AS $$
+    BEGIN
+        LOCK TABLE messages IN SHARE ROW EXCLUSIVE MODE;
+        TRUNCATE pair_stats;
+        {apply_changes(f"SELECT {CHANGE_COLUMNS}, 1 AS sign FROM messages")}
+        RETURN (SELECT count(*) FROM pair_stats);
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('pair_stats',
+    sa.Column('receiver_id', sa.UUID(), nullable=False),
+    sa.Column('sender_id', sa.UUID(), nullable=False),
+    sa.Column('total_messages', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('manipulative_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('confidence_sum', sa.Float(), server_default=sa.text('0'), nullable=False),
+    sa.Column('confidence_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('techniques', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+    sa.Column('vulnerabilities', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+    sa.ForeignKeyConstraint(['receiver_id'], ['users.user_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['sender_id'], ['users.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('receiver_id', 'sender_id')
+    )
+    op.execute(CREATE_MERGE_COUNTS)
+    op.execute(CREATE_TRIGGERS)
+    op.execute(CREATE_REBUILD)
+    # Same transaction as the triggers, so no message is counted twice or missed
+    op.execute("SELECT pair_stats_rebuild()")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER pair_stats_insert ON messages")
+    op.execute("DROP TRIGGER pair_stats_update ON messages")
+    op.execute("DROP TRIGGER pair_stats_delete ON messages")
+    op.execute("DROP FUNCTION pair_stats_apply()")
+    op.execute("DROP FUNCTION pair_stats_rebuild()")
+    op.execute("DROP FUNCTION pair_stats_merge_counts(jsonb, jsonb)")
+    op.drop_table('pair_stats')
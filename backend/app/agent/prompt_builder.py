@@ -132,6 +132,8 @@ TOOL USAGE INSTRUCTIONS:
    - Use `analyze_specific_user` to check a specific person
    - Use `find_messages_with_technique` to locate examples of a known technique
    - Use `find_messages_targeting_vulnerability` to identify vulnerability-based manipulation
+   - Pass `order_by="severity"` to these message tools when the user asks for the worst or most serious examples
+   - Use `analyze_manipulation_trend` when the user asks whether manipulation is getting worse, better, or how it changed over time
 
 3. For questions that could be considered both general and personal, you may combine multiple tools if needed.
 
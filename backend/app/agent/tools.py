@@ -1,14 +1,17 @@
-from typing import Optional, Dict, Any, List
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Literal
 from langchain_core.tools import tool
 from uuid import UUID
 from pydantic import BaseModel, Field
 
 from app.core.context import get_global_perplexity, get_global_postgres_client
 from app.service.statistics import (
+    MESSAGE_ORDERS,
     get_all_statistics, 
     get_single_statistics,
     get_messages_by_technique, 
-    get_messages_by_vulnerability
+    get_messages_by_vulnerability,
+    get_trend_statistics
 )
 from app.db.models import ManipulativeTechniques, Vulnerabilities
 
@@ -29,6 +32,7 @@ class UserStatistics(BaseModel):
     total_messages: int = Field(description="Total number of messages sent by this user")
     manipulative_count: int = Field(description="Number of manipulative messages sent by this user")
     manipulative_percentage: float = Field(description="Percentage of messages that are manipulative")
+    average_confidence: Optional[float] = Field(None, description="Mean classifier confidence (0-1) of the manipulative messages, a measure of severity")
     techniques: List[TechniqueStatistics] = Field(description="List of manipulation techniques used, sorted by frequency")
     vulnerabilities: List[VulnerabilityStatistics] = Field(description="List of vulnerabilities targeted, sorted by frequency")
 
@@ -38,6 +42,7 @@ class Message(BaseModel):
     timestamp: str = Field(description="Timestamp when the message was sent")
     techniques: Optional[List[str]] = Field(None, description="Manipulation techniques detected in this message")
     vulnerabilities: Optional[List[str]] = Field(None, description="Vulnerabilities targeted by this message")
+    confidence: Optional[float] = Field(None, description="Classifier confidence (0-1) that this message is manipulative")
 
 # Tools implementation
 @tool(description="Get manipulation statistics for all users who have messaged the current user. Returns users sorted from most to least manipulative, with detailed statistics about manipulation techniques and targeted vulnerabilities.")
@@ -127,19 +132,21 @@ async def analyze_specific_user(
     except Exception as e:
         return {"error": f"Failed to retrieve statistics: {str(e)}"}
 
-@tool(description="Find messages using a specific manipulation technique, sorted by recency.")
+@tool(description="Find messages using a specific manipulation technique, sorted by recency or by severity (classifier confidence).")
 async def find_messages_with_technique(
     technique: str = Field(..., description="Manipulation technique to search for (e.g., 'Persuasion or Seduction', 'Rationalization')"),
     selected_user_id: Optional[str] = Field(None, description="Optional: ID of a specific user to analyze. If not provided, will search across all users."),
-    limit: int = Field(10, description="Maximum number of messages to return")
+    limit: int = Field(10, description="Maximum number of messages to return"),
+    order_by: Literal["recent", "severity"] = Field("recent", description="'recent' for newest first, 'severity' for most confidently manipulative first")
 ) -> Dict[str, Any]:
     """
-    Find messages that use a specific manipulation technique, sorted by recency.
+    Find messages that use a specific manipulation technique, sorted by recency or severity.
     
     Args:
         technique: The manipulation technique to search for
         selected_user_id: Optional ID of a specific user to filter by
         limit: Maximum number of messages to return
+        order_by: "recent" or "severity"
         
     Returns:
         Dictionary with the technique name and list of matching messages
@@ -160,6 +167,9 @@ async def find_messages_with_technique(
                 "error": f"Invalid technique. Valid options are: {', '.join(valid_techniques)}"
             }
         
+        if order_by not in MESSAGE_ORDERS:
+            return {"error": f"Invalid order_by. Valid options are: {', '.join(MESSAGE_ORDERS)}"}
+        
         selected_user_uuid = UUID(selected_user_id) if selected_user_id else None
         
         messages = await get_messages_by_technique(
@@ -167,7 +177,8 @@ async def find_messages_with_technique(
             user_id,
             technique,
             selected_user_uuid,
-            limit
+            limit,
+            order_by
         )
         
         return {
@@ -180,19 +191,21 @@ async def find_messages_with_technique(
     except Exception as e:
         return {"error": f"Failed to retrieve messages: {str(e)}"}
 
-@tool(description="Find messages targeting a specific vulnerability, sorted by recency.")
+@tool(description="Find messages targeting a specific vulnerability, sorted by recency or by severity (classifier confidence).")
 async def find_messages_targeting_vulnerability(
     vulnerability: str = Field(..., description="Vulnerability to search for (e.g., 'Dependency', 'Naivete')"),
     selected_user_id: Optional[str] = Field(None, description="Optional: ID of a specific user to analyze. If not provided, will search across all users."),
-    limit: int = Field(10, description="Maximum number of messages to return")
+    limit: int = Field(10, description="Maximum number of messages to return"),
+    order_by: Literal["recent", "severity"] = Field("recent", description="'recent' for newest first, 'severity' for most confidently manipulative first")
 ) -> Dict[str, Any]:
     """
-    Find messages that target a specific vulnerability, sorted by recency.
+    Find messages that target a specific vulnerability, sorted by recency or severity.
     
     Args:
         vulnerability: The vulnerability to search for
         selected_user_id: Optional ID of a specific user to filter by
         limit: Maximum number of messages to return
+        order_by: "recent" or "severity"
         
     Returns:
         Dictionary with the vulnerability name and list of matching messages
@@ -213,6 +226,9 @@ async def find_messages_targeting_vulnerability(
                 "error": f"Invalid vulnerability. Valid options are: {', '.join(valid_vulnerabilities)}"
             }
         
+        if order_by not in MESSAGE_ORDERS:
+            return {"error": f"Invalid order_by. Valid options are: {', '.join(MESSAGE_ORDERS)}"}
+        
         selected_user_uuid = UUID(selected_user_id) if selected_user_id else None
         
         messages = await get_messages_by_vulnerability(
@@ -220,7 +236,8 @@ async def find_messages_targeting_vulnerability(
             user_id,
             vulnerability,
             selected_user_uuid,
-            limit
+            limit,
+            order_by
         )
         
         return {
@@ -233,6 +250,57 @@ async def find_messages_targeting_vulnerability(
     except Exception as e:
         return {"error": f"Failed to retrieve messages: {str(e)}"}
 
+@tool(description="Get how manipulation toward the current user changes over time: counts of manipulative messages per day, week or month, broken down by technique and vulnerability, for all contacts or one specific user. Use it to tell whether manipulation is escalating or easing.")
+async def analyze_manipulation_trend(
+    selected_user_id: Optional[str] = Field(None, description="Optional: ID of a specific user to analyze. If not provided, covers messages from all users."),
+    granularity: str = Field("week", description="Bucket size: 'day', 'week' or 'month'"),
+    days: int = Field(90, description="How many days of history to cover, ending today")
+) -> Dict[str, Any]:
+    """
+    Analyze how manipulative behavior toward the current user evolves over time.
+    
+    Args:
+        selected_user_id: Optional ID of a specific user to filter by
+        granularity: "day", "week" or "month"
+        days: Number of days of history to include, ending today
+        
+    Returns:
+        Dictionary with one entry per period that has messages, oldest first
+    """
+    db_client = get_global_postgres_client()
+    
+    if not db_client:
+        return {"error": "Database connection not available"}
+    
+    # The user_id will be injected when tool is created in the controller
+    user_id = None  # This will be replaced with actual user_id
+    
+    try:
+        if granularity not in ("day", "week", "month"):
+            return {"error": "Invalid granularity. Valid options are: day, week, month"}
+        
+        selected_user_uuid = UUID(selected_user_id) if selected_user_id else None
+        end_date = datetime.now(tz=timezone.utc).date()
+        
+        periods = await get_trend_statistics(
+            db_client,
+            user_id,
+            selected_user_uuid,
+            granularity,
+            end_date - timedelta(days=days),
+            end_date
+        )
+        
+        return {
+            "granularity": granularity,
+            "period_count": len(periods),
+            "periods": periods
+        }
+    except ValueError:
+        return {"error": "Invalid user ID format"}
+    except Exception as e:
+        return {"error": f"Failed to retrieve trend statistics: {str(e)}"}
+
 # Function to create tools with injected user_id
 def create_tools_with_user_id(user_id: UUID):
     """Create tool instances with user_id injected into their closures"""
@@ -269,12 +337,13 @@ def create_tools_with_user_id(user_id: UUID):
     async def find_messages_with_technique_with_user(
         technique: str,
         selected_user_id: Optional[str] = None,
-        limit: int = 10
+        limit: int = 10,
+        order_by: Literal["recent", "severity"] = "recent"
     ):
         db_client = get_global_postgres_client()
         try:
             selected_user_uuid = UUID(selected_user_id) if selected_user_id else None
-            messages = await get_messages_by_technique(db_client, user_id, technique, selected_user_uuid, limit)
+            messages = await get_messages_by_technique(db_client, user_id, technique, selected_user_uuid, limit, order_by)
             return {
                 "technique": technique,
                 "message_count": len(messages),
@@ -287,12 +356,13 @@ def create_tools_with_user_id(user_id: UUID):
     async def find_messages_targeting_vulnerability_with_user(
         vulnerability: str,
         selected_user_id: Optional[str] = None,
-        limit: int = 10
+        limit: int = 10,
+        order_by: Literal["recent", "severity"] = "recent"
     ):
         db_client = get_global_postgres_client()
         try:
             selected_user_uuid = UUID(selected_user_id) if selected_user_id else None
-            messages = await get_messages_by_vulnerability(db_client, user_id, vulnerability, selected_user_uuid, limit)
+            messages = await get_messages_by_vulnerability(db_client, user_id, vulnerability, selected_user_uuid, limit, order_by)
             return {
                 "vulnerability": vulnerability,
                 "message_count": len(messages),
@@ -301,11 +371,33 @@ def create_tools_with_user_id(user_id: UUID):
         except Exception as e:
             return {"error": str(e)}
 
+    @tool(description=analyze_manipulation_trend.description)
+    async def analyze_manipulation_trend_with_user(
+        selected_user_id: Optional[str] = None,
+        granularity: str = "week",
+        days: int = 90
+    ):
+        db_client = get_global_postgres_client()
+        try:
+            selected_user_uuid = UUID(selected_user_id) if selected_user_id else None
+            end_date = datetime.now(tz=timezone.utc).date()
+            periods = await get_trend_statistics(
+                db_client, user_id, selected_user_uuid, granularity, end_date - timedelta(days=days), end_date
+            )
+            return {
+                "granularity": granularity,
+                "period_count": len(periods),
+                "periods": periods
+            }
+        except Exception as e:
+            return {"error": str(e)}
+
     return [
         analyze_all_users_with_user,
         analyze_specific_user_with_user,
         find_messages_with_technique_with_user,
         find_messages_targeting_vulnerability_with_user,
+        analyze_manipulation_trend_with_user,
         web_search
     ]
 
@@ -354,5 +446,6 @@ tools = [
     analyze_all_users,
     analyze_specific_user,
     find_messages_with_technique,
-    find_messages_targeting_vulnerability
+    find_messages_targeting_vulnerability,
+    analyze_manipulation_trend
 ]
\ No newline at end of file
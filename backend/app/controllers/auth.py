@@ -4,7 +4,7 @@ from uuid import UUID, uuid4
 from sqlalchemy import select
 
 from app.db.models import User
-from app.core.context import get_postgres_client
+from app.core.context import get_postgres_client, get_user_directory
 from app.dto.auth import (
     UserCreate, 
     UserLogin, 
@@ -49,6 +49,7 @@ async def signup(user_data: UserCreate, request: Request):
         )
         
         await db_client.insert([new_user])
+        get_user_directory(request).put(user_id, user_data.name, user_data.email)
         
         # Return response with UUID converted to string
         return UserResponse(
@@ -1,13 +1,11 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Request, Query, status
 import json
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from uuid import UUID
-from sqlalchemy import select
 
-from app.db.models import User
-from app.core.context import get_postgres_client, get_ws_manager
-from app.service.chat_service import save_message, get_conversation, format_message_for_response
+from app.core.context import get_postgres_client, get_user_directory, get_ws_manager
+from app.service.chat_service import save_message, get_conversation, format_message_for_response, decode_cursor
 from app.dto.chat import (
     MessagesResponse, 
     MessagesResponseCore, 
@@ -41,24 +39,17 @@ async def websocket_endpoint(
     # Get services from context
     db_client = context.db_workspace
     ws_manager = context.ws_manager
+    classification_queue = context.classification_queue
     
     # Verify the user exists
     try:
-        # Convert to UUID for database query
+        # Convert to UUID for the user directory lookup
         user_uuid = UUID(user_id)
         
-        async with db_client.session_autocommit() as db:
-            stmt = select(User).where(User.user_id == user_uuid)
-            result = await db_client.select(stmt)
-            user = result.first()
-            
-            if not user:
-                await websocket.close(code=1008, reason="User not found")
-                return
-                
-            # Try to access user data differently if needed
-            if hasattr(user, 'User'):
-                user = user.User
+        user = await context.user_directory.get(user_uuid)
+        if not user:
+            await websocket.close(code=1008, reason="User not found")
+            return
     except ValueError:
         await websocket.close(code=1008, reason="Invalid user ID format")
         return
@@ -67,8 +58,8 @@ async def websocket_endpoint(
         await websocket.close(code=1011, reason="Database query error")
         return
     
-    # Connect to WebSocket - pass the string ID
-    await ws_manager.connect(websocket, user_id)
+    # Connect to WebSocket - pass the string ID; a user may have several
+    connection_id = await ws_manager.connect(websocket, user_id)
     
     try:
         while True:
@@ -81,7 +72,7 @@ async def websocket_endpoint(
                 
                 # Validate required fields
                 if "receiver_id" not in message_data or "content" not in message_data:
-                    await websocket.send_json({
+                    ws_manager.send_to_connection(user_id, connection_id, {
                         "type": "error",
                         "message": "Missing required fields (receiver_id, content)"
                     })
@@ -92,7 +83,7 @@ async def websocket_endpoint(
                 
                 # Convert to UUID if string was provided
                 if not isinstance(receiver_id, str):
-                    await websocket.send_json({
+                    ws_manager.send_to_connection(user_id, connection_id, {
                         "type": "error",
                         "message": "receiver_id must be a string"
                     })
@@ -102,47 +93,57 @@ async def websocket_endpoint(
                     # Validate UUID format but keep as string for service layer
                     UUID(receiver_id)
                 except ValueError:
-                    await websocket.send_json({
+                    ws_manager.send_to_connection(user_id, connection_id, {
                         "type": "error",
                         "message": "Invalid receiver_id format, must be a valid UUID"
                     })
                     continue
                 
                 # Save message using service - pass string IDs
-                new_message = await save_message(db_client, user_id, receiver_id, content)
+                # In background mode classification happens after delivery
+                new_message = await save_message(
+                    db_client, user_id, receiver_id, content,
+                    classify=classification_queue is None
+                )
                 
                 if not new_message:
-                    await websocket.send_json({
+                    ws_manager.send_to_connection(user_id, connection_id, {
                         "type": "error",
                         "message": "Failed to save message"
                     })
                     continue
                 
                 # Format message for receiver - pass string receiver_id
-                message_for_receiver = await format_message_for_response(db_client, new_message, receiver_id)
+                message_for_receiver = await format_message_for_response(new_message, receiver_id)
+                if classification_queue:
+                    message_for_receiver["classification_pending"] = True
                 
                 # Send to receiver if online - pass string ID
                 sent = await ws_manager.send_message(message_for_receiver, receiver_id)
                 
                 # Send delivery receipt to sender
-                await websocket.send_json({
+                ws_manager.send_to_connection(user_id, connection_id, {
                     "type": "receipt",
                     "message_id": str(new_message.message_id),  # Ensure this is a string
                     "delivered": sent,
                     "timestamp": datetime.now(tz=timezone.utc).isoformat()
                 })
                 
+                # Labels follow as a "classification" event to both users
+                if classification_queue:
+                    await classification_queue.submit(new_message.message_id, user_id, receiver_id, content)
+                
             except json.JSONDecodeError:
-                await websocket.send_json({
+                ws_manager.send_to_connection(user_id, connection_id, {
                     "type": "error",
                     "message": "Invalid JSON format"
                 })
                 
     except WebSocketDisconnect:
-        # Handle disconnection - pass string ID
-        ws_manager.disconnect(user_id)
+        pass
     finally:
-        # Clean up resources
+        # Clean up resources - only this socket, the user's others stay open
+        ws_manager.disconnect(user_id, connection_id)
         logger.info(f"WebSocket connection closed for user {user_id}")
 
 # REST endpoint to get messages
@@ -152,35 +153,47 @@ async def get_messages(
     other_user_id: str, 
     request: Request,
     limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
 ):
-    """Get messages between two users"""
+    """Get messages between two users
+    
+    Without cursors the latest `limit` messages are returned. Pass the
+    response's `before_cursor` as `before` to page back through older
+    messages, or its `after_cursor` as `after` to fetch newer ones.
+    """
     db_client = get_postgres_client(request)
     
+    try:
+        before_position = decode_cursor(before) if before else None
+        after_position = decode_cursor(after) if after else None
+    except ValueError:
+        return MessagesResponse(
+            code=status.HTTP_400_BAD_REQUEST,
+            success=False,
+            message="Invalid pagination cursor",
+            response=None
+        )
+    
     try:
         # Convert strings to UUIDs for database operations
         user_uuid = UUID(user_id)
         other_user_uuid = UUID(other_user_id)
         
-        async with db_client.session_autocommit() as db:
-            # Verify both users exist
-            user_stmt = select(User).where(User.user_id == user_uuid)
-            user_result = await db_client.select(user_stmt)
-            user = user_result.first()
-            
-            other_user_stmt = select(User).where(User.user_id == other_user_uuid)
-            other_user_result = await db_client.select(other_user_stmt)
-            other_user = other_user_result.first()
-            
-            if not user or not other_user:
-                return MessagesResponse(
-                    code=status.HTTP_404_NOT_FOUND,
-                    success=False,
-                    message="One or both users not found",
-                    response=None
-                )
+        # Verify both users exist
+        users = await get_user_directory(request).get_many([user_uuid, other_user_uuid])
+        if user_uuid not in users or other_user_uuid not in users:
+            return MessagesResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="One or both users not found",
+                response=None
+            )
         
         # Get messages using service - pass UUID objects since the service expects them
-        raw_messages = await get_conversation(db_client, user_uuid, other_user_uuid, limit)
+        raw_messages = await get_conversation(
+            db_client, user_uuid, other_user_uuid, limit, before_position, after_position
+        )
         
         # Convert to DTO format
         message_cores = [
@@ -193,14 +206,20 @@ async def get_messages(
                 is_sent_by_me=msg["is_sent_by_me"],
                 is_manipulative=msg.get("is_manipulative", False),
                 techniques=msg.get("techniques"),
-                vulnerabilities=msg.get("vulnerabilities")
+                vulnerabilities=msg.get("vulnerabilities"),
+                confidence=msg.get("confidence"),
+                cursor=msg.get("cursor")
             )
             for msg in raw_messages
         ]
         
         return MessagesResponse(
             message="Messages retrieved successfully",
-            response=MessagesResponseCore(messages=message_cores)
+            response=MessagesResponseCore(
+                messages=message_cores,
+                before_cursor=message_cores[0].cursor if message_cores else before,
+                after_cursor=message_cores[-1].cursor if message_cores else after
+            )
         )
     except ValueError:
         return MessagesResponse(
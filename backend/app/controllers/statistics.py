@@ -1,15 +1,15 @@
 from fastapi import APIRouter, HTTPException, Request, status, Query
 from uuid import UUID
 from typing import List, Optional
-from sqlalchemy import select
 
-from app.core.context import get_postgres_client
-from app.db.models import User, ManipulativeTechniques, Vulnerabilities
+from app.core.context import get_postgres_client, get_user_directory
+from app.db.models import ManipulativeTechniques, Vulnerabilities
 from app.dto.statistics import (
     AllStatisticRequest,
     SingleStatisticRequest,
     MessagesByTechniqueRequest,
     MessagesByVulnerabilityRequest,
+    TrendStatisticRequest,
     SingleStatisticResponse,
     AllStatisticResponse,
     StatisticResponseCore,
@@ -20,13 +20,17 @@ from app.dto.statistics import (
     MessagesByVulnerabilityResponse,
     MessagesByTechniqueResponseCore,
     MessagesByVulnerabilityResponseCore,
-    ManipulativeMessage
+    ManipulativeMessage,
+    TrendPeriod,
+    TrendStatisticResponse,
+    TrendStatisticResponseCore
 )
 from app.service.statistics import (
     get_all_statistics,
     get_single_statistics,
     get_messages_by_technique,
-    get_messages_by_vulnerability
+    get_messages_by_vulnerability,
+    get_trend_statistics
 )
 from loguru import logger
 
@@ -44,18 +48,14 @@ async def get_all_manipulation_statistics(request: Request, body: AllStatisticRe
         user_uuid = UUID(body.user_id)
         
         # Verify the user exists
-        async with db_client.session_autocommit() as db:
-            user_stmt = select(User).where(User.user_id == user_uuid)
-            user_result = await db_client.select(user_stmt)
-            user = user_result.first()
-            
-            if not user:
-                return AllStatisticResponse(
-                    code=status.HTTP_404_NOT_FOUND,
-                    success=False,
-                    message="User not found",
-                    response=None
-                )
+        user = await get_user_directory(request).get(user_uuid)
+        if not user:
+            return AllStatisticResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="User not found",
+                response=None
+            )
         
         # Get statistics from service
         statistics = await get_all_statistics(
@@ -94,6 +94,7 @@ async def get_all_manipulation_statistics(request: Request, body: AllStatisticRe
                     total_messages=stat["total_messages"],
                     manipulative_count=stat["manipulative_count"],
                     manipulative_percentage=stat["manipulative_percentage"],
+                    average_confidence=stat["average_confidence"],
                     techniques=technique_stats,
                     vulnerabilities=vulnerability_stats
                 )
@@ -134,22 +135,14 @@ async def get_single_manipulation_statistics(request: Request, body: SingleStati
         selected_user_uuid = UUID(body.selected_user_id)
         
         # Verify both users exist
-        async with db_client.session_autocommit() as db:
-            user_stmt = select(User).where(User.user_id == user_uuid)
-            user_result = await db_client.select(user_stmt)
-            user = user_result.first()
-            
-            selected_user_stmt = select(User).where(User.user_id == selected_user_uuid)
-            selected_user_result = await db_client.select(selected_user_stmt)
-            selected_user = selected_user_result.first()
-            
-            if not user or not selected_user:
-                return SingleStatisticResponse(
-                    code=status.HTTP_404_NOT_FOUND,
-                    success=False,
-                    message="One or both users not found",
-                    response=None
-                )
+        users = await get_user_directory(request).get_many([user_uuid, selected_user_uuid])
+        if user_uuid not in users or selected_user_uuid not in users:
+            return SingleStatisticResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="One or both users not found",
+                response=None
+            )
         
         # Get statistics from service
         statistics = await get_single_statistics(
@@ -193,6 +186,7 @@ async def get_single_manipulation_statistics(request: Request, body: SingleStati
             total_messages=statistics["total_messages"],
             manipulative_count=statistics["manipulative_count"],
             manipulative_percentage=statistics["manipulative_percentage"],
+            average_confidence=statistics["average_confidence"],
             techniques=technique_stats,
             vulnerabilities=vulnerability_stats
         )
@@ -219,6 +213,96 @@ async def get_single_manipulation_statistics(request: Request, body: SingleStati
             response=None
         )
 
+@router.post("/trend_statistics")
+async def get_manipulation_trend_statistics(request: Request, body: TrendStatisticRequest):
+    """
+    Get manipulative message counts per day, week or month, optionally for one sender
+    """
+    db_client = get_postgres_client(request)
+    
+    try:
+        # Convert strings to UUIDs for database operations
+        user_uuid = UUID(body.user_id)
+        selected_user_uuid = UUID(body.selected_user_id) if body.selected_user_id else None
+        
+        # Verify the user, and the selected user if provided, in one lookup
+        users = await get_user_directory(request).get_many(
+            [user_uuid, selected_user_uuid] if selected_user_uuid else [user_uuid]
+        )
+        if user_uuid not in users:
+            return TrendStatisticResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="User not found",
+                response=None
+            )
+        
+        if selected_user_uuid and selected_user_uuid not in users:
+            return TrendStatisticResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="Selected user not found",
+                response=None
+            )
+
+        if body.start_date and body.end_date and body.start_date > body.end_date:
+            return TrendStatisticResponse(
+                code=status.HTTP_400_BAD_REQUEST,
+                success=False,
+                message="start_date must not be after end_date",
+                response=None
+            )
+
+        # Get trend buckets from service
+        periods = await get_trend_statistics(
+            db_client,
+            user_uuid,
+            selected_user_uuid,
+            body.granularity.value,
+            body.start_date,
+            body.end_date
+        )
+        
+        # Convert to DTO format
+        period_list = [
+            TrendPeriod(
+                period_start=period["period_start"],
+                total_messages=period["total_messages"],
+                manipulative_count=period["manipulative_count"],
+                manipulative_percentage=period["manipulative_percentage"],
+                average_confidence=period["average_confidence"],
+                techniques=[TechniqueStatistics(**tech) for tech in period["techniques"]],
+                vulnerabilities=[VulnerabilityStatistics(**vuln) for vuln in period["vulnerabilities"]]
+            )
+            for period in periods
+        ]
+        
+        # Create response
+        return TrendStatisticResponse(
+            message="Trend statistics retrieved successfully",
+            response=TrendStatisticResponseCore(
+                granularity=body.granularity.value,
+                selected_user_id=body.selected_user_id,
+                periods=period_list
+            )
+        )
+        
+    except ValueError:
+        return TrendStatisticResponse(
+            code=status.HTTP_400_BAD_REQUEST,
+            success=False,
+            message="Invalid user ID format",
+            response=None
+        )
+    except Exception as e:
+        logger.error(f"Error getting trend statistics: {str(e)}")
+        return TrendStatisticResponse(
+            code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            success=False,
+            message=f"Internal server error: {str(e)}",
+            response=None
+        )
+
 @router.post("/messages_by_technique")
 async def get_messages_by_technique_endpoint(request: Request, body: MessagesByTechniqueRequest):
     """
@@ -231,33 +315,25 @@ async def get_messages_by_technique_endpoint(request: Request, body: MessagesByT
         user_uuid = UUID(body.user_id)
         selected_user_uuid = UUID(body.selected_user_id) if body.selected_user_id else None
         
-        # Verify user exists
-        async with db_client.session_autocommit() as db:
-            user_stmt = select(User).where(User.user_id == user_uuid)
-            user_result = await db_client.select(user_stmt)
-            user = user_result.first()
-            
-            if not user:
-                return MessagesByTechniqueResponse(
-                    code=status.HTTP_404_NOT_FOUND,
-                    success=False,
-                    message="User not found",
-                    response=None
-                )
-            
-            # Verify selected user if provided
-            if selected_user_uuid:
-                selected_user_stmt = select(User).where(User.user_id == selected_user_uuid)
-                selected_user_result = await db_client.select(selected_user_stmt)
-                selected_user = selected_user_result.first()
-                
-                if not selected_user:
-                    return MessagesByTechniqueResponse(
-                        code=status.HTTP_404_NOT_FOUND,
-                        success=False,
-                        message="Selected user not found",
-                        response=None
-                    )
+        # Verify the user, and the selected user if provided, in one lookup
+        users = await get_user_directory(request).get_many(
+            [user_uuid, selected_user_uuid] if selected_user_uuid else [user_uuid]
+        )
+        if user_uuid not in users:
+            return MessagesByTechniqueResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="User not found",
+                response=None
+            )
+        
+        if selected_user_uuid and selected_user_uuid not in users:
+            return MessagesByTechniqueResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="Selected user not found",
+                response=None
+            )
         
         # Get messages from service
         messages = await get_messages_by_technique(
@@ -265,7 +341,8 @@ async def get_messages_by_technique_endpoint(request: Request, body: MessagesByT
             user_uuid,
             body.technique.value,
             selected_user_uuid,
-            body.limit
+            body.limit,
+            body.order_by.value
         )
         
         # Convert to DTO format
@@ -275,7 +352,8 @@ async def get_messages_by_technique_endpoint(request: Request, body: MessagesByT
                 content=msg["content"],
                 timestamp=msg["timestamp"],
                 techniques=msg["techniques"],
-                vulnerabilities=msg["vulnerabilities"]
+                vulnerabilities=msg["vulnerabilities"],
+                confidence=msg["confidence"]
             )
             for msg in messages
         ]
@@ -317,33 +395,25 @@ async def get_messages_by_vulnerability_endpoint(request: Request, body: Message
         user_uuid = UUID(body.user_id)
         selected_user_uuid = UUID(body.selected_user_id) if body.selected_user_id else None
         
-        # Verify user exists
-        async with db_client.session_autocommit() as db:
-            user_stmt = select(User).where(User.user_id == user_uuid)
-            user_result = await db_client.select(user_stmt)
-            user = user_result.first()
-            
-            if not user:
-                return MessagesByVulnerabilityResponse(
-                    code=status.HTTP_404_NOT_FOUND,
-                    success=False,
-                    message="User not found",
-                    response=None
-                )
-            
-            # Verify selected user if provided
-            if selected_user_uuid:
-                selected_user_stmt = select(User).where(User.user_id == selected_user_uuid)
-                selected_user_result = await db_client.select(selected_user_stmt)
-                selected_user = selected_user_result.first()
-                
-                if not selected_user:
-                    return MessagesByVulnerabilityResponse(
-                        code=status.HTTP_404_NOT_FOUND,
-                        success=False,
-                        message="Selected user not found",
-                        response=None
-                    )
+        # Verify the user, and the selected user if provided, in one lookup
+        users = await get_user_directory(request).get_many(
+            [user_uuid, selected_user_uuid] if selected_user_uuid else [user_uuid]
+        )
+        if user_uuid not in users:
+            return MessagesByVulnerabilityResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="User not found",
+                response=None
+            )
+        
+        if selected_user_uuid and selected_user_uuid not in users:
+            return MessagesByVulnerabilityResponse(
+                code=status.HTTP_404_NOT_FOUND,
+                success=False,
+                message="Selected user not found",
+                response=None
+            )
         
         # Get messages from service
         messages = await get_messages_by_vulnerability(
@@ -351,7 +421,8 @@ async def get_messages_by_vulnerability_endpoint(request: Request, body: Message
             user_uuid,
             body.vulnerability.value,
             selected_user_uuid,
-            body.limit
+            body.limit,
+            body.order_by.value
         )
         
         # Convert to DTO format
@@ -361,7 +432,8 @@ async def get_messages_by_vulnerability_endpoint(request: Request, body: Message
                 content=msg["content"],
                 timestamp=msg["timestamp"],
                 techniques=msg["techniques"],
-                vulnerabilities=msg["vulnerabilities"]
+                vulnerabilities=msg["vulnerabilities"],
+                confidence=msg["confidence"]
             )
             for msg in messages
         ]
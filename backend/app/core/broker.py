@@ -0,0 +1,184 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, List, Optional
+from uuid import uuid4
+
+import psycopg
+from loguru import logger
+from psycopg import sql
+
+from app.db.postgres import ConnParams
+
+# Delivers a message to a user's local sockets; True if the user is connected here
+Deliver = Callable[[str, dict], Awaitable[bool]]
+
+
+class Broker(ABC):
+    """Routes messages for users connected to other workers.
+
+    Every worker's `ConnectionManager` owns one broker. `publish` hands a
+    message to the other workers, each of which passes it to the `deliver`
+    callback it registered in `start`.
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Deliver) -> None:
+        ...
+
+    @abstractmethod
+    async def stop(self) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, user_id: str, message: dict) -> Optional[bool]:
+        """
+        Send `message` to `user_id` on other workers; False if it cannot have
+        arrived, None if the broker cannot tell whether it did
+        """
+        ...
+
+
+class InMemoryHub:
+    """Connects the `InMemoryBroker`s of one process"""
+
+    def __init__(self) -> None:
+        self.brokers: List["InMemoryBroker"] = []
+
+
+_default_hub = InMemoryHub()
+
+
+class InMemoryBroker(Broker):
+    """Broker between `ConnectionManager`s of the same process.
+
+    Useful for tests and for running several managers in one process;
+    `publish` returns True only if another worker delivered the message.
+    """
+
+    def __init__(self, hub: Optional[InMemoryHub] = None) -> None:
+        self.hub = hub or _default_hub
+        self.deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self.deliver = deliver
+        if self not in self.hub.brokers:
+            self.hub.brokers.append(self)
+
+    async def stop(self) -> None:
+        if self in self.hub.brokers:
+            self.hub.brokers.remove(self)
+
+    async def publish(self, user_id: str, message: dict) -> bool:
+        others = [broker for broker in self.hub.brokers if broker is not self and broker.deliver]
+        delivered = await asyncio.gather(
+            *(broker.deliver(user_id, message) for broker in others), return_exceptions=True
+        )
+        return any(result is True for result in delivered)
+
+
+class PostgresBroker(Broker):
+    """Broker over Postgres `LISTEN/NOTIFY`, for workers on any number of nodes.
+
+    Every worker listens on `channel` with a dedicated connection and
+    publishes with `pg_notify` on another one. Notifications carry the
+    message itself, so payloads are limited to Postgres' 8000 bytes;
+    larger messages are not routed. Workers cannot see each other's
+    sockets, so `publish` returns None (unknown) once the notification is
+    sent. The listener reconnects after connection errors; messages
+    published meanwhile are lost.
+    """
+
+    MAX_PAYLOAD_BYTES = 7999
+
+    def __init__(self, db_params: ConnParams, channel: str = "ws_messages") -> None:
+        self.db_params = db_params
+        self.channel = channel
+        # Tells this worker's own notifications apart
+        self.worker_id = uuid4().hex
+
+        self.deliver: Optional[Deliver] = None
+        self.publisher: Optional[psycopg.AsyncConnection] = None
+        self.listener: Optional[asyncio.Task] = None
+        # Set while LISTEN is active; `attempted` once the first try finished
+        self.listening = asyncio.Event()
+        self.attempted = asyncio.Event()
+
+    async def _connect(self) -> psycopg.AsyncConnection:
+        return await psycopg.AsyncConnection.connect(
+            host=self.db_params["db_host"],
+            port=self.db_params["db_port"],
+            user=self.db_params["db_user"],
+            password=self.db_params["db_pass"],
+            dbname=self.db_params["db_name"],
+            autocommit=True,
+        )
+
+    async def start(self, deliver: Deliver) -> None:
+        if self.listener is not None:
+            return
+        self.deliver = deliver
+        self.publisher = await self._connect()
+        self.listener = asyncio.create_task(self._listen())
+        await self.attempted.wait()
+        if self.listening.is_set():
+            logger.info(f"Postgres broker listening on '{self.channel}' (worker {self.worker_id})")
+        else:
+            logger.warning(f"Postgres broker not listening on '{self.channel}' yet, retrying (worker {self.worker_id})")
+
+    async def stop(self) -> None:
+        if self.listener is not None:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+            self.listener = None
+        if self.publisher is not None:
+            await self.publisher.close()
+            self.publisher = None
+
+    async def publish(self, user_id: str, message: dict) -> Optional[bool]:
+        payload = json.dumps({"origin": self.worker_id, "user_id": user_id, "message": message}, default=str)
+        if len(payload.encode("utf-8")) > self.MAX_PAYLOAD_BYTES:
+            logger.error(f"Message to user {user_id} is too large to route through the broker")
+            return False
+        try:
+            await self.publisher.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+            # Whether any worker has a socket for the user is not known here
+            return None
+        except Exception as e:
+            logger.error(f"Error publishing message to user {user_id}: {str(e)}")
+            # Replace a broken connection for the next message
+            if self.publisher.closed:
+                try:
+                    self.publisher = await self._connect()
+                except Exception as e:
+                    logger.error(f"Error reconnecting the broker publisher: {str(e)}")
+            return False
+
+    async def _listen(self):
+        while True:
+            try:
+                async with await self._connect() as conn:
+                    await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                    self.listening.set()
+                    self.attempted.set()
+                    async for notify in conn.notifies():
+                        await self._handle(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Postgres broker listener failed, reconnecting: {str(e)}")
+                self.listening.clear()
+                self.attempted.set()
+                await asyncio.sleep(1.0)
+
+    async def _handle(self, payload: str):
+        try:
+            event: Any = json.loads(payload)
+            if event["origin"] == self.worker_id:
+                return
+            await self.deliver(event["user_id"], event["message"])
+        except Exception as e:
+            logger.error(f"Error delivering brokered message: {str(e)}")
@@ -13,13 +13,21 @@ from langchain_perplexity import ChatPerplexity
 
 from app.core.env import Env
 from app.db.postgres import ConnParams, Postgres
+from app.core.broker import Broker, InMemoryBroker, PostgresBroker
 from app.core.websocket import ConnectionManager
+from app.service.classification.artifact import ensure_artifact
 from app.service.classification.classifier import ManipulativeMessageClassifier
+from app.service.classification.inference import InferenceEngine
+from app.service.classification_queue import ClassificationQueue
+from app.service.message_writer import MessageWriter
+from app.service.statistics_cache import StatisticsCache
+from app.service.user_directory import UserDirectory
 from app.agent.graph_builder import build_agent_graph
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 MODEL_PATH = BASE_DIR / "service" / "classification" / "manipulative_classifier.pkl"
+MODEL_ARTIFACT_DIR = BASE_DIR / "service" / "classification" / "manipulative_classifier"
 
 @dataclass
 class Context:
@@ -27,6 +35,13 @@ class Context:
     db_workspace: Postgres
     ws_manager: ConnectionManager
     classifier: ManipulativeMessageClassifier
+    inference_engine: InferenceEngine
+    # Set when messages are delivered first and classified in the background
+    classification_queue: Optional[ClassificationQueue]
+    # Set when new messages are committed in batches
+    message_writer: Optional[MessageWriter]
+    user_directory: UserDirectory
+    statistics_cache: StatisticsCache
     agent_graph: CompiledGraph
     llm: ChatOpenAI
     perplexity: ChatPerplexity
@@ -65,6 +80,18 @@ def get_classifier(request: Request):
     ctx = get_ctx_from_request(request)
     return ctx.classifier
 
+def get_inference_engine(request: Request):
+    ctx = get_ctx_from_request(request)
+    return ctx.inference_engine
+
+def get_user_directory(request: Request):
+    ctx = get_ctx_from_request(request)
+    return ctx.user_directory
+
+def get_statistics_cache(request: Request):
+    ctx = get_ctx_from_request(request)
+    return ctx.statistics_cache
+
 def get_agent_graph(request: Request):
     ctx = get_ctx_from_request(request)
     return ctx.agent_graph
@@ -83,6 +110,21 @@ def get_global_ws_manager():
         return global_context.ws_manager
     return None
 
+def get_global_inference_engine():
+    if global_context:
+        return global_context.inference_engine
+    return None
+
+def get_global_user_directory():
+    if global_context:
+        return global_context.user_directory
+    return None
+
+def get_global_statistics_cache():
+    if global_context:
+        return global_context.statistics_cache
+    return None
+
 def get_global_llm():
     if global_context:
         return global_context.llm
@@ -124,10 +166,40 @@ async def lifespan(
         db_port=int(db_port),
     )
 
-    ws_manager = ConnectionManager()
+    # Routes messages to users connected to other workers
+    broker: Optional[Broker] = None
+    broker_kind = Env.raw_get("WS_BROKER") or "none"
+    if broker_kind == "postgres":
+        broker = PostgresBroker(db_params, channel=Env.raw_get("WS_BROKER_CHANNEL") or "ws_messages")
+    elif broker_kind == "memory":
+        broker = InMemoryBroker()
+
+    # Each socket gets a bounded outbound queue drained by its own writer
+    ws_manager = ConnectionManager(
+        broker,
+        max_queue_size=int(Env.raw_get("WS_OUTBOUND_QUEUE_SIZE") or 256),
+        overflow_policy=Env.raw_get("WS_OVERFLOW_POLICY") or "drop_oldest",
+    )
 
-    classifier = ManipulativeMessageClassifier()
-    classifier.load_model(str(MODEL_PATH))
+    classifier = ManipulativeMessageClassifier(
+        cache_size=int(Env.raw_get("CLASSIFIER_CACHE_SIZE") or 4096)
+    )
+    try:
+        # Memory-mapped arrays are shared between workers and load instantly
+        artifact_dir = ensure_artifact(str(MODEL_PATH), str(MODEL_ARTIFACT_DIR))
+        classifier.load_model(artifact_dir)
+        logger.info(f"Loaded classifier artifact from {artifact_dir}")
+    except Exception as e:
+        logger.warning(f"Falling back to pickled classifier: {str(e)}")
+        classifier.load_model(str(MODEL_PATH))
+
+    # Micro-batch classification requests off the event loop
+    inference_engine = InferenceEngine(
+        classifier,
+        max_batch_size=int(Env.raw_get("CLASSIFIER_MAX_BATCH_SIZE") or 64),
+        max_wait_ms=float(Env.raw_get("CLASSIFIER_MAX_WAIT_MS") or 5.0),
+        max_workers=int(Env.raw_get("CLASSIFIER_WORKERS") or 1),
+    )
     
     # Initialize the ChatOpenAI model with the API key
     llm = ChatOpenAI(
@@ -171,11 +243,53 @@ async def lifespan(
                 )
             )
 
+            # Statistics results, dropped when a message to the receiver is written
+            statistics_cache = StatisticsCache(
+                max_size=int(Env.raw_get("STATISTICS_CACHE_SIZE") or 1024),
+                ttl_seconds=float(Env.raw_get("STATISTICS_CACHE_TTL_SECONDS") or 60),
+            )
+
+            message_writer = None
+            if (Env.raw_get("MESSAGE_WRITE_MODE") or "direct") == "batched":
+                message_writer = MessageWriter(
+                    db_workspace,
+                    max_batch_size=int(Env.raw_get("MESSAGE_WRITE_BATCH_SIZE") or 500),
+                    max_wait_ms=float(Env.raw_get("MESSAGE_WRITE_MAX_WAIT_MS") or 5.0),
+                    max_pending=int(Env.raw_get("MESSAGE_WRITE_MAX_PENDING") or 10000),
+                    durable=(Env.raw_get("MESSAGE_WRITE_DURABLE") or "true").lower() != "false",
+                    statistics_cache=statistics_cache,
+                )
+
+            classification_queue = None
+            if (Env.raw_get("CLASSIFICATION_MODE") or "inline") == "background":
+                classification_queue = ClassificationQueue(
+                    db_workspace,
+                    inference_engine,
+                    ws_manager,
+                    workers=int(Env.raw_get("CLASSIFICATION_QUEUE_WORKERS") or 2),
+                    max_attempts=int(Env.raw_get("CLASSIFICATION_QUEUE_MAX_ATTEMPTS") or 3),
+                    retry_delay_ms=float(Env.raw_get("CLASSIFICATION_QUEUE_RETRY_DELAY_MS") or 500),
+                    message_writer=message_writer,
+                    statistics_cache=statistics_cache,
+                )
+
+            # Names and emails for the chat and statistics paths
+            user_directory = UserDirectory(
+                db_workspace,
+                max_size=int(Env.raw_get("USER_DIRECTORY_SIZE") or 10000),
+                ttl_seconds=float(Env.raw_get("USER_DIRECTORY_TTL_SECONDS") or 300),
+            )
+
             ctx = Context(
                 http_client=http_client,
                 db_workspace=db_workspace,
                 ws_manager=ws_manager,
                 classifier=classifier,
+                inference_engine=inference_engine,
+                classification_queue=classification_queue,
+                message_writer=message_writer,
+                user_directory=user_directory,
+                statistics_cache=statistics_cache,
                 agent_graph=agent_graph,
                 llm=llm,
                 perplexity=perplexity
@@ -184,4 +298,23 @@ async def lifespan(
             # Set global context
             global_context = ctx
 
-            yield {"context": ctx}
\ No newline at end of file
+            await ws_manager.start()
+            await inference_engine.start()
+            if message_writer:
+                await message_writer.start()
+            if classification_queue:
+                await classification_queue.start()
+            try:
+                yield {"context": ctx}
+            finally:
+                if classification_queue:
+                    await classification_queue.stop()
+                if message_writer:
+                    await message_writer.stop()
+                    logger.info(f"Message writer stats: {message_writer.stats()}")
+                await inference_engine.stop()
+                logger.info(f"WebSocket stats: {ws_manager.stats()}")
+                await ws_manager.stop()
+                logger.info(f"Classification cache stats: {classifier.cache.stats()}")
+                logger.info(f"User directory stats: {user_directory.stats()}")
+                logger.info(f"Statistics cache stats: {statistics_cache.stats()}")
\ No newline at end of file
@@ -1,31 +1,276 @@
+import asyncio
+import json
+from collections import deque
 from fastapi import WebSocket
-from typing import Dict
-from uuid import UUID
+from typing import Callable, Deque, Dict, List, Optional
+from uuid import uuid4
 from loguru import logger
 
+from app.core.broker import Broker
+
+OVERFLOW_POLICIES = ("drop_oldest", "disconnect", "coalesce")
+
+# Close code for sockets that cannot keep up (1013: try again later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def serialize(message: dict) -> str:
+    """JSON text frame, as `WebSocket.send_json` would encode it"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def coalesce_key(message: dict) -> Optional[str]:
+    """Events about the same message (e.g. its classification) supersede each other"""
+    if "message_id" not in message:
+        return None
+    return f"{message.get('type')}:{message['message_id']}"
+
+
+class Connection:
+    """One socket with a bounded outbound queue drained by its own writer task.
+
+    Senders only enqueue, so a slow receiver never stalls them. When the
+    queue is full, `overflow_policy` decides: `drop_oldest` discards the
+    oldest queued frame, `disconnect` closes the socket, and `coalesce`
+    replaces a queued frame with the same `coalesce_key` (falling back to
+    dropping the oldest).
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: str,
+        connection_id: str,
+        max_queue_size: int,
+        overflow_policy: str,
+        on_close: Callable[["Connection"], None],
+    ) -> None:
+        self.websocket = websocket
+        self.user_id = user_id
+        self.connection_id = connection_id
+        self.max_queue_size = max(1, max_queue_size)
+        self.overflow_policy = overflow_policy
+        self.on_close = on_close
+
+        # [key, payload] entries; lists so that coalescing can replace payloads in place
+        self.queue: Deque[List] = deque()
+        self.keys: Dict[str, List] = {}
+        self.ready = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.closing: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.too_slow = False
+
+    def start(self):
+        self.writer = asyncio.create_task(self._drain())
+
+    def close(self):
+        if self.writer is not None and not self.writer.done():
+            self.writer.cancel()
+
+    def enqueue(self, payload: str, key: Optional[str] = None) -> bool:
+        """Queue a serialized frame; False if the socket was closed instead"""
+        if self.overflow_policy == "coalesce" and key is not None and key in self.keys:
+            self.keys[key][1] = payload
+            self.coalesced += 1
+            return True
+
+        if len(self.queue) >= self.max_queue_size:
+            if self.overflow_policy == "disconnect":
+                logger.warning(
+                    f"Closing slow connection {self.connection_id} of user {self.user_id} "
+                    f"({len(self.queue)} frames queued)"
+                )
+                self.too_slow = True
+                self.on_close(self)
+                self.closing = asyncio.create_task(self._close_socket())
+                return False
+            self._pop()
+            self.dropped += 1
+
+        entry = [key, payload]
+        self.queue.append(entry)
+        if key is not None:
+            self.keys[key] = entry
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.ready.set()
+        return True
+
+    def _pop(self) -> List:
+        entry = self.queue.popleft()
+        if entry[0] is not None and self.keys.get(entry[0]) is entry:
+            del self.keys[entry[0]]
+        return entry
+
+    async def _drain(self):
+        try:
+            while True:
+                while not self.queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                _, payload = self._pop()
+                await self.websocket.send_text(payload)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Dropping connection {self.connection_id} of user {self.user_id}: {str(e)}")
+            self.on_close(self)
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Too many undelivered messages")
+        except Exception:
+            pass
+
+
 # Simple connection manager for WebSockets
 class ConnectionManager:
-    def __init__(self):
-        # Map of user_id (as string) to their WebSocket connection
-        self.active_connections: Dict[str, WebSocket] = {}
-        
-    async def connect(self, websocket: WebSocket, user_id: str):
-        """Connect a user's websocket"""
+    """Tracks this worker's WebSockets.
+
+    A user may be connected from several tabs or devices at once; each
+    socket gets its own connection ID and its own `Connection` queue and
+    writer, so delivery to one device never waits for another. A message
+    is serialized once however many sockets it goes to. With a `broker`,
+    messages for users connected to other workers (other uvicorn processes
+    or nodes) are routed through it; call `start` and `stop` around the
+    application's lifetime.
+    """
+
+    def __init__(
+        self,
+        broker: Optional[Broker] = None,
+        max_queue_size: int = 256,
+        overflow_policy: str = "drop_oldest",
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow_policy}', expected one of {OVERFLOW_POLICIES}")
+
+        # Map of user_id (as string) to their connections, keyed by connection ID
+        self.active_connections: Dict[str, Dict[str, Connection]] = {}
+        self.broker = broker
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+
+        # Totals of connections that are already gone
+        self.closed_totals = {"sent": 0, "dropped": 0, "coalesced": 0}
+        self.slow_disconnects = 0
+
+    async def start(self):
+        if self.broker:
+            await self.broker.start(self.deliver_local)
+
+    async def stop(self):
+        if self.broker:
+            await self.broker.stop()
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections.values()):
+                self._remove(connection)
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> str:
+        """Connect one of a user's websockets and return its connection ID"""
         await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logger.info(f"User {user_id} connected")
-        
-    def disconnect(self, user_id: str):
-        """Disconnect a user's websocket"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            logger.info(f"User {user_id} disconnected")
-    
+        connection_id = uuid4().hex
+        connection = Connection(
+            websocket, user_id, connection_id, self.max_queue_size, self.overflow_policy, self._remove
+        )
+        connection.start()
+        self.active_connections.setdefault(user_id, {})[connection_id] = connection
+        logger.info(
+            f"User {user_id} connected ({connection_id}, "
+            f"{len(self.active_connections[user_id])} connections)"
+        )
+        return connection_id
+
+    def disconnect(self, user_id: str, connection_id: str):
+        """Disconnect one of a user's websockets, leaving the others open"""
+        connection = self.active_connections.get(user_id, {}).get(connection_id)
+        if connection is not None:
+            self._remove(connection)
+
+    def _remove(self, connection: Connection):
+        connections = self.active_connections.get(connection.user_id)
+        if connections is None or connections.pop(connection.connection_id, None) is None:
+            return
+        if not connections:
+            del self.active_connections[connection.user_id]
+
+        connection.close()
+        self.closed_totals["sent"] += connection.sent
+        self.closed_totals["dropped"] += connection.dropped
+        self.closed_totals["coalesced"] += connection.coalesced
+        if connection.too_slow:
+            self.slow_disconnects += 1
+        logger.info(
+            f"User {connection.user_id} disconnected ({connection.connection_id}, "
+            f"{len(connections)} connections left)"
+        )
+
     async def send_message(self, message: dict, user_id: str):
-        """Send a message to a specific user"""
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_json(message)
-            logger.info(f"Message sent to user {user_id}")
-            return True
-        logger.info(f"Cannot send message to user {user_id}: not connected")
-        return False
\ No newline at end of file
+        """Send a message to a specific user, on this worker or through the broker"""
+        return (await self.send_many(message, [user_id]))[user_id]
+
+    async def send_many(self, message: dict, user_ids: List[str]) -> Dict[str, Optional[bool]]:
+        """
+        Send one message to every socket of several users, serializing it
+        only once; with a broker it is also published to the other workers.
+        Per user: True if delivered, False if not, None if only published
+        through a broker that cannot tell
+        """
+        payload = serialize(message)
+        key = coalesce_key(message)
+        sent = {}
+        for user_id in dict.fromkeys(user_ids):
+            local = self._enqueue(user_id, payload, key)
+            if self.broker:
+                # The user may also have sockets on other workers
+                remote = await self.broker.publish(user_id, message)
+                logger.info(f"Message for user {user_id} published to other workers")
+                sent[user_id] = True if local else remote
+            elif local:
+                sent[user_id] = True
+            else:
+                logger.info(f"Cannot send message to user {user_id}: not connected")
+                sent[user_id] = False
+        return sent
+
+    async def deliver_local(self, user_id: str, message: dict) -> bool:
+        """Queue a message for every socket of a user connected to this worker"""
+        if user_id not in self.active_connections:
+            return False
+        return self._enqueue(user_id, serialize(message), coalesce_key(message))
+
+    def _enqueue(self, user_id: str, payload: str, key: Optional[str]) -> bool:
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            return False
+        total = len(connections)
+        queued = sum(connection.enqueue(payload, key) for connection in list(connections.values()))
+        logger.info(f"Message queued for user {user_id} ({queued}/{total} connections)")
+        return queued > 0
+
+    def send_to_connection(self, user_id: str, connection_id: str, message: dict) -> bool:
+        """Queue a message for one socket, e.g. a receipt for the sending tab"""
+        connection = self.active_connections.get(user_id, {}).get(connection_id)
+        if connection is None:
+            return False
+        return connection.enqueue(serialize(message), coalesce_key(message))
+
+    def stats(self):
+        connections = [c for user in self.active_connections.values() for c in user.values()]
+        depths = [len(c.queue) for c in connections]
+        return {
+            "users": len(self.active_connections),
+            "connections": len(connections),
+            "queued": sum(depths),
+            "deepest_queue": max(depths, default=0),
+            "max_depth_seen": max((c.max_depth for c in connections), default=0),
+            "sent": self.closed_totals["sent"] + sum(c.sent for c in connections),
+            "dropped": self.closed_totals["dropped"] + sum(c.dropped for c in connections),
+            "coalesced": self.closed_totals["coalesced"] + sum(c.coalesced for c in connections),
+            "slow_disconnects": self.slow_disconnects,
+        }
@@ -1,11 +1,14 @@
 from enum import unique, StrEnum
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
+from hashlib import md5
 from typing import Optional, List
 from uuid import UUID
 
 from sqlalchemy.orm import mapped_column, relationship, declarative_base, Mapped
-from sqlalchemy import ForeignKey, DateTime, Boolean, ARRAY, String
-from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from sqlalchemy import DDL, ForeignKey, Date, DateTime, Boolean, ARRAY, FetchedValue, Float, Index, Integer, String, event, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PGUUID
+
+from app.db.triggers import MESSAGES_CREATE_DDL, MESSAGES_DROP_DDL
 
 Base = declarative_base()
 
@@ -33,6 +36,16 @@ class Vulnerabilities(StrEnum):
     OVER_INTELLECTUALIZATION = "Over-intellectualization"
 
 
+def conversation_key(user_id: UUID, other_user_id: UUID) -> UUID:
+    """Order-independent key of the conversation between two users.
+    
+    Same value as the `messages_conversation_key` trigger computes on insert:
+    `md5(least(a, b)::text || ':' || greatest(a, b)::text)::uuid`
+    """
+    low, high = sorted((UUID(str(user_id)), UUID(str(other_user_id))))
+    return UUID(md5(f"{low}:{high}".encode()).hexdigest())
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -47,6 +60,17 @@ class User(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Keyset pagination of one direction of a conversation
+        Index("ix_messages_pair_timestamp", "sender_id", "receiver_id", "timestamp", "message_id"),
+        # Both directions of a conversation, newest first
+        Index(
+            "ix_messages_conversation_timestamp",
+            "conversation_key",
+            text('"timestamp" DESC'),
+            text("message_id DESC"),
+        ),
+    )
 
     # Base Entry
     message_id: Mapped[UUID] = mapped_column(PGUUID, primary_key=True, index=True)
@@ -54,12 +78,80 @@ class Message(Base):
     receiver_id: Mapped[UUID] = mapped_column(PGUUID, ForeignKey("users.user_id"), index=True)
     content: Mapped[str] = mapped_column(String, nullable=False)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(tz=timezone.utc))
+    # See `conversation_key`; set by a database trigger on insert
+    conversation_key: Mapped[Optional[UUID]] = mapped_column(PGUUID, nullable=True, server_default=FetchedValue())
 
     # AI detection
     is_manipulative: Mapped[bool] = mapped_column(Boolean, default=False)
     techniques: Mapped[Optional[List[str]]] = mapped_column(ARRAY(String), nullable=True)
     vulnerabilities: Mapped[Optional[List[str]]] = mapped_column(ARRAY(String), nullable=True)
+    # Probability from the binary head, NULL for unclassified messages
+    confidence: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     
     # Relationships
     sender = relationship("User", back_populates="sent_messages", foreign_keys=[sender_id])
-    receiver = relationship("User", foreign_keys=[receiver_id])
\ No newline at end of file
+    receiver = relationship("User", foreign_keys=[receiver_id])
+
+
+# So that `create_all` builds the same triggers as the migrations
+for statement in MESSAGES_CREATE_DDL:
+    event.listen(Message.__table__, "after_create", DDL(statement))
+for statement in MESSAGES_DROP_DDL:
+    event.listen(Message.__table__, "after_drop", DDL(statement))
+
+
+class PairStats(Base):
+    """Statistics rollup of the messages one sender sent to one receiver.
+
+    Maintained by statement-level triggers on `messages` (see
+    `app.db.triggers`), so every insert, relabel and delete is
+    reflected in the same transaction; `app/utils/rebuild_pair_stats.py`
+    regenerates it from scratch.
+    """
+    __tablename__ = "pair_stats"
+
+    receiver_id: Mapped[UUID] = mapped_column(PGUUID, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    sender_id: Mapped[UUID] = mapped_column(PGUUID, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    total_messages: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    manipulative_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    # Sum and count of the manipulative messages' confidences, for their mean
+    confidence_sum: Mapped[float] = mapped_column(Float, nullable=False, server_default=text("0"))
+    confidence_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    # {label: number of manipulative messages carrying it}
+    techniques: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    vulnerabilities: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+
+
+class PairDailyStats(Base):
+    """`PairStats` split into UTC days, for manipulation trends over time.
+
+    Maintained by the same kind of triggers as `pair_stats`; weekly and
+    monthly buckets are summed from the daily rows when queried.
+    """
+    __tablename__ = "pair_daily_stats"
+
+    receiver_id: Mapped[UUID] = mapped_column(PGUUID, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    sender_id: Mapped[UUID] = mapped_column(PGUUID, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    total_messages: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    manipulative_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    confidence_sum: Mapped[float] = mapped_column(Float, nullable=False, server_default=text("0"))
+    confidence_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    techniques: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    vulnerabilities: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+
+
+class ReceiverDailyStats(Base):
+    """`PairDailyStats` summed over all senders, so a receiver's trend
+    over a year reads at most 366 rows however many contacts they have
+    """
+    __tablename__ = "receiver_daily_stats"
+
+    receiver_id: Mapped[UUID] = mapped_column(PGUUID, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    total_messages: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    manipulative_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    confidence_sum: Mapped[float] = mapped_column(Float, nullable=False, server_default=text("0"))
+    confidence_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    techniques: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    vulnerabilities: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
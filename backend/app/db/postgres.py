@@ -1,6 +1,6 @@
-from collections.abc import Mapping, Sequence
+from collections.abc import AsyncIterable, Callable, Iterable, Mapping, Sequence
 from contextlib import asynccontextmanager
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from typing import Any, TypeVar, Unpack
 from uuid import UUID
 
@@ -17,6 +17,7 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.schema import CreateTable
 from sqlalchemy.sql import text
+from psycopg import postgres, sql
 from typing_extensions import TypedDict
 
 
@@ -176,6 +177,97 @@ class Postgres:
                 stmt = insert(base).values(objects)
                 _ = await sess.execute(stmt)
 
+    async def bulk_copy(
+        self,
+        base: type[DeclarativeBase],
+        rows: AsyncIterable[Sequence[Any] | Mapping[str, Any]] | Iterable[Sequence[Any] | Mapping[str, Any]],
+        columns: Sequence[str] | None = None,
+        chunk_size: int = 50000,
+        progress: Callable[[int], Any] | None = None,
+    ) -> int:
+        """Stream rows into `base`'s table with binary `COPY ... FROM STDIN`.
+
+        Rows are tuples in `columns` order or mappings keyed by column name;
+        `columns` defaults to every column without a server-side default.
+        Python-side defaults are not applied, so every listed column must be
+        given (None for NULL). Aware datetimes bound for `timestamp` columns
+        are stored as naive UTC. Each `chunk_size` rows are committed as one
+        `COPY`, after which `progress(rows_copied_so_far)` is called; a
+        failure only rolls back the current chunk. Returns the rows copied.
+
+        - https://www.psycopg.org/psycopg3/docs/basic/copy.html#binary-copy
+        """
+        table = base.__table__
+        if columns is None:
+            columns = [c.name for c in table.columns if c.server_default is None]
+        columns = list(columns)
+
+        stmt = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+            sql.Identifier(table.name), sql.SQL(", ").join(map(sql.Identifier, columns))
+        )
+
+        async def iterate():
+            if isinstance(rows, AsyncIterable):
+                async for row in rows:
+                    yield row
+            else:
+                for row in rows:
+                    yield row
+
+        copied = 0
+        async with self.engine.connect() as conn:
+            raw_conn = await conn.get_raw_connection()
+            driver_conn = raw_conn.driver_connection
+
+            # Binary COPY needs the exact column types
+            async with driver_conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT attname, atttypid FROM pg_attribute "
+                    "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped",
+                    (table.name,),
+                )
+                type_oids = dict(await cur.fetchall())
+            types = [type_oids[column] for column in columns]
+            # Binary `timestamp` only takes naive datetimes
+            timestamp_oid = postgres.types["timestamp"].oid
+            naive = [i for i, oid in enumerate(types) if oid == timestamp_oid]
+
+            source = iterate()
+            try:
+                while True:
+                    written = 0
+                    async with driver_conn.cursor() as cur:
+                        async with cur.copy(stmt) as copy:
+                            copy.set_types(types)
+                            async for row in source:
+                                if isinstance(row, Mapping):
+                                    row = [row[column] for column in columns]
+                                if naive:
+                                    row = list(row)
+                                    for i in naive:
+                                        if row[i] is not None and row[i].tzinfo is not None:
+                                            row[i] = row[i].astimezone(timezone.utc).replace(tzinfo=None)
+                                await copy.write_row(row)
+                                written += 1
+                                if written >= chunk_size:
+                                    break
+                    await driver_conn.commit()
+
+                    if written == 0:
+                        break
+                    copied += written
+                    if progress is not None:
+                        progress(copied)
+                    if written < chunk_size:
+                        break
+            except BaseException:
+                await driver_conn.rollback()
+                raise
+            finally:
+                await source.aclose()
+
+        return copied
+
     async def select(self, stmt: Select[T]) -> Result[T]:
         async with self.session() as sess:
             result = await sess.execute(stmt)
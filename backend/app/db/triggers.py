@@ -0,0 +1,212 @@
+"""Functions and triggers on `messages` that the schema relies on.
+
+Migrated databases get them from the Alembic revisions; `app.db.models`
+also attaches them to the `messages` table, so that a schema built with
+`Base.metadata.create_all` (e.g. by `app/utils/setup_db.py`) has them too.
+Keep both in step when changing either.
+"""
+from typing import Callable, List
+
+# Must match `app.db.models.conversation_key`
+CONVERSATION_KEY_SQL = """
+    md5(least({row}.sender_id, {row}.receiver_id)::text || ':' || greatest({row}.sender_id, {row}.receiver_id)::text)::uuid
+"""
+
+CONVERSATION_KEY_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION messages_conversation_key() RETURNS trigger AS $$
+    BEGIN
+        NEW.conversation_key := {CONVERSATION_KEY_SQL.format(row="NEW")};
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER messages_conversation_key
+    BEFORE INSERT OR UPDATE OF sender_id, receiver_id ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_conversation_key()
+    """,
+]
+
+# Message columns counted by the statistics rollups
+PAIR_STATS_CHANGE_COLUMNS = "receiver_id, sender_id, is_manipulative, techniques, vulnerabilities, confidence"
+
+
+def apply_changes(table: str, keys: str, changes: str) -> str:
+    """Add the signed message rows selected by `changes` to the `keys` rows of `table`"""
+    return f"""
+        WITH changes AS ({changes}),
+        totals AS (
+            SELECT {keys},
+                   sum(sign) AS total_messages,
+                   coalesce(sum(sign) FILTER (WHERE is_manipulative), 0) AS manipulative_count,
+                   coalesce(sum(sign * confidence) FILTER (WHERE is_manipulative), 0) AS confidence_sum,
+                   coalesce(sum(sign) FILTER (WHERE is_manipulative AND confidence IS NOT NULL), 0) AS confidence_count
+            FROM changes
+            GROUP BY {keys}
+        ),
+        technique_counts AS (
+            SELECT {keys}, jsonb_object_agg(name, count) AS counts
+            FROM (
+                SELECT {keys}, name, sum(sign) AS count
+                FROM changes, unnest(techniques) AS name
+                WHERE is_manipulative
+                GROUP BY {keys}, name
+            ) labels
+            GROUP BY {keys}
+        ),
+        vulnerability_counts AS (
+            SELECT {keys}, jsonb_object_agg(name, count) AS counts
+            FROM (
+                SELECT {keys}, name, sum(sign) AS count
+                FROM changes, unnest(vulnerabilities) AS name
+                WHERE is_manipulative
+                GROUP BY {keys}, name
+            ) labels
+            GROUP BY {keys}
+        )
+        INSERT INTO {table} AS p (
+            {keys}, total_messages, manipulative_count,
+            confidence_sum, confidence_count, techniques, vulnerabilities
+        )
+        SELECT totals.*, coalesce(tc.counts, '{{}}'::jsonb), coalesce(vc.counts, '{{}}'::jsonb)
+        FROM totals
+        LEFT JOIN technique_counts tc USING ({keys})
+        LEFT JOIN vulnerability_counts vc USING ({keys})
+        -- Lock rows in a fixed order so concurrent batches cannot deadlock
+        ORDER BY {keys}
+        ON CONFLICT ({keys}) DO UPDATE SET
+            total_messages = p.total_messages + EXCLUDED.total_messages,
+            manipulative_count = p.manipulative_count + EXCLUDED.manipulative_count,
+            confidence_sum = p.confidence_sum + EXCLUDED.confidence_sum,
+            confidence_count = p.confidence_count + EXCLUDED.confidence_count,
+            techniques = pair_stats_merge_counts(p.techniques, EXCLUDED.techniques),
+            vulnerabilities = pair_stats_merge_counts(p.vulnerabilities, EXCLUDED.vulnerabilities);
+    """
+
+
+def rollup_ddl(name: str, columns: str, apply: Callable[[str], str], truncate: str, count: str) -> List[str]:
+    """
+    Statement-level triggers `<name>_insert/update/delete` on `messages`
+    feeding `apply(changes)` with signed rows of `columns`, plus a
+    `<name>_rebuild()` function regenerating the rollup from scratch
+    """
+    # Transition tables rule out `UPDATE OF <columns>`, so updates that
+    # leave the counted columns alone are filtered out instead
+    updated = f"""
+        SELECT n.*, 1 AS sign FROM (SELECT message_id, {columns} FROM new_rows) n
+        JOIN (SELECT message_id, {columns} FROM old_rows) o USING (message_id)
+        WHERE (n.*) IS DISTINCT FROM (o.*)
+        UNION ALL
+        SELECT o.*, -1 AS sign FROM (SELECT message_id, {columns} FROM old_rows) o
+        JOIN (SELECT message_id, {columns} FROM new_rows) n USING (message_id)
+        WHERE (n.*) IS DISTINCT FROM (o.*)
+    """
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {name}_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                {apply(f"SELECT {columns}, 1 AS sign FROM new_rows")}
+            ELSIF TG_OP = 'DELETE' THEN
+                {apply(f"SELECT {columns}, -1 AS sign FROM old_rows")}
+            ELSE
+                {apply(updated)}
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE TRIGGER {name}_insert
+        AFTER INSERT ON messages REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {name}_apply()
+        """,
+        f"""
+        CREATE TRIGGER {name}_update
+        AFTER UPDATE ON messages REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {name}_apply()
+        """,
+        f"""
+        CREATE TRIGGER {name}_delete
+        AFTER DELETE ON messages REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {name}_apply()
+        """,
+        # Writers to `messages` wait until the rebuild commits
+        f"""
+        CREATE OR REPLACE FUNCTION {name}_rebuild() RETURNS bigint AS $$
+        BEGIN
+            LOCK TABLE messages IN SHARE ROW EXCLUSIVE MODE;
+            TRUNCATE {truncate};
+            {apply(f"SELECT {columns}, 1 AS sign FROM messages")}
+            RETURN (SELECT count(*) FROM {count});
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+    ]
+
+
+# Adds two {label: count} maps, dropping labels that reach zero
+MERGE_COUNTS_DDL = """
+    CREATE OR REPLACE FUNCTION pair_stats_merge_counts(counts jsonb, delta jsonb) RETURNS jsonb AS $$
+        SELECT coalesce(jsonb_object_agg(name, total) FILTER (WHERE total <> 0), '{}'::jsonb)
+        FROM (
+            SELECT name, sum(count::bigint) AS total
+            FROM (
+                SELECT * FROM jsonb_each_text(counts)
+                UNION ALL
+                SELECT * FROM jsonb_each_text(delta)
+            ) AS entries(name, count)
+            GROUP BY name
+        ) totals
+    $$ LANGUAGE sql IMMUTABLE
+"""
+
+PAIR_STATS_DDL = [
+    MERGE_COUNTS_DDL,
+    *rollup_ddl(
+        "pair_stats",
+        PAIR_STATS_CHANGE_COLUMNS,
+        lambda changes: apply_changes("pair_stats", "receiver_id, sender_id", changes),
+        truncate="pair_stats",
+        count="pair_stats",
+    ),
+]
+
+# Timestamps are stored as naive UTC, so days are UTC days
+DAILY_STATS_CHANGE_COLUMNS = (
+    'receiver_id, sender_id, "timestamp"::date AS day, is_manipulative, techniques, vulnerabilities, confidence'
+)
+
+# Daily bucket tables and their keys
+DAILY_STATS_BUCKETS = {
+    "pair_daily_stats": "receiver_id, sender_id, day",
+    "receiver_daily_stats": "receiver_id, day",
+}
+
+DAILY_STATS_DDL = rollup_ddl(
+    "daily_stats",
+    DAILY_STATS_CHANGE_COLUMNS,
+    lambda changes: "\n".join(
+        apply_changes(table, keys, changes) for table, keys in DAILY_STATS_BUCKETS.items()
+    ),
+    truncate="pair_daily_stats, receiver_daily_stats",
+    count="pair_daily_stats",
+)
+
+# Run after `messages` is created, one statement each
+MESSAGES_CREATE_DDL: List[str] = [
+    *CONVERSATION_KEY_DDL,
+    *PAIR_STATS_DDL,
+    *DAILY_STATS_DDL,
+]
+
+# Run after `messages` is dropped (its triggers go with it)
+MESSAGES_DROP_DDL: List[str] = [
+    "DROP FUNCTION IF EXISTS messages_conversation_key()",
+    "DROP FUNCTION IF EXISTS pair_stats_apply()",
+    "DROP FUNCTION IF EXISTS pair_stats_rebuild()",
+    "DROP FUNCTION IF EXISTS daily_stats_apply()",
+    "DROP FUNCTION IF EXISTS daily_stats_rebuild()",
+    "DROP FUNCTION IF EXISTS pair_stats_merge_counts(jsonb, jsonb)",
+]
@@ -20,12 +20,18 @@ class MessageCore(BaseModel):
     is_manipulative: Optional[bool] = False
     techniques: Optional[List[str]] = None
     vulnerabilities: Optional[List[str]] = None
+    confidence: Optional[float] = None
+    cursor: Optional[str] = None
 
 class MessagesResponseCore(BaseModel):
     messages: List[MessageCore]
+    # Pass as `before` to load older messages, or as `after` to load newer ones
+    before_cursor: Optional[str] = None
+    after_cursor: Optional[str] = None
 
 class MessagesResponse(BaseResponse[MessagesResponseCore], frozen=True):
-    response: MessagesResponseCore
+    # None for error responses
+    response: Optional[MessagesResponseCore]
 
 # WebSocket message models
 class WebSocketErrorResponse(BaseModel):
@@ -35,5 +41,6 @@ class WebSocketErrorResponse(BaseModel):
 class WebSocketReceiptResponse(BaseModel):
     type: str = "receipt"
     message_id: str
-    delivered: bool
+    # None when the message went through a broker that cannot tell
+    delivered: Optional[bool]
     timestamp: str
\ No newline at end of file
@@ -1,11 +1,20 @@
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from uuid import UUID
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 from app.db.models import ManipulativeTechniques, Vulnerabilities
 from .base import BaseResponse
 
+class MessageOrder(str, Enum):
+    RECENT = "recent"
+    SEVERITY = "severity"
+
+class TrendGranularity(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
 # Request Models
 class BaseChatRequest(BaseModel):
     user_id: str
@@ -24,11 +33,20 @@ class MessagesByTechniqueRequest(BaseChatRequest):
     selected_user_id: Optional[str] = None
     technique: ManipulativeTechniques
     limit: int = 10
+    order_by: MessageOrder = MessageOrder.RECENT
 
 class MessagesByVulnerabilityRequest(BaseChatRequest):
     selected_user_id: Optional[str] = None
     vulnerability: Vulnerabilities
     limit: int = 10
+    order_by: MessageOrder = MessageOrder.RECENT
+
+class TrendStatisticRequest(BaseChatRequest):
+    selected_user_id: Optional[str] = None
+    granularity: TrendGranularity = TrendGranularity.WEEK
+    # UTC days, inclusive; default to the year up to today
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
 
 # Response Models
 class TechniqueStatistics(BaseModel):
@@ -47,6 +65,7 @@ class StatisticResponseCore(BaseModel):
     total_messages: int
     manipulative_count: int
     manipulative_percentage: float
+    average_confidence: Optional[float] = None
     techniques: List[TechniqueStatistics]
     vulnerabilities: List[VulnerabilityStatistics]
 
@@ -59,6 +78,7 @@ class ManipulativeMessage(BaseModel):
     timestamp: str
     techniques: Optional[List[str]] = None
     vulnerabilities: Optional[List[str]] = None
+    confidence: Optional[float] = None
 
 class MessagesByTechniqueResponseCore(BaseModel):
     technique: str
@@ -68,6 +88,20 @@ class MessagesByVulnerabilityResponseCore(BaseModel):
     vulnerability: str
     messages: List[ManipulativeMessage]
 
+class TrendPeriod(BaseModel):
+    period_start: str
+    total_messages: int
+    manipulative_count: int
+    manipulative_percentage: float
+    average_confidence: Optional[float] = None
+    techniques: List[TechniqueStatistics]
+    vulnerabilities: List[VulnerabilityStatistics]
+
+class TrendStatisticResponseCore(BaseModel):
+    granularity: str
+    selected_user_id: Optional[str] = None
+    periods: List[TrendPeriod]
+
 # Final response models
 class SingleStatisticResponse(BaseResponse[StatisticResponseCore], frozen=True):
     response: StatisticResponseCore
@@ -79,4 +113,7 @@ class MessagesByTechniqueResponse(BaseResponse[MessagesByTechniqueResponseCore],
     response: MessagesByTechniqueResponseCore
 
 class MessagesByVulnerabilityResponse(BaseResponse[MessagesByVulnerabilityResponseCore], frozen=True):
-    response: MessagesByVulnerabilityResponseCore
\ No newline at end of file
+    response: MessagesByVulnerabilityResponseCore
+
+class TrendStatisticResponse(BaseResponse[TrendStatisticResponseCore], frozen=True):
+    response: TrendStatisticResponseCore | None
@@ -1,58 +1,88 @@
+import base64
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from uuid import UUID, uuid4
 from loguru import logger
-from sqlalchemy import select, or_, and_
+from sqlalchemy import ARRAY, Boolean, Float, String, cast, column, insert, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
 
-from app.db.models import Message, User
+from app.db.models import Message, User, conversation_key
 from app.db.postgres import Postgres
 from app.core.context import get_global_context
 
 
+@dataclass(frozen=True, slots=True)
+class MessageRecord:
+    """A message as stored, returned by `save_message`"""
+    message_id: UUID
+    sender_id: UUID
+    receiver_id: UUID
+    content: str
+    timestamp: datetime
+    is_manipulative: bool
+    techniques: Optional[List[str]]
+    vulnerabilities: Optional[List[str]]
+    confidence: Optional[float]
+
+
+# `MessageRecord` fields, in order, for `INSERT ... RETURNING`
+MESSAGE_RECORD_COLUMNS = (
+    Message.message_id,
+    Message.sender_id,
+    Message.receiver_id,
+    Message.content,
+    Message.timestamp,
+    Message.is_manipulative,
+    Message.techniques,
+    Message.vulnerabilities,
+    Message.confidence,
+)
+
+
 async def save_message(
     db_client: Postgres, 
     sender_id: str, 
     receiver_id: str, 
-    content: str
-) -> Optional[Message]:
+    content: str,
+    classify: bool = True
+) -> Optional[MessageRecord]:
     """
     Save a new message to the database
+    
+    The returned record holds the values as stored (`INSERT ... RETURNING`),
+    so its timestamp is the one later served by the history API.
+    
+    With `classify=False` the message is stored unclassified (not manipulative)
+    and is expected to be labelled later by the `ClassificationQueue`.
+    With `MESSAGE_WRITE_MODE=batched` the row goes through the `MessageWriter`;
+    unless `MESSAGE_WRITE_DURABLE=false`, this returns once its batch committed.
     """
     try:
         # Convert string IDs to UUID objects for database operations
         sender_uuid = UUID(sender_id)
         receiver_uuid = UUID(receiver_id)
         
-        # Verify sender exists
-        sender_stmt = select(User).where(User.user_id == sender_uuid)
-        sender_result = await db_client.select(sender_stmt)
-        sender = sender_result.first()
+        # Verify both users exist (served from the user directory cache)
+        users = await get_global_context().user_directory.get_many([sender_uuid, receiver_uuid])
         
-        if not sender:
+        if sender_uuid not in users:
             logger.error(f"Sender with ID {sender_id} not found")
             return None
             
-        # Verify receiver exists
-        receiver_stmt = select(User).where(User.user_id == receiver_uuid)
-        receiver_result = await db_client.select(receiver_stmt)
-        receiver = receiver_result.first()
-        
-        if not receiver:
+        if receiver_uuid not in users:
             logger.error(f"Receiver with ID {receiver_id} not found")
             return None
-        
-        # Extract the User entity if needed
-        if hasattr(sender, 'User'):
-            sender = sender.User
-        if hasattr(receiver, 'User'):
-            receiver = receiver.User
-
-        classifier = get_global_context().classifier
-        classification = classifier.predict(content)
+
+        if classify:
+            inference_engine = get_global_context().inference_engine
+            classification = await inference_engine.predict(content)
+        else:
+            classification = {"is_manipulative": False, "confidence": None, "techniques": [], "vulnerabilities": []}
     
-        # Create message object
+        # Create message row
         message_id = uuid4()
-        new_message = Message(
+        row = dict(
             message_id=message_id,
             sender_id=sender_uuid,
             receiver_id=receiver_uuid,
@@ -60,107 +90,192 @@ async def save_message(
             timestamp=datetime.now(tz=timezone.utc),
             is_manipulative=classification["is_manipulative"],
             techniques=classification["techniques"] if classification["is_manipulative"] else None,
-            vulnerabilities=classification["vulnerabilities"] if classification["is_manipulative"] else None
+            vulnerabilities=classification["vulnerabilities"] if classification["is_manipulative"] else None,
+            confidence=classification["confidence"]
         )
         
-        # Save to database
-        await db_client.insert([new_message])
+        # Save to database, batched with other connections' messages when
+        # a `MessageWriter` is configured
+        message_writer = get_global_context().message_writer
+        if message_writer:
+            # Non-durable writes return before the insert; the column stores
+            # naive UTC, which is what the timestamp will be stored as
+            stored_timestamp = await message_writer.write(row)
+            message = MessageRecord(**{
+                **row,
+                "timestamp": stored_timestamp or row["timestamp"].replace(tzinfo=None),
+            })
+        else:
+            async with db_client.session_autocommit() as db:
+                result = await db.execute(insert(Message).values(**row).returning(*MESSAGE_RECORD_COLUMNS))
+                message = MessageRecord(*result.one())
         
-        # Instead of returning the SQLAlchemy object, create a new one with all the data we need
-        # This ensures we don't try to access attributes after the session is closed
-        result_message = Message(
-            message_id=message_id,
-            sender_id=sender_uuid,
-            receiver_id=receiver_uuid,
-            content=content,
-            timestamp=datetime.now(tz=timezone.utc),
-            is_manipulative=classification["is_manipulative"],
-            techniques=classification["techniques"] if classification["is_manipulative"] else None,
-            vulnerabilities=classification["vulnerabilities"] if classification["is_manipulative"] else None
-        )
+        # Batched writes are also invalidated by the writer once they commit
+        get_global_context().statistics_cache.invalidate(receiver_uuid, sender_uuid)
         
         logger.info(f"Message saved: ID {message_id} from {sender_id} to {receiver_id}")
-        return result_message
+        return message
         
     except Exception as e:
         logger.error(f"Error saving message: {str(e)}")
         return None
 
 
+async def update_message_classifications(
+    db_client: Postgres,
+    rows: Sequence[Tuple[UUID, bool, Optional[List[str]], Optional[List[str]], Optional[float]]]
+) -> int:
+    """
+    Write classification labels for many messages with one
+    `UPDATE messages ... FROM (VALUES ...)` statement
+    
+    Args:
+        db_client: Postgres client
+        rows: (message_id, is_manipulative, techniques, vulnerabilities, confidence) tuples
+    
+    Returns:
+        Number of messages whose labels actually changed
+    """
+    if not rows:
+        return 0
+    
+    new_labels = values(
+        column("message_id", PGUUID),
+        column("is_manipulative", Boolean),
+        column("techniques", ARRAY(String)),
+        column("vulnerabilities", ARRAY(String)),
+        column("confidence", Float),
+        name="new_labels",
+    ).data(list(rows))
+    
+    # A VALUES column holding only NULLs is typed as text, so cast explicitly
+    techniques = cast(new_labels.c.techniques, ARRAY(String))
+    vulnerabilities = cast(new_labels.c.vulnerabilities, ARRAY(String))
+    confidence = cast(new_labels.c.confidence, Float)
+    
+    stmt = (
+        update(Message)
+        .where(Message.message_id == new_labels.c.message_id)
+        .where(
+            # Skip rows that already carry these labels
+            tuple_(Message.is_manipulative, Message.techniques, Message.vulnerabilities, Message.confidence).is_distinct_from(
+                tuple_(new_labels.c.is_manipulative, techniques, vulnerabilities, confidence)
+            )
+        )
+        .values(
+            is_manipulative=new_labels.c.is_manipulative,
+            techniques=techniques,
+            vulnerabilities=vulnerabilities,
+            confidence=confidence,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    
+    async with db_client.session_autocommit() as db:
+        result = await db.execute(stmt)
+    return result.rowcount
+
+
+def encode_cursor(timestamp: datetime, message_id: UUID) -> str:
+    """Opaque pagination cursor for the position of one message"""
+    raw = f"{timestamp.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Inverse of `encode_cursor`, raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, message_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), UUID(message_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
 async def get_conversation(
     db_client: Postgres, 
     user_id: UUID, 
     other_user_id: UUID, 
-    limit: int = 50
+    limit: int = 50,
+    before: Optional[Tuple[datetime, UUID]] = None,
+    after: Optional[Tuple[datetime, UUID]] = None
 ) -> List[Dict[str, Any]]:
     """
     Get messages between two users
     
+    Messages are paged with keyset cursors on `(timestamp, message_id)`:
+    `before` returns the `limit` messages preceding that position, `after`
+    the `limit` messages following it, and neither the latest messages.
+    Both directions of the conversation share one `conversation_key`, so a
+    page is a single range scan of the `(conversation_key, timestamp DESC,
+    message_id DESC)` index and costs the same however deep it is.
+    Sender names are joined in the same query.
+    
     Args:
         db_client: Postgres client
         user_id: UUID of the first user
         other_user_id: UUID of the second user
         limit: Maximum number of messages to return
+        before: Optional (timestamp, message_id) cursor to page backwards from
+        after: Optional (timestamp, message_id) cursor to page forwards from
     
     Returns:
-        List of formatted message dictionaries
+        List of formatted message dictionaries, in chronological order
     """
     try:
-        # Get messages exchanged between these users
-        stmt = select(Message).where(
-            or_(
-                and_(Message.sender_id == user_id, Message.receiver_id == other_user_id),
-                and_(Message.sender_id == other_user_id, Message.receiver_id == user_id)
+        position = tuple_(Message.timestamp, Message.message_id)
+        # Oldest-first when paging forwards, newest-first otherwise
+        forwards = after is not None and before is None
+        if forwards:
+            order = (Message.timestamp.asc(), Message.message_id.asc())
+        else:
+            order = (Message.timestamp.desc(), Message.message_id.desc())
+        
+        stmt = (
+            select(
+                Message.message_id,
+                Message.sender_id,
+                Message.content,
+                Message.timestamp,
+                Message.is_manipulative,
+                Message.techniques,
+                Message.vulnerabilities,
+                Message.confidence,
+                User.user_name.label("sender_name"),
             )
-        ).order_by(Message.timestamp.desc()).limit(limit)
+            .outerjoin(User, User.user_id == Message.sender_id)
+            .where(Message.conversation_key == conversation_key(user_id, other_user_id))
+            .order_by(*order)
+            .limit(limit)
+        )
+        if before is not None:
+            stmt = stmt.where(position < tuple_(*before))
+        if after is not None:
+            stmt = stmt.where(position > tuple_(*after))
         
         result = await db_client.select(stmt)
-        messages = result.all()
+        rows = result.all()
+        if not forwards:
+            rows.reverse()
         
-        # Format messages for response
+        # Format messages for response, in chronological order
+        user_id_str = str(user_id)
         formatted_messages = []
-        for message_row in messages:
-            # Handle different SQLAlchemy result formats
-            message = message_row.Message if hasattr(message_row, 'Message') else message_row
-            
-            try:
-                # Get sender info
-                sender_stmt = select(User).where(User.user_id == message.sender_id)
-                sender_result = await db_client.select(sender_stmt)
-                sender_row = sender_result.first()
-                
-                # Access user data properly
-                sender = sender_row.User if hasattr(sender_row, 'User') else sender_row
-                
-                formatted_messages.append({
-                    "id": str(message.message_id),  # Convert UUID to string
-                    "sender_id": str(message.sender_id),  # Convert UUID to string
-                    "sender_name": sender.user_name if sender else "Unknown",
-                    "content": message.content,
-                    "timestamp": message.timestamp.isoformat(),
-                    "is_sent_by_me": str(message.sender_id) == str(user_id),  # Compare strings
-                    "is_manipulative": bool(message.is_manipulative) if hasattr(message, "is_manipulative") else False,
-                    "techniques": list(message.techniques) if hasattr(message, "techniques") and message.techniques else None,
-                    "vulnerabilities": list(message.vulnerabilities) if hasattr(message, "vulnerabilities") and message.vulnerabilities else None
-                })
-            except AttributeError as e:
-                # Handle case where there's an issue accessing attributes
-                logger.error(f"AttributeError processing message: {str(e)}")
-                # Try to create a minimal valid message entry
-                formatted_messages.append({
-                    "id": str(message.message_id) if hasattr(message, "message_id") else "unknown",
-                    "sender_id": str(message.sender_id) if hasattr(message, "sender_id") else "unknown",
-                    "sender_name": "Unknown",
-                    "content": message.content if hasattr(message, "content") else "",
-                    "timestamp": message.timestamp.isoformat() if hasattr(message, "timestamp") else datetime.now(tz=timezone.utc).isoformat(),
-                    "is_sent_by_me": False,
-                    "is_manipulative": False,
-                    "techniques": None,
-                    "vulnerabilities": None
-                })
-        
-        # Return in chronological order
-        formatted_messages.reverse()
+        for row in rows:
+            sender_id = str(row.sender_id)
+            formatted_messages.append({
+                "id": str(row.message_id),  # Convert UUID to string
+                "sender_id": sender_id,  # Convert UUID to string
+                "sender_name": row.sender_name or "Unknown",
+                "content": row.content,
+                "timestamp": row.timestamp.isoformat(),
+                "is_sent_by_me": sender_id == user_id_str,  # Compare strings
+                "is_manipulative": bool(row.is_manipulative),
+                "techniques": list(row.techniques) if row.techniques else None,
+                "vulnerabilities": list(row.vulnerabilities) if row.vulnerabilities else None,
+                "confidence": row.confidence,
+                "cursor": encode_cursor(row.timestamp, row.message_id)
+            })
         
         logger.info(f"Retrieved {len(formatted_messages)} messages between users {user_id} and {other_user_id}")
         return formatted_messages
@@ -171,16 +286,14 @@ async def get_conversation(
 
 
 async def format_message_for_response(
-    db_client: Postgres, 
-    message: Message, 
+    message: MessageRecord, 
     user_id: str
 ) -> Dict[str, Any]:
     """
     Format a message for the WebSocket response
     
     Args:
-        db_client: Postgres client
-        message: The Message object to format
+        message: The saved message record to format
         user_id: The user ID (string) who will receive this formatted message
     
     Returns:
@@ -191,26 +304,21 @@ async def format_message_for_response(
         user_uuid = UUID(user_id)
         
         # Get sender info
-        sender_stmt = select(User).where(User.user_id == message.sender_id)
-        sender_result = await db_client.select(sender_stmt)
-        sender = sender_result.first()
-        
-        # Extract User from Row if needed
-        if hasattr(sender, 'User'):
-            sender = sender.User
+        sender = await get_global_context().user_directory.get(message.sender_id)
             
         # Convert all UUIDs to strings for JSON serialization
         return {
             "type": "message",
             "id": str(message.message_id),  # Convert UUID to string
             "sender_id": str(message.sender_id),  # Convert UUID to string
-            "sender_name": sender.user_name if sender else "Unknown",
+            "sender_name": sender.name if sender else "Unknown",
             "content": message.content,
             "timestamp": message.timestamp.isoformat(),
             "is_sent_by_me": str(message.sender_id) == str(user_uuid),  # Compare strings
-            "is_manipulative": bool(message.is_manipulative) if hasattr(message, "is_manipulative") else False,
-            "techniques": list(message.techniques) if hasattr(message, "techniques") and message.techniques else None,
-            "vulnerabilities": list(message.vulnerabilities) if hasattr(message, "vulnerabilities") and message.vulnerabilities else None
+            "is_manipulative": bool(message.is_manipulative),
+            "techniques": list(message.techniques) if message.techniques else None,
+            "vulnerabilities": list(message.vulnerabilities) if message.vulnerabilities else None,
+            "confidence": message.confidence
         }
     except Exception as e:
         logger.error(f"Error formatting message: {str(e)}")
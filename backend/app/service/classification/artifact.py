@@ -0,0 +1,308 @@
+"""Compact, memory-mappable model artifact.
+
+A shared-vectorizer model is exported to a directory of plain `.npy` files
+plus a JSON manifest:
+
+- `vocabulary.npy`: sorted fixed-width unicode array of the TF-IDF terms
+  (omitted for the hashing feature extractor, which has no vocabulary)
+- `idf.npy`: idf weight of each term, in vocabulary (or hash bucket) order
+- `coef.npy` / `intercept.npy`: the fused linear heads (see `scorer.py`)
+- `manifest.json`: vectorizer settings, labels, per-label thresholds and the
+  source model hash
+
+The arrays are opened with `np.load(mmap_mode="r")`, so every worker
+process shares the same page-cache pages instead of unpickling a private
+copy of the pipelines, and startup does not depend on model size.
+
+Export a trained pickle with:
+```
+python -m app.service.classification.artifact manipulative_classifier.pkl manipulative_classifier
+```
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import normalize
+
+try:
+    from app.service.classification.scorer import FusedLinearScorer
+except ImportError:  # run as a script from this directory
+    from scorer import FusedLinearScorer
+
+ARTIFACT_FORMAT = "mmap-tfidf-v1"
+HASHING_ARTIFACT_FORMAT = "mmap-hashing-v1"
+MANIFEST_FILE = "manifest.json"
+
+# TfidfVectorizer settings needed to rebuild the analyzer and weighting
+ANALYZER_PARAMS = (
+    "analyzer", "lowercase", "ngram_range", "stop_words",
+    "strip_accents", "token_pattern",
+)
+WEIGHTING_PARAMS = ("binary", "norm", "use_idf", "sublinear_tf")
+HASHING_PARAMS = ANALYZER_PARAMS + ("n_features", "alternate_sign", "binary", "norm")
+
+
+class MappedTfidfVectorizer:
+    """`TfidfVectorizer.transform` over a sorted, memory-mapped vocabulary.
+
+    Terms are looked up with one `np.searchsorted` call per batch, and the
+    resulting rows are weighted and normalized the same way as scikit-learn,
+    so features (and predictions) are identical to the source vectorizer.
+    """
+
+    def __init__(self, vocabulary, idf, params):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.params = params
+        self.analyzer = TfidfVectorizer(
+            **{key: params[key] for key in ANALYZER_PARAMS}
+        ).build_analyzer()
+
+    @property
+    def n_features(self):
+        return len(self.vocabulary)
+
+    def transform(self, messages):
+        if self.n_features == 0:
+            # Nothing to look up, and `searchsorted` positions would be -1
+            return csr_matrix((len(messages), 0), dtype=np.float64)
+
+        indptr = [0]
+        terms = []
+        for message in messages:
+            terms.extend(self.analyzer(message))
+            indptr.append(len(terms))
+
+        doc_ids = np.repeat(np.arange(len(messages)), np.diff(indptr))
+        if terms:
+            terms = np.array(terms)
+            positions = np.searchsorted(self.vocabulary, terms)
+            positions = np.minimum(positions, self.n_features - 1)
+            known = self.vocabulary[positions] == terms
+            doc_ids, positions = doc_ids[known], positions[known]
+        else:
+            positions = np.zeros(0, dtype=np.intp)
+
+        # Duplicate (doc, term) pairs are summed into term counts
+        X = csr_matrix(
+            (np.ones(len(positions)), (doc_ids, positions)),
+            shape=(len(messages), self.n_features),
+            dtype=np.float64,
+        )
+        X.sort_indices()
+
+        if self.params["binary"]:
+            X.data.fill(1)
+        if self.params["sublinear_tf"]:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.params["use_idf"]:
+            X.data *= self.idf[X.indices]
+        if self.params["norm"]:
+            X = normalize(X, norm=self.params["norm"], copy=False)
+
+        return X
+
+
+class MappedHashingVectorizer:
+    """Hashing + TF-IDF transform with memory-mapped idf weights."""
+
+    def __init__(self, idf, hashing_params, weighting_params):
+        self.idf = idf
+        self.hashing = HashingVectorizer(**hashing_params)
+        self.params = weighting_params
+
+    def transform(self, messages):
+        X = self.hashing.transform(messages)
+
+        if self.params["sublinear_tf"]:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.params["use_idf"]:
+            X.data *= self.idf[X.indices]
+        if self.params["norm"]:
+            X = normalize(X, norm=self.params["norm"], copy=False)
+
+        return X
+
+
+def _json_params(params, keys):
+    return {
+        key: list(params[key]) if isinstance(params[key], tuple) else params[key]
+        for key in keys
+    }
+
+
+def _hashing_steps(vectorizer):
+    if isinstance(vectorizer, Pipeline) and "hashing" in vectorizer.named_steps:
+        return vectorizer.named_steps["hashing"], vectorizer.named_steps["tfidf"]
+    return None
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def artifact_sha256(directory):
+    """Identify the model in an artifact directory by its contents.
+
+    Artifacts exported from a pickle carry the pickle's sha256; others
+    (e.g. from `save_artifact`) are hashed file by file.
+    """
+    source_sha256 = read_manifest(directory).get("source_sha256")
+    if source_sha256:
+        return source_sha256
+
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        digest.update(name.encode("utf-8"))
+        digest.update(file_sha256(os.path.join(directory, name)).encode("ascii"))
+    return digest.hexdigest()
+
+
+def export_artifact(classifier, directory, source_sha256=None):
+    """Write the fused model of a shared-vectorizer classifier to `directory`."""
+    scorer = classifier.scorer
+    if scorer is None:
+        raise ValueError("Artifact export requires a shared-vectorizer model.")
+
+    vectorizer = scorer.vectorizer
+    hashing_steps = _hashing_steps(vectorizer)
+    if hashing_steps is None and not isinstance(vectorizer, TfidfVectorizer):
+        raise ValueError("Artifact export requires a TF-IDF or hashing vectorizer.")
+
+    params = (hashing_steps[0] if hashing_steps else vectorizer).get_params()
+    if params["preprocessor"] is not None or params["tokenizer"] is not None:
+        raise ValueError("Custom preprocessors/tokenizers cannot be exported.")
+
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "created_at": datetime.now(tz=timezone.utc).isoformat(),
+        "source_sha256": source_sha256,
+        "technique_labels": scorer.technique_labels,
+        "vulnerability_labels": scorer.vulnerability_labels,
+        "thresholds": scorer.thresholds,
+    }
+    os.makedirs(directory, exist_ok=True)
+
+    if hashing_steps:
+        # Stateless features: only the idf weights and heads are stored
+        tfidf = hashing_steps[1]
+        manifest["format"] = HASHING_ARTIFACT_FORMAT
+        manifest["hashing"] = _json_params(params, HASHING_PARAMS)
+        manifest["vectorizer"] = _json_params(tfidf.get_params(), ("norm", "use_idf", "sublinear_tf"))
+        np.save(os.path.join(directory, "idf.npy"), tfidf.idf_)
+        np.save(os.path.join(directory, "coef.npy"), scorer.coef)
+    else:
+        # Reorder features so that the vocabulary array is sorted
+        terms = sorted(vectorizer.vocabulary_)
+        order = np.array([vectorizer.vocabulary_[term] for term in terms], dtype=np.intp)
+
+        manifest["vectorizer"] = _json_params(params, ANALYZER_PARAMS + WEIGHTING_PARAMS)
+        np.save(os.path.join(directory, "vocabulary.npy"), np.array(terms))
+        np.save(os.path.join(directory, "idf.npy"), vectorizer.idf_[order])
+        np.save(os.path.join(directory, "coef.npy"), np.ascontiguousarray(scorer.coef[order]))
+
+    np.save(os.path.join(directory, "intercept.npy"), scorer.intercept)
+
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def load_artifact(directory, mmap=True):
+    """Open an exported artifact as a `FusedLinearScorer`."""
+    manifest = read_manifest(directory)
+    if manifest.get("format") not in (ARTIFACT_FORMAT, HASHING_ARTIFACT_FORMAT):
+        raise ValueError(f"Unsupported model artifact format: {manifest.get('format')}")
+
+    mmap_mode = "r" if mmap else None
+    load = lambda name: np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+    params = dict(manifest["vectorizer"])
+    if manifest["format"] == HASHING_ARTIFACT_FORMAT:
+        hashing_params = dict(manifest["hashing"])
+        hashing_params["ngram_range"] = tuple(hashing_params["ngram_range"])
+        vectorizer = MappedHashingVectorizer(load("idf.npy"), hashing_params, params)
+    else:
+        params["ngram_range"] = tuple(params["ngram_range"])
+        vectorizer = MappedTfidfVectorizer(load("vocabulary.npy"), load("idf.npy"), params)
+
+    scorer = FusedLinearScorer(
+        vectorizer,
+        load("coef.npy"),
+        load("intercept.npy"),
+        manifest["technique_labels"],
+        manifest["vulnerability_labels"],
+        manifest.get("thresholds"),
+    )
+    return scorer, manifest
+
+
+def ensure_artifact(model_path, directory):
+    """Export `model_path` to `directory` unless an up-to-date artifact exists.
+
+    Several workers may start at once, so the export is written to a
+    private temporary directory and moved into place atomically.
+    """
+    source_sha256 = file_sha256(model_path)
+
+    if os.path.isdir(directory):
+        try:
+            if read_manifest(directory).get("source_sha256") == source_sha256:
+                return directory
+        except (OSError, ValueError):
+            pass
+        stale = f"{directory}.stale-{os.getpid()}"
+        try:
+            os.rename(directory, stale)
+            shutil.rmtree(stale, ignore_errors=True)
+        except OSError:
+            pass
+
+    try:
+        from app.service.classification.classifier import ManipulativeMessageClassifier
+    except ImportError:  # run as a script from this directory
+        from classifier import ManipulativeMessageClassifier
+
+    classifier = ManipulativeMessageClassifier(cache_size=0)
+    classifier.load_model(model_path)
+
+    tmp_directory = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    export_artifact(classifier, tmp_directory, source_sha256=source_sha256)
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # Another worker finished first
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    return directory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a trained classifier to a memory-mappable artifact")
+    parser.add_argument("model_path", help="Trained model pickle")
+    parser.add_argument("directory", help="Output artifact directory")
+    args = parser.parse_args()
+
+    ensure_artifact(args.model_path, args.directory)
+    print(f"Model artifact written to '{args.directory}'")
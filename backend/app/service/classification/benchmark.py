@@ -0,0 +1,132 @@
+"""Compare accuracy, memory and latency of the classifier variants.
+
+Every variant is trained on the same split of the dataset, saved, and
+reloaded under `tracemalloc` to measure the memory retained by the loaded
+model. Latency is measured on dialogues from the dataset:
+```
+python -m app.service.classification.benchmark data/mentalmanip_detailed_expanded.csv
+```
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+try:
+    from app.service.classification.classifier import ManipulativeMessageClassifier
+except ImportError:  # run as a script from this directory
+    from classifier import ManipulativeMessageClassifier
+
+
+def check_structure(name, options, classifier):
+    """Fail if the loaded model is not the variant that was meant to be measured"""
+    shared = options.get("shared_vectorizer", True)
+    if shared:
+        expected = options.get("feature_extractor", "tfidf")
+        if classifier.vectorizer is None or classifier.scorer is None:
+            raise RuntimeError(f"Variant '{name}' was loaded without its shared vectorizer")
+        if classifier.feature_extractor != expected:
+            raise RuntimeError(
+                f"Variant '{name}' was loaded with the {classifier.feature_extractor} extractor, expected {expected}"
+            )
+    elif classifier.vectorizer is not None or classifier.scorer is not None:
+        raise RuntimeError(f"Variant '{name}' was loaded with a shared vectorizer, expected separate pipelines")
+
+
+def benchmark_variant(name, options, dataset_path, messages):
+    classifier = ManipulativeMessageClassifier(cache_size=0, **options)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics = classifier.train(dataset_path)
+    train_seconds = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "model.pkl")
+        classifier.save_model(model_path)
+        model_bytes = os.path.getsize(model_path)
+
+        tracemalloc.start()
+        # Same options as training: the defaults would fuse a "pipelines" model on load
+        loaded = ManipulativeMessageClassifier(cache_size=0, **options)
+        loaded.load_model(model_path)
+        resident_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    check_structure(name, options, loaded)
+
+    # Single-message latency, as seen by one chat message
+    latencies = []
+    for message in messages:
+        started = time.perf_counter()
+        loaded.predict(message)
+        latencies.append(time.perf_counter() - started)
+
+    # Whole-batch throughput, as seen by the inference engine or bulk jobs
+    started = time.perf_counter()
+    loaded.predict_batch(messages)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        "variant": name,
+        "binary_accuracy": float(metrics["binary_accuracy"]),
+        "technique_accuracy": float(metrics["technique_accuracy"]),
+        "train_seconds": train_seconds,
+        "model_file_mb": model_bytes / 2**20,
+        "resident_mb": resident_bytes / 2**20,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "batch_msgs_per_sec": len(messages) / batch_seconds if batch_seconds > 0 else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark classifier feature extractors")
+    parser.add_argument("dataset_path", help="Training CSV (same format as classifier.train)")
+    parser.add_argument("--messages", type=int, default=1000, help="Dialogues used for latency")
+    parser.add_argument(
+        "--hashing-features", type=int, nargs="+", default=[2**14, 2**16, 2**18],
+        help="Hashing vectorizer sizes to compare"
+    )
+    parser.add_argument("--output", help="Optional JSON report path")
+    args = parser.parse_args()
+
+    dialogues = pd.read_csv(args.dataset_path)["dialogue"].astype(str)
+    messages = dialogues.sample(min(args.messages, len(dialogues)), random_state=42).tolist()
+
+    variants = [
+        ("pipelines", {"shared_vectorizer": False}),
+        ("tfidf", {"feature_extractor": "tfidf"}),
+    ] + [
+        (f"hashing-2^{int(np.log2(n))}", {"feature_extractor": "hashing", "hashing_features": n})
+        for n in args.hashing_features
+    ]
+
+    results = []
+    for name, options in variants:
+        print(f"Benchmarking {name}...")
+        results.append(benchmark_variant(name, options, args.dataset_path, messages))
+
+    columns = list(results[0])
+    print()
+    print(" | ".join(f"{column:>18}" for column in columns))
+    for result in results:
+        print(" | ".join(
+            f"{value:>18.4f}" if isinstance(value, float) else f"{value:>18}"
+            for value in result.values()
+        ))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nReport written to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
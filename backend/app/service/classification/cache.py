@@ -0,0 +1,88 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message):
+    """Case- and whitespace-insensitive form of a message.
+
+    The TF-IDF analyzer lowercases and ignores whitespace, so messages with
+    the same normalized form always get the same classification.
+    """
+    return _WHITESPACE.sub(" ", message).strip().lower()
+
+
+def message_key(message):
+    return hashlib.blake2b(normalize_message(message).encode("utf-8"), digest_size=16).digest()
+
+
+class ClassificationCache:
+    """Bounded LRU cache of classification results keyed by content hash.
+
+    Entries belong to one model (and set of thresholds); binding a different
+    `model_id` drops them.
+    Safe to share between the inference worker threads.
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max(0, int(max_size))
+        self.model_id = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bind(self, model_id):
+        """Attach the cache to a model, invalidating entries from any other model."""
+        with self._lock:
+            if model_id != self.model_id:
+                self._entries.clear()
+                self.model_id = model_id
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result, model_id):
+        """Store `result` computed while bound to `model_id`, unless the cache was rebound since."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if model_id != self.model_id:
+                return
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups > 0 else 0,
+        }
@@ -1,19 +1,80 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.pipeline import Pipeline
 from sklearn.multioutput import MultiOutputClassifier
 from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import classification_report, accuracy_score
+from sklearn.metrics import classification_report, accuracy_score, f1_score
 import joblib
+from joblib import Parallel, delayed
+
+import os
+import time
+import uuid
+
+try:
+    from app.service.classification.artifact import export_artifact, load_artifact
+    from app.service.classification.cache import ClassificationCache, message_key
+    from app.service.classification.scorer import FusedLinearScorer, complete_thresholds
+except ImportError:  # run as a script from this directory
+    from artifact import export_artifact, load_artifact
+    from cache import ClassificationCache, message_key
+    from scorer import FusedLinearScorer, complete_thresholds
+
+# Saved model formats: 1 = three independent pipelines, 2 = one shared vectorizer
+LEGACY_FORMAT_VERSION = 1
+SHARED_FORMAT_VERSION = 2
+
+# Feature extractors for the shared vectorizer
+FEATURE_EXTRACTORS = ("tfidf", "hashing")
+
+# Hyperparameters tried by `search_hyperparameters` when no grid is given
+DEFAULT_PARAM_GRID = {
+    "max_features": [5000, 20000],
+    "ngram_range": [(1, 1), (1, 2)],
+    "C": [0.5, 1.0, 4.0],
+}
 
 class ManipulativeMessageClassifier:
-    def __init__(self):
+    def __init__(
+        self,
+        shared_vectorizer=True,
+        cache_size=4096,
+        feature_extractor="tfidf",
+        hashing_features=2**16,
+        max_features=5000,
+        ngram_range=(1, 2),
+        C=1.0,
+    ):
+        if feature_extractor not in FEATURE_EXTRACTORS:
+            raise ValueError(f"Unknown feature extractor '{feature_extractor}', expected one of {FEATURE_EXTRACTORS}")
+        if feature_extractor == "hashing" and not shared_vectorizer:
+            raise ValueError("The hashing feature extractor requires shared_vectorizer=True.")
+        
+        # Fit one vectorizer and feed its output to all three heads
+        self.shared_vectorizer = shared_vectorizer
+        # "hashing" trades the stored vocabulary for a stateless hashing trick
+        self.feature_extractor = feature_extractor
+        self.hashing_features = hashing_features
+        # Training hyperparameters, tuned by `search_hyperparameters`
+        self.max_features = max_features
+        self.ngram_range = tuple(ngram_range)
+        self.C = C
+        self.vectorizer = None
         self.binary_classifier = None
         self.technique_classifier = None
+        self.vulnerability_classifier = None
         self.technique_labels = None
         self.vulnerability_labels = None
+        # Per-label probability thresholds, saved with the model
+        self.thresholds = None
+        # All heads stacked into one matrix, exported after train/load
+        self.scorer = None
+        # Results of repeated messages, invalidated whenever the model changes
+        self.model_id = None
+        self.thresholds_version = 0
+        self.cache = ClassificationCache(cache_size)
         
     def load_data(self, file_path):
         """Load and preprocess the dataset."""
@@ -24,170 +85,445 @@ class ManipulativeMessageClassifier:
         X = df['dialogue'].values
         
         # Create binary manipulation labels (majority vote)
-        y_binary = []
-        for i in range(len(X)):
-            votes = [
-                df.loc[i, 'manipulative_1'],
-                df.loc[i, 'manipulative_2'],
-                df.loc[i, 'manipulative_3']
-            ]
-            y_binary.append(1 if sum(votes) >= 2 else 0)
-        
-        # Extract techniques and create multi-label encoding
-        all_techniques = set()
-        techniques_per_dialogue = []
-        
-        for i in range(len(X)):
-            dialogue_techniques = set()
-            
-            # Combine techniques from all annotators
-            for annotator in [1, 2, 3]:
-                col = f'technique_{annotator}'
-                if col in df.columns and pd.notna(df.loc[i, col]) and df.loc[i, f'manipulative_{annotator}'] == 1:
-                    techniques = str(df.loc[i, col]).split(',')
-                    techniques = [t.strip() for t in techniques if t.strip()]
-                    dialogue_techniques.update(techniques)
-                    all_techniques.update(techniques)
-            
-            techniques_per_dialogue.append(list(dialogue_techniques))
-        
-        # Sort techniques to ensure consistent order
-        self.technique_labels = sorted(list(all_techniques))
-        
-        # Create multi-label encoding for techniques
-        y_techniques = np.zeros((len(X), len(self.technique_labels)))
-        for i, techniques in enumerate(techniques_per_dialogue):
-            for technique in techniques:
-                if technique in self.technique_labels:
-                    y_techniques[i, self.technique_labels.index(technique)] = 1
+        votes = df[['manipulative_1', 'manipulative_2', 'manipulative_3']].sum(axis=1, skipna=False)
+        y_binary = (votes >= 2).astype(int).to_numpy()
         
-        # Extract vulnerabilities and create multi-label encoding
-        all_vulnerabilities = set()
-        vulnerabilities_per_dialogue = []
-        
-        for i in range(len(X)):
-            dialogue_vulnerabilities = set()
-            
-            # Combine vulnerabilities from all annotators
-            for annotator in [1, 2, 3]:
-                col = f'vulnerability_{annotator}'
-                if col in df.columns and pd.notna(df.loc[i, col]) and df.loc[i, f'manipulative_{annotator}'] == 1:
-                    vulnerabilities = str(df.loc[i, col]).split(',')
-                    vulnerabilities = [v.strip() for v in vulnerabilities if v.strip()]
-                    dialogue_vulnerabilities.update(vulnerabilities)
-                    all_vulnerabilities.update(vulnerabilities)
-            
-            vulnerabilities_per_dialogue.append(list(dialogue_vulnerabilities))
-        
-        # Sort vulnerabilities to ensure consistent order
-        self.vulnerability_labels = sorted(list(all_vulnerabilities))
-        
-        # Create multi-label encoding for vulnerabilities
-        y_vulnerabilities = np.zeros((len(X), len(self.vulnerability_labels)))
-        for i, vulnerabilities in enumerate(vulnerabilities_per_dialogue):
-            for vulnerability in vulnerabilities:
-                if vulnerability in self.vulnerability_labels:
-                    y_vulnerabilities[i, self.vulnerability_labels.index(vulnerability)] = 1
+        # Multi-label encodings, combining every annotator who saw manipulation
+        self.technique_labels, y_techniques = _multilabel_matrix(df, 'technique')
+        self.vulnerability_labels, y_vulnerabilities = _multilabel_matrix(df, 'vulnerability')
         
         return X, y_binary, y_techniques, y_vulnerabilities
     
-    def train(self, file_path):
-        """Train the classifiers."""
+    def train(self, file_path, n_jobs=None, param_grid=None, cv=3):
+        """Train the classifiers.
+        
+        The three heads are fit in parallel on `n_jobs` joblib workers. With a
+        `param_grid` (see `DEFAULT_PARAM_GRID`), `max_features`, `ngram_range`
+        and `C` are first chosen by cross-validating the binary head on the
+        training split.
+        """
+        timings = {}
+        started = time.perf_counter()
+        
         X, y_binary, y_techniques, y_vulnerabilities = self.load_data(file_path)
+        timings['load_data'] = time.perf_counter() - started
         
         # Split the data
         X_train, X_test, y_binary_train, y_binary_test, y_techniques_train, y_techniques_test, y_vulnerabilities_train, y_vulnerabilities_test = train_test_split(
             X, y_binary, y_techniques, y_vulnerabilities, test_size=0.2, random_state=42
         )
         
-        # Create and train the binary classifier
-        self.binary_classifier = Pipeline([
-            ('tfidf', TfidfVectorizer(max_features=5000, ngram_range=(1, 2))),
-            ('clf', LogisticRegression(max_iter=1000, class_weight='balanced'))
-        ])
-        self.binary_classifier.fit(X_train, y_binary_train)
+        search = None
+        if param_grid:
+            step = time.perf_counter()
+            search = self.search_hyperparameters(X_train, y_binary_train, param_grid, cv=cv, n_jobs=n_jobs)
+            timings['search'] = time.perf_counter() - step
+            print(f"Best parameters: {search['best_params']} (cv f1_macro {search['best_score']:.4f})")
+        
+        # Vectorize once when the heads share a vectorizer
+        step = time.perf_counter()
+        if self.shared_vectorizer:
+            self.vectorizer = self._make_vectorizer()
+            X_train = self.vectorizer.fit_transform(X_train)
+            X_test = self.vectorizer.transform(X_test)
+        else:
+            self.vectorizer = None
+        timings['vectorize'] = time.perf_counter() - step
+        
+        # Create and train the binary, technique and vulnerability heads
+        step = time.perf_counter()
+        heads = [
+            (self._make_head(self._make_estimator()), y_binary_train),
+            (self._make_head(MultiOutputClassifier(self._make_estimator())), y_techniques_train),
+            (self._make_head(MultiOutputClassifier(self._make_estimator())), y_vulnerabilities_train),
+        ]
+        self.binary_classifier, self.technique_classifier, self.vulnerability_classifier = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_head)(head, X_train, y) for head, y in heads
+        )
+        timings['fit'] = time.perf_counter() - step
         
         # Evaluate binary classifier
+        step = time.perf_counter()
         y_binary_pred = self.binary_classifier.predict(X_test)
         binary_accuracy = accuracy_score(y_binary_test, y_binary_pred)
         print(f"Binary Classifier Accuracy: {binary_accuracy:.4f}")
         print("Binary Classification Report:")
         print(classification_report(y_binary_test, y_binary_pred))
         
-        # Create and train the technique classifier
-        self.technique_classifier = Pipeline([
-            ('tfidf', TfidfVectorizer(max_features=5000, ngram_range=(1, 2))),
-            ('clf', MultiOutputClassifier(LogisticRegression(max_iter=1000, class_weight='balanced')))
-        ])
-        self.technique_classifier.fit(X_train, y_techniques_train)
-        
-        # Evaluate technique classifier
+        # Evaluate technique and vulnerability classifiers
         y_techniques_pred = self.technique_classifier.predict(X_test)
-        technique_accuracy = np.mean([(y_techniques_test[i] == y_techniques_pred[i]).all() for i in range(len(y_techniques_test))])
+        technique_accuracy = np.mean((y_techniques_test == y_techniques_pred).all(axis=1))
         print(f"Technique Classifier Exact Match Accuracy: {technique_accuracy:.4f}")
         
-        # Create and train the vulnerability classifier
-        self.vulnerability_classifier = Pipeline([
-            ('tfidf', TfidfVectorizer(max_features=5000, ngram_range=(1, 2))),
-            ('clf', MultiOutputClassifier(LogisticRegression(max_iter=1000, class_weight='balanced')))
-        ])
-        self.vulnerability_classifier.fit(X_train, y_vulnerabilities_train)
+        y_vulnerabilities_pred = self.vulnerability_classifier.predict(X_test)
+        vulnerability_accuracy = np.mean((y_vulnerabilities_test == y_vulnerabilities_pred).all(axis=1))
+        print(f"Vulnerability Classifier Exact Match Accuracy: {vulnerability_accuracy:.4f}")
+        timings['evaluate'] = time.perf_counter() - step
+        
+        self.thresholds = complete_thresholds(self.thresholds, self.technique_labels, self.vulnerability_labels)
+        self.export_scorer()
+        self._bind_model(f"trained:{uuid.uuid4()}")
+        timings['total'] = time.perf_counter() - started
         
         return {
             'binary_accuracy': binary_accuracy,
-            'technique_accuracy': technique_accuracy
+            'technique_accuracy': technique_accuracy,
+            'vulnerability_accuracy': vulnerability_accuracy,
+            'binary_f1_macro': f1_score(y_binary_test, y_binary_pred, average='macro'),
+            'technique_f1_micro': f1_score(y_techniques_test, y_techniques_pred, average='micro', zero_division=0),
+            'vulnerability_f1_micro': f1_score(y_vulnerabilities_test, y_vulnerabilities_pred, average='micro', zero_division=0),
+            'train_size': len(y_binary_train),
+            'test_size': len(y_binary_test),
+            'hyperparameters': {
+                'max_features': self.hashing_features if self.feature_extractor == "hashing" else self.max_features,
+                'ngram_range': list(self.ngram_range),
+                'C': self.C,
+            },
+            'timings': timings,
+            'search': search,
+        }
+    
+    def search_hyperparameters(self, X, y_binary, param_grid=None, cv=3, n_jobs=None):
+        """Grid search `max_features`/`ngram_range`/`C` on the binary head.
+        
+        The best values are kept on the classifier and used by the next
+        `train`. For the hashing extractor `max_features` is the number of
+        hash buckets.
+        """
+        param_grid = param_grid or DEFAULT_PARAM_GRID
+        unknown = set(param_grid) - set(DEFAULT_PARAM_GRID)
+        if unknown:
+            raise ValueError(f"Unknown hyperparameters {sorted(unknown)}, expected {sorted(DEFAULT_PARAM_GRID)}")
+        
+        features = 'features__hashing__' if self.feature_extractor == "hashing" else 'features__'
+        names = {
+            'max_features': features + ('n_features' if self.feature_extractor == "hashing" else 'max_features'),
+            'ngram_range': features + 'ngram_range',
+            'C': 'clf__C',
+        }
+        
+        pipeline = Pipeline([
+            ('features', self._make_vectorizer()),
+            ('clf', self._make_estimator())
+        ])
+        grid = GridSearchCV(
+            pipeline,
+            {names[name]: list(values) for name, values in param_grid.items()},
+            scoring='f1_macro',
+            cv=cv,
+            n_jobs=n_jobs,
+            refit=False,
+        )
+        grid.fit(X, y_binary)
+        
+        best_params = {name: grid.best_params_[names[name]] for name in param_grid}
+        if 'max_features' in best_params:
+            if self.feature_extractor == "hashing":
+                self.hashing_features = best_params['max_features']
+            else:
+                self.max_features = best_params['max_features']
+        self.ngram_range = tuple(best_params.get('ngram_range', self.ngram_range))
+        self.C = best_params.get('C', self.C)
+        
+        candidates = [
+            {
+                'params': {name: params[names[name]] for name in param_grid},
+                'mean_score': float(mean_score),
+                'mean_fit_seconds': float(fit_time),
+            }
+            for params, mean_score, fit_time in zip(
+                grid.cv_results_['params'],
+                grid.cv_results_['mean_test_score'],
+                grid.cv_results_['mean_fit_time'],
+            )
+        ]
+        return {
+            'best_params': best_params,
+            'best_score': float(grid.best_score_),
+            'cv': cv,
+            'candidates': sorted(candidates, key=lambda candidate: -candidate['mean_score']),
         }
     
+    def _make_vectorizer(self):
+        if self.feature_extractor == "hashing":
+            # No vocabulary to store: terms are hashed, only idf weights are fit
+            return Pipeline([
+                ('hashing', HashingVectorizer(
+                    n_features=self.hashing_features, ngram_range=self.ngram_range, alternate_sign=False, norm=None
+                )),
+                ('tfidf', TfidfTransformer())
+            ])
+        return TfidfVectorizer(max_features=self.max_features, ngram_range=self.ngram_range)
+    
+    def _make_estimator(self):
+        return LogisticRegression(max_iter=1000, class_weight='balanced', C=self.C)
+    
+    def _make_head(self, estimator):
+        """Bare estimator on shared features, or a self-vectorizing pipeline."""
+        if self.vectorizer is not None:
+            return estimator
+        return Pipeline([
+            ('tfidf', self._make_vectorizer()),
+            ('clf', estimator)
+        ])
+    
+    def _features(self, messages):
+        """Shared sparse feature rows, or raw text for legacy pipelines."""
+        if self.vectorizer is not None:
+            return self.vectorizer.transform(messages)
+        return list(messages)
+    
+    def export_scorer(self):
+        """Stack the heads into a `FusedLinearScorer` (shared vectorizer only)."""
+        self.scorer = FusedLinearScorer.from_classifier(self) if self.vectorizer is not None else None
+        return self.scorer
+    
+    def set_thresholds(self, is_manipulative=None, techniques=None, vulnerabilities=None):
+        """Override the probability threshold of the binary head and/or of
+        individual technique and vulnerability labels."""
+        if self.technique_labels is None:
+            raise ValueError("Model not trained. Call train() first.")
+        
+        thresholds = complete_thresholds(self.thresholds, self.technique_labels, self.vulnerability_labels)
+        updates = [("is_manipulative", is_manipulative)] if is_manipulative is not None else []
+        for group, values in (("techniques", techniques), ("vulnerabilities", vulnerabilities)):
+            for label, value in (values or {}).items():
+                if label not in thresholds[group]:
+                    raise ValueError(f"Unknown {group} label '{label}'")
+                updates.append(((group, label), value))
+        
+        for key, value in updates:
+            if not 0 < value < 1:
+                raise ValueError(f"Threshold for {key} must be between 0 and 1, got {value}")
+            if isinstance(key, tuple):
+                thresholds[key[0]][key[1]] = float(value)
+            else:
+                thresholds[key] = float(value)
+        
+        self.thresholds = thresholds
+        if self.scorer is not None:
+            self.scorer.set_thresholds(thresholds)
+        # Cached results were labelled with the old thresholds. Rebinding
+        # (rather than clearing) also drops results that worker threads
+        # computed with the old thresholds and store afterwards
+        self.thresholds_version += 1
+        self.cache.bind(f"{self.model_id}:thresholds-{self.thresholds_version}")
+    
     def predict(self, message):
-        """Predict if a message is manipulative and identify techniques."""
-        if not self.binary_classifier or not self.technique_classifier:
+        """Predict if a message is manipulative and identify techniques.
+        
+        Besides the labels, the result holds the probability of the binary
+        head (`confidence`) and, for manipulative messages, the probability
+        of every technique and vulnerability label.
+        """
+        return self.predict_batch([message])[0]
+    
+    def predict_batch(self, messages):
+        """Predict a batch of messages, skipping inference for cached content."""
+        if self.scorer is None and (self.binary_classifier is None or self.technique_classifier is None):
             raise ValueError("Model not trained. Call train() first.")
         
-        # Predict if the message is manipulative
-        is_manipulative = self.binary_classifier.predict([message])[0]
+        if not self.cache.enabled:
+            return self._predict_batch_uncached(messages)
         
-        result = {
-            "is_manipulative": bool(is_manipulative),
-            "techniques": [],
-            "vulnerabilities": []
-        }
+        # Read before inference: results are only stored if the model and
+        # thresholds they were computed with are still current
+        binding = self.cache.model_id
+        results = [None] * len(messages)
+        pending = {}
+        for i, message in enumerate(messages):
+            key = message_key(message)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                # Identical messages in one batch are classified once
+                pending.setdefault(key, []).append(i)
         
-        # If manipulative, identify techniques and vulnerabilities
-        if is_manipulative:
-            technique_preds = self.technique_classifier.predict([message])[0]
-            vulnerability_preds = self.vulnerability_classifier.predict([message])[0]
-            
-            # Extract predicted techniques
-            for i, pred in enumerate(technique_preds):
-                if pred > 0:
-                    result["techniques"].append(self.technique_labels[i])
+        if pending:
+            keys = list(pending)
+            predictions = self._predict_batch_uncached([messages[pending[key][0]] for key in keys])
+            for key, prediction in zip(keys, predictions):
+                self.cache.put(key, prediction, model_id=binding)
+                for i in pending[key]:
+                    results[i] = prediction
+        
+        # Hand out copies so callers cannot mutate cached entries
+        return [_copy_result(result) for result in results]
+    
+    def _predict_batch_uncached(self, messages):
+        """Predict a batch of messages with one vectorized call per classifier."""
+        # One matrix product scores every head at once
+        if self.scorer is not None:
+            return self.scorer.predict_batch(messages)
+        
+        thresholds = complete_thresholds(self.thresholds, self.technique_labels, self.vulnerability_labels)
+        
+        # Tokenize each message once and reuse the rows for every head
+        features = self._features(messages)
+        
+        # Predict which messages are manipulative
+        confidence = self.binary_classifier.predict_proba(features)[:, 1] if len(messages) else []
+        results = [
+            {
+                "is_manipulative": False,
+                "confidence": float(p),
+                "techniques": [],
+                "vulnerabilities": [],
+                "technique_scores": {},
+                "vulnerability_scores": {},
+            }
+            for p in confidence
+        ]
+        manipulative_idx = np.flatnonzero(np.asarray(confidence) > thresholds["is_manipulative"])
+        
+        # Identify techniques and vulnerabilities only for manipulative messages
+        if len(manipulative_idx):
+            if self.vectorizer is not None:
+                flagged = features[manipulative_idx]
+            else:
+                flagged = [features[i] for i in manipulative_idx]
             
-            # Extract predicted vulnerabilities
-            for i, pred in enumerate(vulnerability_preds):
-                if pred > 0:
-                    result["vulnerabilities"].append(self.vulnerability_labels[i])
+            for group, score_key, classifier, labels in (
+                ("techniques", "technique_scores", self.technique_classifier, self.technique_labels),
+                ("vulnerabilities", "vulnerability_scores", self.vulnerability_classifier, self.vulnerability_labels),
+            ):
+                # One (n, 2) probability array per label
+                probabilities = np.column_stack([p[:, 1] for p in classifier.predict_proba(flagged)])
+                cutoffs = np.array([thresholds[group][label] for label in labels])
+                for row, i in enumerate(manipulative_idx):
+                    result = results[i]
+                    result["is_manipulative"] = True
+                    result[group] = [labels[j] for j in np.flatnonzero(probabilities[row] > cutoffs)]
+                    result[score_key] = dict(zip(labels, probabilities[row].tolist()))
         
-        return result
+        return results
     
     def save_model(self, file_path):
         """Save the trained model to a file."""
         model_data = {
+            'format_version': LEGACY_FORMAT_VERSION,
             'binary_classifier': self.binary_classifier,
             'technique_classifier': self.technique_classifier,
             'vulnerability_classifier': self.vulnerability_classifier,
             'technique_labels': self.technique_labels,
-            'vulnerability_labels': self.vulnerability_labels
+            'vulnerability_labels': self.vulnerability_labels,
+            'thresholds': self.thresholds
         }
+        if self.vectorizer is not None:
+            model_data['format_version'] = SHARED_FORMAT_VERSION
+            model_data['vectorizer'] = self.vectorizer
+            model_data['feature_extractor'] = self.feature_extractor
         joblib.dump(model_data, file_path)
     
+    def save_artifact(self, directory):
+        """Export the fused model as a memory-mappable artifact directory."""
+        if self.scorer is None:
+            raise ValueError("Model artifacts require a shared-vectorizer model.")
+        export_artifact(self, directory)
+    
     def load_model(self, file_path):
-        """Load a trained model from a file."""
+        """Load a trained model from a file (shared-vectorizer or legacy format)
+        or from a memory-mapped artifact directory."""
+        if os.path.isdir(file_path):
+            self._load_artifact(file_path)
+            return
+        
         model_data = joblib.load(file_path)
         self.binary_classifier = model_data['binary_classifier']
         self.technique_classifier = model_data['technique_classifier']
         self.vulnerability_classifier = model_data['vulnerability_classifier']
         self.technique_labels = model_data['technique_labels']
         self.vulnerability_labels = model_data['vulnerability_labels']
+        self.thresholds = complete_thresholds(
+            model_data.get('thresholds'), self.technique_labels, self.vulnerability_labels
+        )
+        
+        if model_data.get('format_version', LEGACY_FORMAT_VERSION) >= SHARED_FORMAT_VERSION:
+            self.vectorizer = model_data['vectorizer']
+            self.feature_extractor = model_data.get('feature_extractor', 'tfidf')
+        else:
+            self.vectorizer = None
+            if self.shared_vectorizer:
+                self._share_legacy_vectorizer()
+        
+        self.export_scorer()
+        stat = os.stat(file_path)
+        self._bind_model(f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    
+    def _load_artifact(self, directory):
+        """Serve predictions from memory-mapped arrays without the sklearn heads."""
+        self.scorer, manifest = load_artifact(directory)
+        self.vectorizer = self.scorer.vectorizer
+        self.binary_classifier = None
+        self.technique_classifier = None
+        self.vulnerability_classifier = None
+        self.technique_labels = self.scorer.technique_labels
+        self.vulnerability_labels = self.scorer.vulnerability_labels
+        self.thresholds = self.scorer.thresholds
+        self._bind_model(f"{os.path.abspath(directory)}:{manifest['created_at']}")
+    
+    def _bind_model(self, model_id):
+        self.model_id = model_id
+        self.cache.bind(model_id)
+    
+    def _share_legacy_vectorizer(self):
+        """Unwrap legacy pipelines whose vectorizers were fit identically.
+        
+        The legacy trainer fit three TF-IDF vectorizers with the same
+        parameters on the same data, so they are normally interchangeable.
+        """
+        pipelines = [self.binary_classifier, self.technique_classifier, self.vulnerability_classifier]
+        vectorizers = [pipeline.named_steps['tfidf'] for pipeline in pipelines]
+        
+        first = vectorizers[0]
+        for other in vectorizers[1:]:
+            if (
+                other.get_params() != first.get_params()
+                or other.vocabulary_ != first.vocabulary_
+                or not np.array_equal(other.idf_, first.idf_)
+            ):
+                return
+        
+        self.vectorizer = first
+        self.binary_classifier, self.technique_classifier, self.vulnerability_classifier = [
+            pipeline.named_steps['clf'] for pipeline in pipelines
+        ]
+
+
+def _multilabel_matrix(df, prefix):
+    """Sorted labels and one-hot matrix from the `<prefix>_1..3` columns.
+    
+    A dialogue gets the union of the comma-separated labels of every
+    annotator who marked it manipulative.
+    """
+    parts = []
+    for annotator in [1, 2, 3]:
+        col = f'{prefix}_{annotator}'
+        if col not in df.columns:
+            continue
+        values = df[col].where(df[f'manipulative_{annotator}'] == 1).dropna()
+        parts.append(values.astype(str).str.split(',').explode().str.strip())
+    
+    labels = pd.concat(parts) if parts else pd.Series([], dtype=object)
+    labels = labels[labels != '']
+    label_names = sorted(labels.unique())
+    
+    y = np.zeros((len(df), len(label_names)))
+    rows = df.index.get_indexer(labels.index)
+    y[rows, pd.Categorical(labels, categories=label_names).codes] = 1
+    return label_names, y
+
+
+def _fit_head(head, X, y):
+    return head.fit(X, y)
+
+
+def _copy_result(result):
+    return {
+        key: type(value)(value) if isinstance(value, (list, dict)) else value
+        for key, value in result.items()
+    }
 
 
 # Example usage
@@ -0,0 +1,163 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.service.classification.classifier import ManipulativeMessageClassifier
+
+
+class InferenceEngine:
+    """Micro-batching front end for `ManipulativeMessageClassifier`.
+
+    Concurrent `predict` calls are queued and collected for up to
+    `max_wait_ms` (or until `max_batch_size` messages are waiting), then
+    classified with a single `predict_batch` call on a worker thread.
+    The event loop never runs model inference itself:
+    ```
+    engine = InferenceEngine(classifier)
+    await engine.start()
+    result = await engine.predict("where are you?")
+    await engine.stop()
+    ```
+    """
+
+    def __init__(
+        self,
+        classifier: ManipulativeMessageClassifier,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        max_workers: int = 1,
+    ) -> None:
+        self.classifier = classifier
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_workers = max(1, max_workers)
+
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.queue: Optional[asyncio.Queue[Tuple[str, asyncio.Future]]] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.collector: Optional[asyncio.Task] = None
+        self.inflight: set[asyncio.Task] = set()
+        # Taken off the queue by the collector but not handed to a batch yet
+        self.pending: List[Tuple[str, asyncio.Future]] = []
+
+    @property
+    def running(self) -> bool:
+        return self.collector is not None and not self.collector.done()
+
+    async def start(self):
+        """Start the batch collector on the running event loop"""
+        if self.running:
+            return
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="classifier"
+        )
+        self.queue = asyncio.Queue()
+        self.wakeup = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.max_workers)
+        self.collector = asyncio.create_task(self._collect())
+        logger.info(
+            f"Inference engine started (batch size {self.max_batch_size}, "
+            f"wait {self.max_wait * 1000:.1f}ms, workers {self.max_workers})"
+        )
+
+    async def stop(self):
+        """Finish in-flight batches and fail anything still queued"""
+        if self.collector is not None:
+            self.collector.cancel()
+            try:
+                await self.collector
+            except asyncio.CancelledError:
+                pass
+            self.collector = None
+
+        if self.inflight:
+            await asyncio.gather(*self.inflight, return_exceptions=True)
+
+        stopped = list(self.pending)
+        self.pending = []
+        if self.queue is not None:
+            while not self.queue.empty():
+                stopped.append(self.queue.get_nowait())
+        for _, future in stopped:
+            if not future.done():
+                future.set_exception(RuntimeError("Inference engine stopped"))
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+        logger.info("Inference engine stopped")
+
+    async def predict(self, message: str) -> Dict[str, Any]:
+        """Classify one message as part of the next batch"""
+        if not self.running:
+            # Not started (e.g. scripts and tests): still keep inference off the loop
+            results = await asyncio.to_thread(self.classifier.predict_batch, [message])
+            return results[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((message, future))
+        self.wakeup.set()
+        return await future
+
+    async def predict_many(self, messages: List[str]) -> List[Dict[str, Any]]:
+        """Classify several messages, sharing batches with concurrent callers"""
+        return list(await asyncio.gather(*(self.predict(m) for m in messages)))
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+            self.pending = batch
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                while not self.queue.empty() and len(batch) < self.max_batch_size:
+                    batch.append(self.queue.get_nowait())
+
+                remaining = deadline - loop.time()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            # Drop callers that gave up while waiting
+            batch = [(m, f) for m, f in batch if not f.done()]
+            self.pending = batch
+            if not batch:
+                continue
+
+            await self.slots.acquire()
+            self.pending = []
+            task = asyncio.create_task(self._run_batch(batch))
+            self.inflight.add(task)
+            task.add_done_callback(self.inflight.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        messages = [message for message, _ in batch]
+
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.classifier.predict_batch, messages
+            )
+        except Exception as e:
+            logger.error(f"Error classifying batch of {len(batch)} messages: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.slots.release()
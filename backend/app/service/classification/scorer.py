@@ -0,0 +1,125 @@
+import numpy as np
+from scipy.special import expit, logit
+
+# Probability above which a label is predicted, like `LogisticRegression.predict`
+DEFAULT_THRESHOLD = 0.5
+
+
+def complete_thresholds(thresholds, technique_labels, vulnerability_labels):
+    """Fill in `DEFAULT_THRESHOLD` for every head missing from `thresholds`.
+
+    Thresholds are keyed like the prediction output:
+    `{"is_manipulative": p, "techniques": {label: p}, "vulnerabilities": {label: p}}`
+    """
+    thresholds = thresholds or {}
+    techniques = thresholds.get("techniques") or {}
+    vulnerabilities = thresholds.get("vulnerabilities") or {}
+    return {
+        "is_manipulative": float(thresholds.get("is_manipulative", DEFAULT_THRESHOLD)),
+        "techniques": {
+            label: float(techniques.get(label, DEFAULT_THRESHOLD)) for label in technique_labels
+        },
+        "vulnerabilities": {
+            label: float(vulnerabilities.get(label, DEFAULT_THRESHOLD)) for label in vulnerability_labels
+        },
+    }
+
+
+class FusedLinearScorer:
+    """All classifier heads stacked into one linear layer.
+
+    Column 0 is the binary head, followed by one column per technique and
+    one per vulnerability. Scoring a batch is a single sparse-dense matrix
+    product over the shared TF-IDF rows. Probabilities are the logistic of
+    the scores, and a label is predicted when its probability exceeds its
+    threshold; thresholds are compared in score space, so the default 0.5
+    predicts exactly like `LogisticRegression.predict`.
+    """
+
+    def __init__(self, vectorizer, coef, intercept, technique_labels, vulnerability_labels, thresholds=None):
+        self.vectorizer = vectorizer
+        self.coef = np.ascontiguousarray(coef)  # (n_features, n_outputs)
+        self.intercept = np.asarray(intercept)  # (n_outputs,)
+        self.technique_labels = list(technique_labels)
+        self.vulnerability_labels = list(vulnerability_labels)
+
+        n_techniques = len(self.technique_labels)
+        self.technique_slice = slice(1, 1 + n_techniques)
+        self.vulnerability_slice = slice(1 + n_techniques, 1 + n_techniques + len(self.vulnerability_labels))
+        self.set_thresholds(thresholds)
+
+    def set_thresholds(self, thresholds):
+        self.thresholds = complete_thresholds(thresholds, self.technique_labels, self.vulnerability_labels)
+        probabilities = np.array(
+            [self.thresholds["is_manipulative"]]
+            + [self.thresholds["techniques"][label] for label in self.technique_labels]
+            + [self.thresholds["vulnerabilities"][label] for label in self.vulnerability_labels]
+        )
+        self.score_thresholds = logit(probabilities)
+
+    @classmethod
+    def from_classifier(cls, classifier):
+        """Export the heads of a shared-vectorizer classifier."""
+        if classifier.vectorizer is None:
+            raise ValueError("Fused scoring requires a classifier with a shared vectorizer.")
+
+        estimators = [classifier.binary_classifier]
+        estimators += list(classifier.technique_classifier.estimators_)
+        estimators += list(classifier.vulnerability_classifier.estimators_)
+
+        for estimator in estimators:
+            if list(estimator.classes_) != [0, 1]:
+                raise ValueError(f"Expected binary 0/1 heads, got classes {estimator.classes_}")
+
+        coef = np.vstack([estimator.coef_ for estimator in estimators]).T
+        intercept = np.concatenate([estimator.intercept_ for estimator in estimators])
+
+        return cls(
+            classifier.vectorizer,
+            coef,
+            intercept,
+            classifier.technique_labels,
+            classifier.vulnerability_labels,
+            classifier.thresholds,
+        )
+
+    def decision_function(self, messages):
+        """Raw scores for every head, shape (n_messages, n_outputs)."""
+        features = self.vectorizer.transform(messages)
+        return features @ self.coef + self.intercept
+
+    def predict_proba(self, messages):
+        """Positive-class probability of every head, shape (n_messages, n_outputs)."""
+        return expit(self.decision_function(messages))
+
+    def predict_batch(self, messages):
+        """Same output as `ManipulativeMessageClassifier.predict` for each message."""
+        if len(messages) == 0:
+            return []
+
+        scores = self.decision_function(messages)
+        probabilities = expit(scores)
+        positive = scores > self.score_thresholds
+        is_manipulative = positive[:, 0]
+
+        # Techniques and vulnerabilities are only reported for manipulative messages
+        techniques = positive[:, self.technique_slice] & is_manipulative[:, None]
+        vulnerabilities = positive[:, self.vulnerability_slice] & is_manipulative[:, None]
+        technique_probabilities = probabilities[:, self.technique_slice]
+        vulnerability_probabilities = probabilities[:, self.vulnerability_slice]
+
+        results = []
+        for i in range(len(messages)):
+            result = {
+                "is_manipulative": bool(is_manipulative[i]),
+                "confidence": float(probabilities[i, 0]),
+                "techniques": [self.technique_labels[j] for j in np.flatnonzero(techniques[i])],
+                "vulnerabilities": [self.vulnerability_labels[j] for j in np.flatnonzero(vulnerabilities[i])],
+                "technique_scores": {},
+                "vulnerability_scores": {},
+            }
+            if is_manipulative[i]:
+                result["technique_scores"] = dict(zip(self.technique_labels, technique_probabilities[i].tolist()))
+                result["vulnerability_scores"] = dict(zip(self.vulnerability_labels, vulnerability_probabilities[i].tolist()))
+            results.append(result)
+        return results
@@ -0,0 +1,112 @@
+"""Train the classifier and write a timing and metrics report.
+
+The three heads are fit in parallel and `--search` first cross-validates
+`max_features`, `ngram_range` and `C` on the training split:
+```
+python -m app.service.classification.train data/mentalmanip_detailed_expanded.csv \
+    --n-jobs -1 --search --report training_report.json
+```
+"""
+import argparse
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    from app.service.classification.classifier import DEFAULT_PARAM_GRID, ManipulativeMessageClassifier
+except ImportError:  # run as a script from this directory
+    from classifier import DEFAULT_PARAM_GRID, ManipulativeMessageClassifier
+
+
+def _ngram_range(value):
+    low, high = value.split(",")
+    return (int(low), int(high))
+
+
+def _threshold(value):
+    name, threshold = value.rsplit("=", 1)
+    return name, float(threshold)
+
+
+def _apply_thresholds(classifier, thresholds):
+    """Route `name=value` pairs to the binary head or to a technique/vulnerability label."""
+    techniques, vulnerabilities = {}, {}
+    is_manipulative = None
+    for name, value in thresholds:
+        if name == "is_manipulative":
+            is_manipulative = value
+        elif name in classifier.technique_labels:
+            techniques[name] = value
+        elif name in classifier.vulnerability_labels:
+            vulnerabilities[name] = value
+        else:
+            raise ValueError(f"Unknown label '{name}'")
+    classifier.set_thresholds(is_manipulative, techniques, vulnerabilities)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the manipulative message classifier")
+    parser.add_argument("dataset_path", help="Training CSV")
+    parser.add_argument("--model-path", default="manipulative_classifier.pkl", help="Where to save the model")
+    parser.add_argument("--feature-extractor", default="tfidf", choices=["tfidf", "hashing"])
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Parallel joblib workers (-1 uses all cores)")
+    parser.add_argument("--search", action="store_true", help="Grid search hyperparameters before training")
+    parser.add_argument("--cv", type=int, default=3, help="Cross-validation folds for --search")
+    parser.add_argument(
+        "--max-features", type=int, nargs="+", default=DEFAULT_PARAM_GRID["max_features"],
+        help="Vocabulary sizes (hash buckets for hashing) to search"
+    )
+    parser.add_argument(
+        "--ngram-ranges", type=_ngram_range, nargs="+", default=DEFAULT_PARAM_GRID["ngram_range"],
+        help="N-gram ranges to search, e.g. 1,1 1,2"
+    )
+    parser.add_argument("--C", type=float, nargs="+", default=DEFAULT_PARAM_GRID["C"], help="Regularization values to search")
+    parser.add_argument(
+        "--threshold", type=_threshold, nargs="+", default=[],
+        help="Probability thresholds saved with the model, e.g. is_manipulative=0.6 Denial=0.4"
+    )
+    parser.add_argument("--report", help="Optional JSON report path")
+    args = parser.parse_args()
+
+    param_grid = None
+    if args.search:
+        param_grid = {"max_features": args.max_features, "ngram_range": args.ngram_ranges, "C": args.C}
+
+    classifier = ManipulativeMessageClassifier(feature_extractor=args.feature_extractor)
+    print("Training the model...")
+    metrics = classifier.train(args.dataset_path, n_jobs=args.n_jobs, param_grid=param_grid, cv=args.cv)
+    if args.threshold:
+        _apply_thresholds(classifier, args.threshold)
+    classifier.save_model(args.model_path)
+    print(f"Model saved to '{args.model_path}'")
+
+    print("\nTimings (seconds):")
+    for step, seconds in metrics["timings"].items():
+        print(f"  {step:>10}: {seconds:.2f}")
+
+    if args.report:
+        report = {
+            "dataset_path": args.dataset_path,
+            "model_path": args.model_path,
+            "feature_extractor": args.feature_extractor,
+            "n_jobs": args.n_jobs,
+            "thresholds": classifier.thresholds,
+            "created_at": datetime.now(tz=timezone.utc).isoformat(),
+            **metrics,
+        }
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, default=_json_default)
+        print(f"Report written to '{args.report}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+from dataclasses import dataclass
+from typing import List, Optional
+from uuid import UUID
+
+from loguru import logger
+
+from app.core.websocket import ConnectionManager
+from app.db.postgres import Postgres
+from app.service.classification.inference import InferenceEngine
+from app.service.message_writer import MessageWriter
+from app.service.statistics_cache import StatisticsCache
+
+
+@dataclass(frozen=True)
+class ClassificationJob:
+    message_id: UUID
+    sender_id: str
+    receiver_id: str
+    content: str
+
+
+class ClassificationQueue:
+    """Background classification of already-delivered messages.
+
+    Messages are saved and forwarded without labels, then submitted here.
+    Worker tasks drain the queue in batches, classify them through the
+    `InferenceEngine`, store the labels with one bulk update per batch and
+    push a `classification` event to both participants:
+    ```
+    {"type": "classification", "message_id": "...", "is_manipulative": true,
+     "techniques": [...], "vulnerabilities": [...], "confidence": 0.93}
+    ```
+    A failed batch is retried up to `max_attempts` times, waiting
+    `retry_delay_ms` (doubled every time) in between. If it still fails, the
+    event is sent with `"is_manipulative": null` and an `"error"`, so clients
+    stop waiting; the messages stay unclassified.
+    """
+
+    def __init__(
+        self,
+        db_client: Postgres,
+        inference_engine: InferenceEngine,
+        ws_manager: ConnectionManager,
+        workers: int = 2,
+        max_batch_size: int = 64,
+        max_queue_size: int = 10000,
+        max_attempts: int = 3,
+        retry_delay_ms: float = 500.0,
+        message_writer: Optional[MessageWriter] = None,
+        statistics_cache: Optional[StatisticsCache] = None,
+    ) -> None:
+        self.db_client = db_client
+        self.inference_engine = inference_engine
+        self.ws_manager = ws_manager
+        self.workers = max(1, workers)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_queue_size = max_queue_size
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = max(0.0, retry_delay_ms) / 1000
+        # Rows acknowledged before they commit must exist before labelling
+        self.message_writer = message_writer
+        # New labels change the statistics of the messages' pairs
+        self.statistics_cache = statistics_cache
+
+        self.queue: Optional[asyncio.Queue[ClassificationJob]] = None
+        self.tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self.tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"Classification queue started with {self.workers} workers")
+
+    async def stop(self):
+        """Classify everything already queued, then stop the workers"""
+        if not self.running:
+            return
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        logger.info("Classification queue stopped")
+
+    async def submit(self, message_id: UUID, sender_id: str, receiver_id: str, content: str):
+        """Queue a saved message for classification (waits if the queue is full)"""
+        await self.queue.put(ClassificationJob(message_id, sender_id, receiver_id, content))
+
+    async def _work(self):
+        while True:
+            jobs = [await self.queue.get()]
+            while len(jobs) < self.max_batch_size and not self.queue.empty():
+                jobs.append(self.queue.get_nowait())
+
+            try:
+                await self._classify_with_retries(jobs)
+            finally:
+                for _ in jobs:
+                    self.queue.task_done()
+
+    async def _classify_with_retries(self, jobs: List[ClassificationJob]):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self._classify(jobs)
+                return
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    logger.error(f"Giving up on {len(jobs)} queued messages after {attempt} attempts: {str(e)}")
+                    break
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning(
+                    f"Error classifying {len(jobs)} queued messages (attempt {attempt}/{self.max_attempts}), "
+                    f"retrying in {delay * 1000:.0f}ms: {str(e)}"
+                )
+                await asyncio.sleep(delay)
+
+        # Let both clients clear their pending state
+        for job in jobs:
+            event = {
+                "type": "classification",
+                "message_id": str(job.message_id),
+                "is_manipulative": None,
+                "techniques": None,
+                "vulnerabilities": None,
+                "confidence": None,
+                "error": "Classification failed",
+            }
+            try:
+                await self.ws_manager.send_many(event, [job.receiver_id, job.sender_id])
+            except Exception as e:
+                logger.error(f"Error sending classification failure for message {job.message_id}: {str(e)}")
+
+    async def _classify(self, jobs: List[ClassificationJob]):
+        # Imported here to avoid a circular import with the chat service
+        from app.service.chat_service import update_message_classifications
+
+        results = await self.inference_engine.predict_many([job.content for job in jobs])
+
+        rows = []
+        for job, result in zip(jobs, results):
+            is_manipulative = result["is_manipulative"]
+            rows.append((
+                job.message_id,
+                is_manipulative,
+                result["techniques"] if is_manipulative else None,
+                result["vulnerabilities"] if is_manipulative else None,
+                result["confidence"],
+            ))
+        if self.message_writer:
+            await self.message_writer.flush()
+        changed = await update_message_classifications(self.db_client, rows)
+        if changed and self.statistics_cache:
+            for receiver_id, sender_id in {(job.receiver_id, job.sender_id) for job in jobs}:
+                self.statistics_cache.invalidate(receiver_id, sender_id)
+
+        for job, (_, is_manipulative, techniques, vulnerabilities, confidence) in zip(jobs, rows):
+            event = {
+                "type": "classification",
+                "message_id": str(job.message_id),
+                "is_manipulative": is_manipulative,
+                "techniques": techniques,
+                "vulnerabilities": vulnerabilities,
+                "confidence": confidence,
+            }
+            await self.ws_manager.send_many(event, [job.receiver_id, job.sender_id])
@@ -0,0 +1,195 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import insert
+
+from app.db.models import Message
+from app.db.postgres import Postgres
+from app.service.statistics_cache import StatisticsCache
+
+
+class MessageWriter:
+    """Write-behind buffer for new messages.
+
+    Rows written by every connection are queued and committed together with
+    one multi-row `INSERT` per batch, flushed once `max_batch_size` rows are
+    waiting or `max_wait_ms` after the first one arrived. At most
+    `max_pending` rows are held in memory; beyond that `write` waits for the
+    next flush (backpressure). Cached statistics of the pairs in a batch are
+    invalidated once it commits.
+
+    `write(row, durable=True)` returns the stored timestamp once the batch
+    holding the row has committed and raises if it failed; with
+    `durable=False` it returns None as soon as the row is queued:
+    ```
+    writer = MessageWriter(db_client)
+    await writer.start()
+    await writer.write({"message_id": ..., "sender_id": ..., ...})
+    await writer.stop()
+    ```
+    """
+
+    def __init__(
+        self,
+        db_client: Postgres,
+        max_batch_size: int = 500,
+        max_wait_ms: float = 5.0,
+        max_pending: int = 10000,
+        durable: bool = True,
+        statistics_cache: Optional[StatisticsCache] = None,
+    ) -> None:
+        self.db_client = db_client
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_pending = max(self.max_batch_size, max_pending)
+        # Default for `write`: acknowledge only committed rows
+        self.durable = durable
+        self.statistics_cache = statistics_cache
+
+        self.batches = 0
+        self.rows = 0
+        self.failed_rows = 0
+        self.largest_batch = 0
+
+        self.queue: Optional[asyncio.Queue[Tuple[Dict[str, Any], Optional[asyncio.Future]]]] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.flusher: Optional[asyncio.Task] = None
+        # Rows queued and rows whose batch finished, for `flush`
+        self.enqueued = 0
+        self.completed = 0
+        self.progress: Optional[asyncio.Condition] = None
+
+    @property
+    def running(self) -> bool:
+        return self.flusher is not None and not self.flusher.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.wakeup = asyncio.Event()
+        self.progress = asyncio.Condition()
+        self.flusher = asyncio.create_task(self._flush_loop())
+        logger.info(
+            f"Message writer started (batch size {self.max_batch_size}, "
+            f"wait {self.max_wait * 1000:.1f}ms, max pending {self.max_pending})"
+        )
+
+    async def stop(self):
+        """Commit everything already queued, then stop the flusher"""
+        if not self.running:
+            return
+        await self.queue.join()
+        self.flusher.cancel()
+        try:
+            await self.flusher
+        except asyncio.CancelledError:
+            pass
+        self.flusher = None
+        logger.info("Message writer stopped")
+
+    async def write(self, row: Dict[str, Any], durable: Optional[bool] = None) -> Optional[datetime]:
+        """Queue a `messages` row (waits while `max_pending` rows are queued)"""
+        if not self.running:
+            # Not started (e.g. scripts and tests): insert right away
+            return (await self._insert([row]))[row["message_id"]]
+
+        durable = self.durable if durable is None else durable
+        future = asyncio.get_running_loop().create_future() if durable else None
+        await self.queue.put((row, future))
+        self.enqueued += 1
+        self.wakeup.set()
+        if future is not None:
+            return await future
+        return None
+
+    async def flush(self):
+        """Wait until every row queued so far has been committed (or failed)"""
+        if not self.running:
+            return
+        target = self.enqueued
+        async with self.progress:
+            await self.progress.wait_for(lambda: self.completed >= target)
+
+    def stats(self):
+        return {
+            "pending": self.queue.qsize() if self.queue is not None else 0,
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed_rows": self.failed_rows,
+            "largest_batch": self.largest_batch,
+            "average_batch": (self.rows / self.batches) if self.batches > 0 else 0,
+        }
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                while not self.queue.empty() and len(batch) < self.max_batch_size:
+                    batch.append(self.queue.get_nowait())
+
+                remaining = deadline - loop.time()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+                async with self.progress:
+                    self.completed += len(batch)
+                    self.progress.notify_all()
+
+    async def _commit(self, batch: List[Tuple[Dict[str, Any], Optional[asyncio.Future]]]):
+        try:
+            timestamps = await self._insert([row for row, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self.failed_rows += 1
+                logger.error(f"Error writing message {batch[0][0].get('message_id')}: {str(e)}")
+                self._resolve(batch[0][1], error=e)
+                return
+            # One bad row must not take the rest of the batch down with it
+            logger.warning(f"Batch of {len(batch)} messages failed, retrying row by row: {str(e)}")
+            for item in batch:
+                await self._commit([item])
+            return
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        if self.statistics_cache:
+            for receiver_id, sender_id in {(row["receiver_id"], row["sender_id"]) for row, _ in batch}:
+                self.statistics_cache.invalidate(receiver_id, sender_id)
+        for row, future in batch:
+            self._resolve(future, timestamps[row["message_id"]])
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> Dict[Any, datetime]:
+        """One multi-row `INSERT`, returning the stored timestamp of each message"""
+        async with self.db_client.session_autocommit() as db:
+            result = await db.execute(
+                insert(Message).values(rows).returning(Message.message_id, Message.timestamp)
+            )
+            return dict(result.all())
+
+    @staticmethod
+    def _resolve(future: Optional[asyncio.Future], result: Any = None, error: Optional[Exception] = None):
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
@@ -1,10 +1,123 @@
-from typing import List, Dict, Any, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Dict, Any, Optional, Tuple
 from uuid import UUID
 from sqlalchemy import select, and_, or_, func, text
 from loguru import logger
 
-from app.db.models import Message, User, ManipulativeTechniques, Vulnerabilities
+from app.db.models import Message, ManipulativeTechniques, User, Vulnerabilities
 from app.db.postgres import Postgres
+from app.core.context import get_global_context
+from app.service.statistics_cache import StatisticsKey
+
+# ORDER BY clauses for flagged message lookups; "severity" ranks by the
+# classifier's stored confidence, so no inference is re-run
+MESSAGE_ORDERS = {
+    "recent": "m.timestamp DESC",
+    "severity": "m.confidence DESC NULLS LAST, m.timestamp DESC",
+}
+
+# Columns of a `pair_stats` row as returned by the statistics queries
+PAIR_STATS_COLUMNS = """
+    p.total_messages,
+    p.manipulative_count,
+    p.manipulative_count::float / nullif(p.total_messages, 0) AS manipulative_percentage,
+    p.confidence_sum / nullif(p.confidence_count, 0) AS average_confidence,
+    p.techniques,
+    p.vulnerabilities
+"""
+
+# Every sender who sent the receiver manipulative messages, ranked by
+# manipulative percentage and cut to :max_users, from the rollup
+ALL_STATISTICS = text(f"""
+    SELECT p.sender_id, u.user_name, {PAIR_STATS_COLUMNS}
+    FROM pair_stats p
+    JOIN users u ON u.user_id = p.sender_id
+    WHERE p.receiver_id = :user_id
+    AND p.manipulative_count > 0
+    ORDER BY manipulative_percentage DESC, p.manipulative_count DESC, p.sender_id
+    LIMIT :max_users
+""")
+
+SINGLE_STATISTICS = text(f"""
+    SELECT {PAIR_STATS_COLUMNS}
+    FROM pair_stats p
+    WHERE p.receiver_id = :receiver_id
+    AND p.sender_id = :sender_id
+""")
+
+def _message_order(order_by: str) -> str:
+    """ORDER BY clause for `order_by`, validated before any query runs"""
+    if order_by not in MESSAGE_ORDERS:
+        raise ValueError(f"Unknown order_by '{order_by}', expected one of: {', '.join(MESSAGE_ORDERS)}")
+    return MESSAGE_ORDERS[order_by]
+
+def _label_stats(counts: Dict[str, int], limit: Optional[int], manipulative_count: int) -> List[Dict[str, Any]]:
+    """Most frequent labels of a {label: count} map (all of them if `limit` is None)"""
+    top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return [
+        {
+            "name": name,
+            "count": count,
+            "percentage": (count / manipulative_count) if manipulative_count > 0 else 0
+        }
+        for name, count in top
+    ]
+
+def _pair_statistics(
+    row,
+    person_id: str,
+    person_name: str,
+    max_techniques: int,
+    max_vulnerabilities: int
+) -> Dict[str, Any]:
+    return {
+        "person_id": person_id,
+        "person_name": person_name,
+        "total_messages": row.total_messages,
+        "manipulative_count": row.manipulative_count,
+        "manipulative_percentage": row.manipulative_percentage or 0,
+        # Mean classifier confidence of the flagged messages (severity)
+        "average_confidence": row.average_confidence,
+        "techniques": _label_stats(row.techniques, max_techniques, row.manipulative_count),
+        "vulnerabilities": _label_stats(row.vulnerabilities, max_vulnerabilities, row.manipulative_count)
+    }
+
+async def _cached(key: StatisticsKey, load: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Serve `key` from the application's `StatisticsCache`, running `load` on a
+    miss (or directly when there is no application context, e.g. in scripts)
+    """
+    context = get_global_context()
+    if context is None:
+        return await load()
+    return await context.statistics_cache.get(key, load)
+
+async def _user_name(db_client: Postgres, user_id: UUID) -> Optional[str]:
+    """A user's name from the user directory, or from `users` when there is no application context"""
+    context = get_global_context()
+    if context is not None:
+        user = await context.user_directory.get(user_id)
+        return user.name if user else None
+    async with db_client.session_autocommit() as db:
+        result = await db.execute(select(User.user_name).where(User.user_id == user_id))
+        return result.scalar_one_or_none()
+
+async def rebuild_pair_stats(db_client: Postgres) -> int:
+    """
+    Regenerate the `pair_stats` rollup from `messages`; returns the number of pairs
+    """
+    async with db_client.session_autocommit() as db:
+        result = await db.execute(text("SELECT pair_stats_rebuild()"))
+        return result.scalar_one()
+
+async def rebuild_daily_stats(db_client: Postgres) -> int:
+    """
+    Regenerate the `pair_daily_stats` and `receiver_daily_stats` trend buckets
+    from `messages`; returns the number of (pair, day) buckets
+    """
+    async with db_client.session_autocommit() as db:
+        result = await db.execute(text("SELECT daily_stats_rebuild()"))
+        return result.scalar_one()
 
 async def get_all_statistics(
     db_client: Postgres,
@@ -16,39 +129,19 @@ async def get_all_statistics(
     """
     Get manipulation statistics for all users who have communicated with the specified user
     """
-    try:
-        # First, find all users who have sent MANIPULATIVE messages to the specified user
-        users_query = text("""
-            SELECT DISTINCT sender_id 
-            FROM messages 
-            WHERE receiver_id = :user_id
-            AND is_manipulative = TRUE
-        """)
-        
-        # Execute the query with direct SQL
+    async def load():
         async with db_client.session_autocommit() as db:
-            result = await db.execute(users_query, {"user_id": user_id})
-            sender_ids = [row[0] for row in result.fetchall()]
-        
-        logger.debug(f"Found {len(sender_ids)} users who sent manipulative messages")
+            result = await db.execute(ALL_STATISTICS, {"user_id": user_id, "max_users": max_users})
+            rows = result.fetchall()
         
-        # For each sender, calculate manipulation statistics
-        statistics = []
-        for sender_id in sender_ids:
-            user_stats = await get_single_statistics(
-                db_client, 
-                user_id,  # receiver
-                sender_id,  # sender
-                max_techniques,
-                max_vulnerabilities
-            )
-            
-            if user_stats:
-                statistics.append(user_stats)
-        
-        # Sort by manipulative percentage (highest first) and limit to max_users
-        statistics.sort(key=lambda x: x["manipulative_percentage"], reverse=True)
-        return statistics[:max_users]
+        logger.debug(f"Found {len(rows)} users who sent manipulative messages")
+        return [
+            _pair_statistics(row, str(row.sender_id), row.user_name, max_techniques, max_vulnerabilities)
+            for row in rows
+        ]
+    
+    try:
+        return await _cached(("all", user_id, None, max_users, max_techniques, max_vulnerabilities), load)
     
     except Exception as e:
         logger.error(f"Error getting all statistics: {str(e)}")
@@ -64,111 +157,156 @@ async def get_single_statistics(
     """
     Get manipulation statistics for messages between two specific users
     """
-    try:
+    async def load():
         # Get the selected user's information
+        selected_user_name = await _user_name(db_client, selected_user_id)
+        if selected_user_name is None:
+            logger.error(f"Selected user {selected_user_id} not found")
+            return None
+        
+        # Counters for messages FROM selected_user TO user, kept up to date on write
         async with db_client.session_autocommit() as db:
-            user_stmt = select(User).where(User.user_id == selected_user_id)
-            user_result = await db_client.select(user_stmt)
-            selected_user = user_result.first()
-            
-            if not selected_user:
-                logger.error(f"Selected user {selected_user_id} not found")
-                return None
-            
-            # Extract User from Row if needed
-            if hasattr(selected_user, 'User'):
-                selected_user = selected_user.User
-                
-            # Query to get all messages FROM selected_user TO user
-            messages_stmt = text("""
-                SELECT * FROM messages 
-                WHERE sender_id = :sender_id 
-                AND receiver_id = :receiver_id
-            """)
-            
             result = await db.execute(
-                messages_stmt, 
+                SINGLE_STATISTICS,
                 {"sender_id": selected_user_id, "receiver_id": user_id}
             )
-            messages = result.fetchall()
-            
-            if not messages:
-                logger.info(f"No messages found from {selected_user_id} to {user_id}")
-                return None
-                
-            # Calculate statistics
-            total_messages = len(messages)
-            
-            # Now correctly filter manipulative messages
-            manipulative_messages = [
-                msg for msg in messages 
-                if msg.is_manipulative
-            ]
-            
-            manipulative_count = len(manipulative_messages)
-            manipulative_percentage = (manipulative_count / total_messages) if total_messages > 0 else 0
-            
-            # Calculate techniques statistics
-            techniques_count = {}
-            for msg in manipulative_messages:
-                if msg.techniques:
-                    for technique in msg.techniques:
-                        techniques_count[technique] = techniques_count.get(technique, 0) + 1
-            
-            technique_stats = [
-                {
-                    "name": technique,
-                    "count": count,
-                    "percentage": (count / manipulative_count) if manipulative_count > 0 else 0
-                }
-                for technique, count in techniques_count.items()
-            ]
-            
-            # Sort by count and limit
-            technique_stats.sort(key=lambda x: x["count"], reverse=True)
-            technique_stats = technique_stats[:max_techniques]
-            
-            # Calculate vulnerabilities statistics
-            vulnerabilities_count = {}
-            for msg in manipulative_messages:
-                if hasattr(msg, 'vulnerabilities') and msg.vulnerabilities:
-                    for vulnerability in msg.vulnerabilities:
-                        vulnerabilities_count[vulnerability] = vulnerabilities_count.get(vulnerability, 0) + 1
+            row = result.first()
+        
+        if not row or not row.total_messages:
+            logger.info(f"No messages found from {selected_user_id} to {user_id}")
+            return None
+        
+        return _pair_statistics(
+            row, str(selected_user_id), selected_user_name, max_techniques, max_vulnerabilities
+        )
+    
+    try:
+        return await _cached(("single", user_id, selected_user_id, max_techniques, max_vulnerabilities), load)
+    
+    except Exception as e:
+        logger.error(f"Error getting single statistics: {str(e)}")
+        return None
+
+# Bucket sizes for trends, as `date_trunc` fields (weeks start on Monday)
+TREND_GRANULARITIES = ("day", "week", "month")
+
+# Daily buckets summed into :granularity periods, one row per period with
+# {label: count} maps. Reads `receiver_daily_stats`, or `pair_daily_stats`
+# for a single sender.
+TREND_STATISTICS = """
+    WITH days AS (
+        SELECT date_trunc(:granularity, d.day::timestamp)::date AS period_start, d.*
+        FROM {table} d
+        WHERE d.receiver_id = :user_id
+        {sender_filter}
+        AND d.day BETWEEN :start_date AND :end_date
+    ),
+    totals AS (
+        SELECT period_start,
+               sum(total_messages)::int AS total_messages,
+               sum(manipulative_count)::int AS manipulative_count,
+               sum(confidence_sum) / nullif(sum(confidence_count), 0) AS average_confidence
+        FROM days
+        GROUP BY period_start
+    ),
+    technique_counts AS (
+        SELECT period_start, jsonb_object_agg(name, count) AS techniques
+        FROM (
+            SELECT period_start, t.key AS name, sum(t.value::int) AS count
+            FROM days, jsonb_each_text(days.techniques) AS t
+            GROUP BY period_start, t.key
+        ) labels
+        GROUP BY period_start
+    ),
+    vulnerability_counts AS (
+        SELECT period_start, jsonb_object_agg(name, count) AS vulnerabilities
+        FROM (
+            SELECT period_start, v.key AS name, sum(v.value::int) AS count
+            FROM days, jsonb_each_text(days.vulnerabilities) AS v
+            GROUP BY period_start, v.key
+        ) labels
+        GROUP BY period_start
+    )
+    SELECT t.*, tc.techniques, vc.vulnerabilities
+    FROM totals t
+    LEFT JOIN technique_counts tc USING (period_start)
+    LEFT JOIN vulnerability_counts vc USING (period_start)
+    WHERE t.total_messages > 0
+    ORDER BY t.period_start
+"""
+
+async def get_trend_statistics(
+    db_client: Postgres,
+    user_id: UUID,  # This is the receiver
+    selected_user_id: Optional[UUID] = None,  # Optional sender
+    granularity: str = "week",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> List[Dict[str, Any]]:
+    """
+    Get manipulation counts per day, week or month for messages to the user
+    
+    Args:
+        db_client: Postgres client
+        user_id: UUID of the user requesting statistics (receiver)
+        selected_user_id: Optional UUID of a specific sender to filter by
+        granularity: "day", "week" or "month"
+        start_date: First UTC day to include (default: a year before end_date)
+        end_date: Last UTC day to include (default: today)
+        
+    Returns:
+        Chronological list of periods that have messages, each with its totals
+        and per-technique/per-vulnerability counts
+    """
+    try:
+        if granularity not in TREND_GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}'")
+        end_date = end_date or datetime.now(tz=timezone.utc).date()
+        start_date = start_date or end_date - timedelta(days=365)
+        
+        params = {
+            "user_id": user_id,
+            "granularity": granularity,
+            "start_date": start_date,
+            "end_date": end_date,
+        }
+        if selected_user_id:
+            query = TREND_STATISTICS.format(table="pair_daily_stats", sender_filter="AND d.sender_id = :sender_id")
+            params["sender_id"] = selected_user_id
+        else:
+            query = TREND_STATISTICS.format(table="receiver_daily_stats", sender_filter="")
+        
+        async def load():
+            async with db_client.session_autocommit() as db:
+                result = await db.execute(text(query), params)
+                rows = result.fetchall()
             
-            vulnerability_stats = [
+            return [
                 {
-                    "name": vulnerability,
-                    "count": count,
-                    "percentage": (count / manipulative_count) if manipulative_count > 0 else 0
+                    "period_start": row.period_start.isoformat(),
+                    "total_messages": row.total_messages,
+                    "manipulative_count": row.manipulative_count,
+                    "manipulative_percentage": row.manipulative_count / row.total_messages,
+                    "average_confidence": row.average_confidence,
+                    "techniques": _label_stats(row.techniques or {}, None, row.manipulative_count),
+                    "vulnerabilities": _label_stats(row.vulnerabilities or {}, None, row.manipulative_count)
                 }
-                for vulnerability, count in vulnerabilities_count.items()
+                for row in rows
             ]
-            
-            # Sort by count and limit
-            vulnerability_stats.sort(key=lambda x: x["count"], reverse=True)
-            vulnerability_stats = vulnerability_stats[:max_vulnerabilities]
-            
-            # Create the final statistics object
-            return {
-                "person_id": str(selected_user_id),
-                "person_name": selected_user.user_name,
-                "total_messages": total_messages,
-                "manipulative_count": manipulative_count,
-                "manipulative_percentage": manipulative_percentage,
-                "techniques": technique_stats,
-                "vulnerabilities": vulnerability_stats
-            }
+        
+        return await _cached(("trend", user_id, selected_user_id, granularity, start_date, end_date), load)
     
     except Exception as e:
-        logger.error(f"Error getting single statistics: {str(e)}")
-        return None
+        logger.error(f"Error getting trend statistics: {str(e)}")
+        return []
 
 async def get_messages_by_technique(
     db_client: Postgres,
     user_id: UUID,
     technique: str,
     selected_user_id: Optional[UUID] = None,
-    limit: int = 10
+    limit: int = 10,
+    order_by: str = "recent"
 ) -> List[Dict[str, Any]]:
     """
     Get messages that have been flagged with a specific technique
@@ -179,23 +317,29 @@ async def get_messages_by_technique(
         technique: The manipulation technique to filter by
         selected_user_id: Optional UUID of a specific sender to filter by
         limit: Maximum number of messages to return
+        order_by: "recent" (newest first) or "severity" (highest confidence first)
         
     Returns:
         List of messages with the specified technique
+    
+    Raises:
+        ValueError: If `order_by` is not one of `MESSAGE_ORDERS`
     """
+    order_clause = _message_order(order_by)
     try:
+        
         async with db_client.session_autocommit() as db:
             # Build the query based on parameters
             if selected_user_id:
                 # Get messages from a specific user with the technique
-                query = text("""
-                    SELECT m.message_id, m.content, m.timestamp, m.techniques, m.vulnerabilities
+                query = text(f"""
+                    SELECT m.message_id, m.content, m.timestamp, m.techniques, m.vulnerabilities, m.confidence
                     FROM messages m
                     WHERE m.receiver_id = :user_id
                       AND m.sender_id = :sender_id
                       AND m.is_manipulative = TRUE
                       AND :technique = ANY(m.techniques)
-                    ORDER BY m.timestamp DESC
+                    ORDER BY {order_clause}
                     LIMIT :limit
                 """)
                 params = {
@@ -206,13 +350,13 @@ async def get_messages_by_technique(
                 }
             else:
                 # Get messages from any user with the technique
-                query = text("""
-                    SELECT m.message_id, m.content, m.timestamp, m.techniques, m.vulnerabilities
+                query = text(f"""
+                    SELECT m.message_id, m.content, m.timestamp, m.techniques, m.vulnerabilities, m.confidence
                     FROM messages m
                     WHERE m.receiver_id = :user_id
                       AND m.is_manipulative = TRUE
                       AND :technique = ANY(m.techniques)
-                    ORDER BY m.timestamp DESC
+                    ORDER BY {order_clause}
                     LIMIT :limit
                 """)
                 params = {
@@ -233,7 +377,8 @@ async def get_messages_by_technique(
                     "content": msg.content,
                     "timestamp": msg.timestamp.isoformat(),
                     "techniques": list(msg.techniques) if msg.techniques else None,
-                    "vulnerabilities": list(msg.vulnerabilities) if msg.vulnerabilities else None
+                    "vulnerabilities": list(msg.vulnerabilities) if msg.vulnerabilities else None,
+                    "confidence": msg.confidence
                 })
             
             return formatted_messages
@@ -247,7 +392,8 @@ async def get_messages_by_vulnerability(
     user_id: UUID,
     vulnerability: str,
     selected_user_id: Optional[UUID] = None,
-    limit: int = 10
+    limit: int = 10,
+    order_by: str = "recent"
 ) -> List[Dict[str, Any]]:
     """
     Get messages that have been flagged with a specific vulnerability
@@ -258,23 +404,29 @@ async def get_messages_by_vulnerability(
         vulnerability: The vulnerability to filter by
         selected_user_id: Optional UUID of a specific sender to filter by
         limit: Maximum number of messages to return
+        order_by: "recent" (newest first) or "severity" (highest confidence first)
         
     Returns:
         List of messages with the specified vulnerability
+    
+    Raises:
+        ValueError: If `order_by` is not one of `MESSAGE_ORDERS`
     """
+    order_clause = _message_order(order_by)
     try:
+        
         async with db_client.session_autocommit() as db:
             # Build the query based on parameters
             if selected_user_id:
                 # Get messages from a specific user with the vulnerability
-                query = text("""
-                    SELECT m.message_id, m.content, m.timestamp, m.techniques, m.vulnerabilities
+                query = text(f"""
+                    SELECT m.message_id, m.content, m.timestamp, m.techniques, m.vulnerabilities, m.confidence
                     FROM messages m
                     WHERE m.receiver_id = :user_id
                       AND m.sender_id = :sender_id
                       AND m.is_manipulative = TRUE
                       AND :vulnerability = ANY(m.vulnerabilities)
-                    ORDER BY m.timestamp DESC
+                    ORDER BY {order_clause}
                     LIMIT :limit
                 """)
                 params = {
@@ -285,13 +437,13 @@ async def get_messages_by_vulnerability(
                 }
             else:
                 # Get messages from any user with the vulnerability
-                query = text("""
-                    SELECT m.message_id, m.content, m.timestamp, m.techniques, m.vulnerabilities
+                query = text(f"""
+                    SELECT m.message_id, m.content, m.timestamp, m.techniques, m.vulnerabilities, m.confidence
                     FROM messages m
                     WHERE m.receiver_id = :user_id
                       AND m.is_manipulative = TRUE
                       AND :vulnerability = ANY(m.vulnerabilities)
-                    ORDER BY m.timestamp DESC
+                    ORDER BY {order_clause}
                     LIMIT :limit
                 """)
                 params = {
@@ -312,7 +464,8 @@ async def get_messages_by_vulnerability(
                     "content": msg.content,
                     "timestamp": msg.timestamp.isoformat(),
                     "techniques": list(msg.techniques) if msg.techniques else None,
-                    "vulnerabilities": list(msg.vulnerabilities) if msg.vulnerabilities else None
+                    "vulnerabilities": list(msg.vulnerabilities) if msg.vulnerabilities else None,
+                    "confidence": msg.confidence
                 })
             
             return formatted_messages
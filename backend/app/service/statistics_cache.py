@@ -0,0 +1,148 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set, Tuple, Union
+from uuid import UUID
+
+# (kind, receiver_id, sender_id or None, *parameters)
+StatisticsKey = Tuple[Hashable, ...]
+
+
+class StatisticsCache:
+    """In-process cache of statistics results.
+
+    Keys are `(kind, receiver_id, sender_id, *parameters)` tuples, with
+    `sender_id` None for results covering every sender. Entries expire after
+    `ttl_seconds` and the least recently used ones are evicted beyond
+    `max_size`. Concurrent requests for a key that is already being loaded
+    wait for that load instead of running their own query; failed loads are
+    not cached. Cached values are shared, so callers must not modify them:
+    ```
+    key = ("single", receiver_id, sender_id, max_techniques, max_vulnerabilities)
+    statistics = await statistics_cache.get(key, lambda: query(...))
+    ```
+    Call `invalidate(receiver_id, sender_id)` whenever a message from
+    `sender_id` to `receiver_id` is written or relabelled. Writes made by
+    other processes (other workers, imports) are only seen once entries expire.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 60.0) -> None:
+        self.max_size = max(0, max_size)
+        self.ttl = max(0.0, ttl_seconds)
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.invalidations = 0
+
+        self._entries: OrderedDict[StatisticsKey, Tuple[Any, float]] = OrderedDict()
+        self._inflight: Dict[StatisticsKey, asyncio.Task] = {}
+        # Cached keys per receiver, so invalidation does not scan every entry
+        self._by_receiver: Dict[UUID, Set[StatisticsKey]] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, key: StatisticsKey, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value of `key`, calling `load` on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        if entry is not None:
+            self._remove(key)
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self._start(key, load)
+        # The load runs in its own task and every caller, the first one
+        # included, waits through a shield: a cancelled caller leaves it
+        # running for the others
+        return await asyncio.shield(task)
+
+    def invalidate(
+        self,
+        receiver_id: Union[UUID, str, None] = None,
+        sender_id: Union[UUID, str, None] = None
+    ):
+        """
+        Forget the results a message from `sender_id` to `receiver_id` can
+        change: that pair's and the receiver's all-senders results (every
+        sender's when `sender_id` is None, everything when `receiver_id` is None)
+        """
+        self.invalidations += 1
+        if receiver_id is None:
+            self._entries.clear()
+            self._by_receiver.clear()
+            self._inflight.clear()
+            return
+
+        receiver_id = UUID(str(receiver_id))
+        sender_id = UUID(str(sender_id)) if sender_id is not None else None
+
+        def affected(key: StatisticsKey) -> bool:
+            return key[2] is None or sender_id is None or key[2] == sender_id
+
+        for key in [key for key in self._by_receiver.get(receiver_id, ()) if affected(key)]:
+            self._remove(key)
+        # Loads already running may have read the old rows: let them finish
+        # for their callers, but make later callers start a fresh one
+        for key in [key for key in self._inflight if key[1] == receiver_id and affected(key)]:
+            del self._inflight[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "loads": self.loads,
+            "invalidations": self.invalidations,
+            "hit_rate": (self.hits / lookups) if lookups > 0 else 0,
+        }
+
+    def _start(self, key: StatisticsKey, load: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        self.loads += 1
+        task = asyncio.create_task(self._load(key, load))
+        # Retrieve the error even if every caller was cancelled meanwhile
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self._inflight[key] = task
+        return task
+
+    async def _load(self, key: StatisticsKey, load: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await load()
+        finally:
+            current = self._inflight.get(key) is asyncio.current_task()
+            if current:
+                del self._inflight[key]
+
+        # Not stored if the key was invalidated while loading
+        if current:
+            self._store(key, value)
+        return value
+
+    def _store(self, key: StatisticsKey, value: Any):
+        if self.max_size == 0:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        self._by_receiver.setdefault(key[1], set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: StatisticsKey):
+        self._entries.pop(key, None)
+        keys = self._by_receiver.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_receiver[key[1]]
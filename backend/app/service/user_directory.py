@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple, Union
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import select
+
+from app.db.models import User
+from app.db.postgres import Postgres
+
+
+@dataclass(frozen=True)
+class UserInfo:
+    user_id: UUID
+    name: str
+    email: str
+
+
+class UserDirectory:
+    """In-process cache of `user_id -> (name, email)`.
+
+    Entries expire after `ttl_seconds` and the least recently used ones are
+    evicted beyond `max_size`. Misses of one `get_many` call are loaded with
+    a single `SELECT ... WHERE user_id IN (...)`, and concurrent lookups of a
+    user that is already being loaded wait for that query instead of issuing
+    their own. Unknown users are not cached.
+    ```
+    users = await user_directory.get_many([sender_id, receiver_id])
+    sender = users.get(sender_id)  # None if the user does not exist
+    ```
+    Call `put` or `invalidate` whenever a user row is written.
+    """
+
+    def __init__(self, db_client: Postgres, max_size: int = 10000, ttl_seconds: float = 300.0) -> None:
+        self.db_client = db_client
+        self.max_size = max(0, max_size)
+        self.ttl = max(0.0, ttl_seconds)
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.queries = 0
+
+        self._entries: OrderedDict[UUID, Tuple[UserInfo, float]] = OrderedDict()
+        self._inflight: Dict[UUID, asyncio.Task] = {}
+        # Bumped by every invalidation so that lookups already in flight
+        # do not cache what they read before it
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, user_id: Union[UUID, str]) -> Optional[UserInfo]:
+        user_id = UUID(str(user_id))
+        return (await self.get_many([user_id])).get(user_id)
+
+    async def get_many(self, user_ids: Iterable[Union[UUID, str]]) -> Dict[UUID, UserInfo]:
+        """Look up several users at once; users that do not exist are left out"""
+        found: Dict[UUID, UserInfo] = {}
+        waiting: Dict[UUID, asyncio.Task] = {}
+        missing = []
+
+        now = time.monotonic()
+        for user_id in dict.fromkeys(UUID(str(user_id)) for user_id in user_ids):
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                found[user_id] = entry[0]
+                continue
+
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            if user_id in self._inflight:
+                self.coalesced += 1
+                waiting[user_id] = self._inflight[user_id]
+            else:
+                missing.append(user_id)
+
+        if missing:
+            task = self._start(missing)
+            waiting.update((user_id, task) for user_id in missing)
+
+        if waiting:
+            # Lookups run in their own tasks and are awaited through a shield,
+            # so a cancelled caller leaves them running for the other callers
+            tasks = list(dict.fromkeys(waiting.values()))
+            results = dict(zip(tasks, await asyncio.gather(*(asyncio.shield(task) for task in tasks))))
+            for user_id, task in waiting.items():
+                user = results[task].get(user_id)
+                if user is not None:
+                    found[user_id] = user
+
+        return found
+
+    def put(self, user_id: Union[UUID, str], name: str, email: str):
+        """Store (or replace) a user's entry, e.g. right after signup"""
+        user_id = UUID(str(user_id))
+        self._generation += 1
+        self._store(UserInfo(user_id, name, email))
+
+    def invalidate(self, user_id: Union[UUID, str, None] = None):
+        """Forget one user, or every user when `user_id` is None"""
+        self._generation += 1
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(UUID(str(user_id)), None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "queries": self.queries,
+            "hit_rate": (self.hits / lookups) if lookups > 0 else 0,
+        }
+
+    def _start(self, user_ids) -> asyncio.Task:
+        task = asyncio.create_task(self._load(user_ids))
+        # Retrieve the error even if every caller was cancelled meanwhile
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self._inflight.update((user_id, task) for user_id in user_ids)
+        return task
+
+    async def _load(self, user_ids) -> Dict[UUID, UserInfo]:
+        generation = self._generation
+
+        try:
+            self.queries += 1
+            stmt = select(User.user_id, User.user_name, User.user_email).where(User.user_id.in_(user_ids))
+            result = await self.db_client.select(stmt)
+            users = {row.user_id: UserInfo(row.user_id, row.user_name, row.user_email) for row in result.all()}
+        except Exception as e:
+            logger.error(f"Error loading {len(user_ids)} users: {str(e)}")
+            raise
+        finally:
+            task = asyncio.current_task()
+            for user_id in user_ids:
+                if self._inflight.get(user_id) is task:
+                    del self._inflight[user_id]
+
+        if generation == self._generation:
+            for user in users.values():
+                self._store(user)
+        return users
+
+    def _store(self, user: UserInfo):
+        if self.max_size == 0:
+            return
+        self._entries[user.user_id] = (user, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user.user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
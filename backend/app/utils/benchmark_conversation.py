@@ -0,0 +1,154 @@
+"""Measure `get_conversation` latency for short and long histories.
+
+Two throwaway users exchange `--messages` messages, then the conversation
+is loaded with each `--limits` value. Every load is repeated `--repeat`
+times; the median and p95 latency and the number of SQL statements per
+call are reported. Finally the whole history is paged backwards with
+`before` cursors, comparing the latency of the newest and oldest pages.
+The throwaway users and messages are removed afterwards.
+```
+python app/utils/benchmark_conversation.py --messages 5000 --limits 50 500 5000 --page-size 50
+```
+"""
+import argparse
+import asyncio
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy import delete, event, or_
+
+load_dotenv()
+
+# Add parent directory to path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.models import Message, User
+from app.db.postgres import ConnParams, Postgres
+from app.service.chat_service import decode_cursor, get_conversation
+
+
+async def seed_conversation(db_client: Postgres, message_count: int):
+    users = [
+        dict(
+            user_id=uuid4(),
+            user_email=f"benchmark-{uuid4()}@example.com",
+            user_name=f"Benchmark {i}",
+            user_password="benchmark",
+        )
+        for i in range(2)
+    ]
+    await db_client.bulk_insert(User, users)
+
+    started = datetime.now(tz=timezone.utc) - timedelta(seconds=message_count)
+    messages = [
+        dict(
+            message_id=uuid4(),
+            sender_id=users[i % 2]["user_id"],
+            receiver_id=users[(i + 1) % 2]["user_id"],
+            content=f"Benchmark message {i}",
+            timestamp=started + timedelta(seconds=i),
+            is_manipulative=i % 5 == 0,
+            techniques=["Intimidation"] if i % 5 == 0 else None,
+            vulnerabilities=["Dependency"] if i % 5 == 0 else None,
+        )
+        for i in range(message_count)
+    ]
+    await db_client.bulk_copy(Message, messages, list(messages[0]) if messages else None)
+
+    return users[0]["user_id"], users[1]["user_id"]
+
+
+async def remove_conversation(db_client: Postgres, user_ids):
+    async with db_client.session_autocommit() as db:
+        await db.execute(delete(Message).where(
+            or_(Message.sender_id.in_(user_ids), Message.receiver_id.in_(user_ids))
+        ))
+        await db.execute(delete(User).where(User.user_id.in_(user_ids)))
+
+
+async def page_through(db_client: Postgres, user_id, other_user_id, page_size: int):
+    """Latency of every `before`-cursor page, newest page first"""
+    latencies = []
+    before = None
+    while True:
+        started = time.perf_counter()
+        page = await get_conversation(db_client, user_id, other_user_id, page_size, before=before)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if not page:
+            return latencies[:-1]
+        before = decode_cursor(page[0]["cursor"])
+
+
+async def benchmark_conversation(db_params: ConnParams, message_count: int, limits, repeat: int, page_size: int):
+    async with Postgres.init(**db_params) as db_client:
+        statements = 0
+
+        def count_statement(*args):
+            nonlocal statements
+            statements += 1
+
+        event.listen(db_client.engine.sync_engine, "before_cursor_execute", count_statement)
+
+        user_id, other_user_id = await seed_conversation(db_client, message_count)
+        try:
+            # Warm up the connection pool and statement cache
+            await get_conversation(db_client, user_id, other_user_id, 1)
+
+            for limit in limits:
+                latencies = []
+                statements = 0
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    messages = await get_conversation(db_client, user_id, other_user_id, limit)
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+                latencies.sort()
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                logger.info(
+                    f"limit={limit}: {len(messages)} messages, median {statistics.median(latencies):.1f}ms, "
+                    f"p95 {p95:.1f}ms, {statements / repeat:.0f} SQL statements per call"
+                )
+
+            latencies = await page_through(db_client, user_id, other_user_id, page_size)
+            edge = max(1, len(latencies) // 10)
+            logger.info(
+                f"{len(latencies)} pages of {page_size}: newest pages median "
+                f"{statistics.median(latencies[:edge]):.1f}ms, oldest pages median "
+                f"{statistics.median(latencies[-edge:]):.1f}ms"
+            )
+        finally:
+            await remove_conversation(db_client, [user_id, other_user_id])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark conversation loading")
+    parser.add_argument("--messages", type=int, default=5000, help="Messages in the seeded conversation")
+    parser.add_argument("--limits", type=int, nargs="+", default=[50, 500, 5000], help="History sizes to load")
+    parser.add_argument("--repeat", type=int, default=20, help="Loads per history size")
+    parser.add_argument("--page-size", type=int, default=50, help="Messages per page when paging the history")
+    args = parser.parse_args()
+
+    # Set environment variables if not already set
+    if "POSTGRES_HOST" not in os.environ:
+        raise ValueError("Environment variables are not set")
+
+    db_params = ConnParams(
+        db_user=os.environ["POSTGRES_USER"],
+        db_pass=os.environ["POSTGRES_PASS"],
+        db_host=os.environ["POSTGRES_HOST"],
+        db_name=os.environ["POSTGRES_DB"],
+        db_port=int(os.environ["POSTGRES_PORT"]),
+    )
+
+    # Set the proper event loop policy for Windows to work with psycopg
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(benchmark_conversation(db_params, args.messages, args.limits, max(1, args.repeat), max(1, args.page_size)))
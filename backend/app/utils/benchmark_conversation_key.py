@@ -0,0 +1,219 @@
+"""EXPLAIN the conversation query before and after `conversation_key`.
+
+A throwaway `benchmark_messages` table is filled with `--rows` synthetic
+messages between `--users` users, `--conversation` of them exchanged by one
+pair. The newest page and a page `--depth` messages deep are then loaded
+from that conversation with each query shape the service has used, after
+creating the indexes that shape relies on:
+
+- `or`: `(sender, receiver) OR (receiver, sender)`, single-column indexes
+- `union`: one branch per direction, `(sender_id, receiver_id, timestamp, message_id)`
+- `conversation_key`: one range scan, `(conversation_key, timestamp DESC, message_id DESC)`
+
+Each query runs under `EXPLAIN (ANALYZE, BUFFERS)` `--repeat` times; the
+median execution time, buffers touched and plan nodes are reported. The
+table is dropped afterwards.
+```
+python app/utils/benchmark_conversation_key.py --rows 1000000 --conversation 100000
+```
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy import text
+
+load_dotenv()
+
+# Add parent directory to path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.postgres import ConnParams, Postgres
+
+# Users are `md5('user' || n)::uuid`; the benchmarked pair is users 1 and 2
+CREATE_TABLE = """
+    CREATE UNLOGGED TABLE benchmark_messages AS
+    SELECT
+        gen_random_uuid() AS message_id,
+        s.sender_id,
+        s.receiver_id,
+        md5(least(s.sender_id, s.receiver_id)::text || ':' || greatest(s.sender_id, s.receiver_id)::text)::uuid
+            AS conversation_key,
+        'Benchmark message ' || s.n AS content,
+        now() - s.n * interval '1 second' AS "timestamp",
+        s.n % 5 = 0 AS is_manipulative
+    FROM (
+        SELECT
+            n,
+            CASE WHEN n <= :conversation THEN md5('user' || (1 + n % 2))::uuid
+                 ELSE md5('user' || (1 + floor(random() * :users)::int))::uuid END AS sender_id,
+            CASE WHEN n <= :conversation THEN md5('user' || (2 - n % 2))::uuid
+                 ELSE md5('user' || (1 + floor(random() * :users)::int))::uuid END AS receiver_id
+        FROM generate_series(1, :rows) AS n
+    ) s
+"""
+
+COLUMNS = "message_id, sender_id, content, \"timestamp\", is_manipulative"
+
+QUERIES = {
+    "or": (
+        [
+            "CREATE INDEX ON benchmark_messages (sender_id)",
+            "CREATE INDEX ON benchmark_messages (receiver_id)",
+        ],
+        f"""
+        SELECT {COLUMNS} FROM benchmark_messages
+        WHERE ((sender_id = :a AND receiver_id = :b) OR (sender_id = :b AND receiver_id = :a))
+          AND ("timestamp", message_id) < (:before_timestamp, :before_id)
+        ORDER BY "timestamp" DESC, message_id DESC
+        LIMIT :limit
+        """,
+    ),
+    "union": (
+        ["CREATE INDEX ON benchmark_messages (sender_id, receiver_id, \"timestamp\", message_id)"],
+        f"""
+        SELECT * FROM (
+            (SELECT {COLUMNS} FROM benchmark_messages
+             WHERE sender_id = :a AND receiver_id = :b
+               AND ("timestamp", message_id) < (:before_timestamp, :before_id)
+             ORDER BY "timestamp" DESC, message_id DESC LIMIT :limit)
+            UNION ALL
+            (SELECT {COLUMNS} FROM benchmark_messages
+             WHERE sender_id = :b AND receiver_id = :a
+               AND ("timestamp", message_id) < (:before_timestamp, :before_id)
+             ORDER BY "timestamp" DESC, message_id DESC LIMIT :limit)
+        ) page
+        ORDER BY "timestamp" DESC, message_id DESC
+        LIMIT :limit
+        """,
+    ),
+    "conversation_key": (
+        ["CREATE INDEX ON benchmark_messages (conversation_key, \"timestamp\" DESC, message_id DESC)"],
+        f"""
+        SELECT {COLUMNS} FROM benchmark_messages
+        WHERE conversation_key = :key
+          AND ("timestamp", message_id) < (:before_timestamp, :before_id)
+        ORDER BY "timestamp" DESC, message_id DESC
+        LIMIT :limit
+        """,
+    ),
+}
+
+
+def plan_nodes(plan):
+    """Node types of a JSON plan, depth first, with the index each scan uses"""
+    node = plan["Node Type"]
+    if "Index Name" in plan:
+        node += f" ({plan['Index Name']})"
+    nodes = [node]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+async def explain(db, query: str, params, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        result = await db.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}"), params)
+        report = result.scalar()
+        if isinstance(report, str):
+            report = json.loads(report)
+        report = report[0]
+        timings.append(report["Execution Time"])
+
+    plan = report["Plan"]
+    buffers = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    return statistics.median(timings), buffers, plan_nodes(plan)
+
+
+async def benchmark_conversation_key(
+    db_params: ConnParams, rows: int, users: int, conversation: int, depth: int, limit: int, repeat: int
+):
+    async with Postgres.init(**db_params) as db_client:
+        async with db_client.session_autocommit() as db:
+            await db.execute(text("DROP TABLE IF EXISTS benchmark_messages"))
+
+            started = time.perf_counter()
+            await db.execute(text(CREATE_TABLE), dict(rows=rows, users=users, conversation=conversation))
+            logger.info(f"Created {rows} synthetic messages in {time.perf_counter() - started:.1f}s")
+
+            pair = await db.execute(text(
+                "SELECT md5('user1')::uuid, md5('user2')::uuid, "
+                "md5(least(md5('user1')::uuid, md5('user2')::uuid)::text || ':' || "
+                "greatest(md5('user1')::uuid, md5('user2')::uuid)::text)::uuid"
+            ))
+            a, b, key = pair.one()
+
+            # Cursor of the newest message (newest page) and of one `depth` messages back
+            pages = {}
+            for name, offset in [("newest", 0), (f"depth {depth}", min(depth, conversation - 1))]:
+                cursor = await db.execute(text(
+                    "SELECT \"timestamp\", message_id FROM benchmark_messages WHERE conversation_key = :key "
+                    "ORDER BY \"timestamp\" DESC, message_id DESC OFFSET :offset LIMIT 1"
+                ), dict(key=key, offset=offset))
+                pages[name] = cursor.one()
+
+            try:
+                for name, (indexes, query) in QUERIES.items():
+                    started = time.perf_counter()
+                    for index in indexes:
+                        await db.execute(text(index))
+                    await db.execute(text("ANALYZE benchmark_messages"))
+                    logger.info(f"[{name}] indexes built in {time.perf_counter() - started:.1f}s")
+
+                    for page, (before_timestamp, before_id) in pages.items():
+                        params = dict(
+                            a=a, b=b, key=key, limit=limit,
+                            before_timestamp=before_timestamp, before_id=before_id,
+                        )
+                        median, buffers, nodes = await explain(db, query, params, repeat)
+                        logger.info(
+                            f"[{name}] {page} page: median {median:.2f}ms, {buffers} buffers, "
+                            f"plan {' > '.join(nodes)}"
+                        )
+            finally:
+                await db.execute(text("DROP TABLE benchmark_messages"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN conversation queries on a synthetic table")
+    parser.add_argument("--rows", type=int, default=1000000, help="Synthetic messages in total")
+    parser.add_argument("--users", type=int, default=2000, help="Users exchanging the other messages")
+    parser.add_argument("--conversation", type=int, default=100000, help="Messages in the benchmarked conversation")
+    parser.add_argument("--depth", type=int, default=50000, help="Messages back for the deep page")
+    parser.add_argument("--limit", type=int, default=50, help="Messages per page")
+    parser.add_argument("--repeat", type=int, default=10, help="EXPLAIN ANALYZE runs per query")
+    args = parser.parse_args()
+
+    # Set environment variables if not already set
+    if "POSTGRES_HOST" not in os.environ:
+        raise ValueError("Environment variables are not set")
+
+    db_params = ConnParams(
+        db_user=os.environ["POSTGRES_USER"],
+        db_pass=os.environ["POSTGRES_PASS"],
+        db_host=os.environ["POSTGRES_HOST"],
+        db_name=os.environ["POSTGRES_DB"],
+        db_port=int(os.environ["POSTGRES_PORT"]),
+    )
+
+    # Set the proper event loop policy for Windows to work with psycopg
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(benchmark_conversation_key(
+        db_params,
+        max(1, args.rows),
+        max(2, args.users),
+        max(1, min(args.conversation, args.rows)),
+        max(0, args.depth),
+        max(1, args.limit),
+        max(1, args.repeat),
+    ))
@@ -0,0 +1,144 @@
+"""Compare per-message commits with the `MessageWriter` under load.
+
+`--producers` concurrent tasks (standing in for WebSocket connections)
+each save `--messages` messages between two throwaway users, first with
+one transaction per message (as `save_message` does by default) and then
+through a `MessageWriter`. Throughput, commits and the
+median / p95 time until a message is acknowledged are reported; the
+throwaway users and messages are removed afterwards.
+```
+python app/utils/benchmark_message_writer.py --producers 200 --messages 20
+```
+"""
+import argparse
+import asyncio
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy import delete, or_
+
+load_dotenv()
+
+# Add parent directory to path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.models import Message, User
+from app.db.postgres import ConnParams, Postgres
+from app.service.message_writer import MessageWriter
+
+
+def message_row(sender_id, receiver_id, i: int):
+    return dict(
+        message_id=uuid4(),
+        sender_id=sender_id,
+        receiver_id=receiver_id,
+        content=f"Benchmark message {i}",
+        timestamp=datetime.now(tz=timezone.utc),
+        is_manipulative=False,
+        techniques=None,
+        vulnerabilities=None,
+        confidence=None,
+    )
+
+
+async def run_producers(save, user_ids, producers: int, messages: int):
+    latencies = []
+
+    async def produce(p: int):
+        for i in range(messages):
+            row = message_row(user_ids[p % 2], user_ids[(p + 1) % 2], i)
+            started = time.perf_counter()
+            await save(row)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(produce(p) for p in range(producers)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return elapsed, statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+async def benchmark_message_writer(
+    db_params: ConnParams, producers: int, messages: int, batch_size: int, wait_ms: float, pool_size: int
+):
+    async with Postgres.init(pool_size=pool_size, **db_params) as db_client:
+        users = [
+            dict(
+                user_id=uuid4(),
+                user_email=f"benchmark-{uuid4()}@example.com",
+                user_name=f"Benchmark {i}",
+                user_password="benchmark",
+            )
+            for i in range(2)
+        ]
+        await db_client.bulk_insert(User, users)
+        user_ids = [user["user_id"] for user in users]
+        total = producers * messages
+
+        try:
+            async def save_directly(row):
+                await db_client.insert([Message(**row)])
+
+            elapsed, median, p95 = await run_producers(save_directly, user_ids, producers, messages)
+            logger.info(
+                f"direct: {total} messages in {elapsed:.2f}s ({total / elapsed:.0f} msgs/sec), "
+                f"{total} commits, ack median {median:.1f}ms, p95 {p95:.1f}ms"
+            )
+
+            writer = MessageWriter(db_client, max_batch_size=batch_size, max_wait_ms=wait_ms)
+            await writer.start()
+            try:
+                elapsed, median, p95 = await run_producers(writer.write, user_ids, producers, messages)
+            finally:
+                await writer.stop()
+            stats = writer.stats()
+            logger.info(
+                f"writer: {total} messages in {elapsed:.2f}s ({total / elapsed:.0f} msgs/sec), "
+                f"{stats['batches']} commits (average batch {stats['average_batch']:.1f}), "
+                f"ack median {median:.1f}ms, p95 {p95:.1f}ms"
+            )
+        finally:
+            async with db_client.session_autocommit() as db:
+                await db.execute(delete(Message).where(
+                    or_(Message.sender_id.in_(user_ids), Message.receiver_id.in_(user_ids))
+                ))
+                await db.execute(delete(User).where(User.user_id.in_(user_ids)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batched message writes")
+    parser.add_argument("--producers", type=int, default=200, help="Concurrent senders")
+    parser.add_argument("--messages", type=int, default=20, help="Messages per sender")
+    parser.add_argument("--batch-size", type=int, default=500, help="MessageWriter max batch size")
+    parser.add_argument("--wait-ms", type=float, default=5.0, help="MessageWriter max wait")
+    parser.add_argument("--pool-size", type=int, default=50, help="Database connection pool size")
+    args = parser.parse_args()
+
+    # Set environment variables if not already set
+    if "POSTGRES_HOST" not in os.environ:
+        raise ValueError("Environment variables are not set")
+
+    db_params = ConnParams(
+        db_user=os.environ["POSTGRES_USER"],
+        db_pass=os.environ["POSTGRES_PASS"],
+        db_host=os.environ["POSTGRES_HOST"],
+        db_name=os.environ["POSTGRES_DB"],
+        db_port=int(os.environ["POSTGRES_PORT"]),
+    )
+
+    # Set the proper event loop policy for Windows to work with psycopg
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(benchmark_message_writer(
+        db_params, max(1, args.producers), max(1, args.messages), max(1, args.batch_size), max(0.0, args.wait_ms),
+        max(1, args.pool_size)
+    ))
@@ -0,0 +1,147 @@
+"""Bulk load messages with `Postgres.bulk_copy` (binary COPY).
+
+Import a historical chat log, a CSV with `sender_id`, `receiver_id`,
+`content` and `timestamp` (ISO 8601) columns and an optional `message_id`.
+Both users must already exist; imported messages are stored unclassified,
+so run `reclassify_messages.py` afterwards:
+```
+python app/utils/import_messages.py --csv chat_log.csv
+```
+Or seed a benchmark dataset of synthetic users and messages:
+```
+python app/utils/import_messages.py --synthetic 10000000 --users 1000
+```
+"""
+import argparse
+import asyncio
+import csv
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# Add parent directory to path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.models import Message, User
+from app.db.postgres import ConnParams, Postgres
+
+MESSAGE_COLUMNS = [
+    "message_id", "sender_id", "receiver_id", "content", "timestamp",
+    "is_manipulative", "techniques", "vulnerabilities", "confidence",
+]
+
+
+async def csv_messages(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            timestamp = datetime.fromisoformat(row["timestamp"])
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            yield (
+                UUID(row["message_id"]) if row.get("message_id") else uuid4(),
+                UUID(row["sender_id"]),
+                UUID(row["receiver_id"]),
+                row["content"],
+                timestamp,
+                False,
+                None,
+                None,
+                None,
+            )
+
+
+async def synthetic_messages(user_ids, count: int, seed: int):
+    rng = random.Random(seed)
+    started = datetime.now(tz=timezone.utc) - timedelta(seconds=count)
+    for i in range(count):
+        sender_id, receiver_id = rng.sample(user_ids, 2)
+        is_manipulative = rng.random() < 0.2
+        yield (
+            uuid4(),
+            sender_id,
+            receiver_id,
+            f"Synthetic message {i}",
+            started + timedelta(seconds=i),
+            is_manipulative,
+            ["Intimidation"] if is_manipulative else None,
+            ["Dependency"] if is_manipulative else None,
+            rng.uniform(0.5, 1.0) if is_manipulative else None,
+        )
+
+
+async def import_messages(db_params: ConnParams, csv_path, synthetic: int, users: int, chunk_size: int, seed: int):
+    async with Postgres.init(**db_params) as db_client:
+        started = time.perf_counter()
+
+        def report(copied: int):
+            elapsed = time.perf_counter() - started
+            logger.info(f"{copied} messages copied ({copied / elapsed:.0f} rows/sec)")
+
+        if csv_path:
+            rows = csv_messages(csv_path)
+        else:
+            run = uuid4().hex[:8]
+            user_rows = [
+                dict(
+                    user_id=uuid4(),
+                    user_email=f"synthetic-{run}-{i}@example.com",
+                    user_name=f"Synthetic {i}",
+                    user_password="synthetic",
+                )
+                for i in range(users)
+            ]
+            await db_client.bulk_copy(User, user_rows)
+            logger.info(f"Created {users} synthetic users")
+            rows = synthetic_messages([user["user_id"] for user in user_rows], synthetic, seed)
+
+        copied = await db_client.bulk_copy(Message, rows, MESSAGE_COLUMNS, chunk_size=chunk_size, progress=report)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Import finished: {copied} messages in {elapsed:.1f}s "
+            f"({copied / elapsed if elapsed > 0 else 0:.0f} rows/sec)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load messages with COPY")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="Chat log CSV to import")
+    source.add_argument("--synthetic", type=int, help="Number of synthetic messages to generate")
+    parser.add_argument("--users", type=int, default=1000, help="Synthetic users to create with --synthetic")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per COPY transaction")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for --synthetic")
+    args = parser.parse_args()
+
+    # Set environment variables if not already set
+    if "POSTGRES_HOST" not in os.environ:
+        raise ValueError("Environment variables are not set")
+
+    db_params = ConnParams(
+        db_user=os.environ["POSTGRES_USER"],
+        db_pass=os.environ["POSTGRES_PASS"],
+        db_host=os.environ["POSTGRES_HOST"],
+        db_name=os.environ["POSTGRES_DB"],
+        db_port=int(os.environ["POSTGRES_PORT"]),
+    )
+
+    # Set the proper event loop policy for Windows to work with psycopg
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(import_messages(
+        db_params,
+        args.csv,
+        max(0, args.synthetic or 0),
+        max(2, args.users),
+        max(1, args.chunk_size),
+        args.seed,
+    ))
@@ -0,0 +1,62 @@
+"""Regenerate the statistics rollups (`pair_stats` and the daily trend
+buckets in `pair_daily_stats` / `receiver_daily_stats`) from `messages`.
+
+Triggers keep the rollups current on every insert, relabel and delete, so
+this is only needed to repair them (e.g. after loading data with triggers
+disabled or restoring `messages` on its own). Writers to `messages` wait
+while it runs:
+```
+python app/utils/rebuild_pair_stats.py
+```
+"""
+import argparse
+import asyncio
+import os
+import platform
+import sys
+import time
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# Add parent directory to path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.postgres import ConnParams, Postgres
+from app.service.statistics import rebuild_daily_stats, rebuild_pair_stats
+
+
+async def rebuild(db_params: ConnParams):
+    async with Postgres.init(**db_params) as db_client:
+        started = time.perf_counter()
+        pairs = await rebuild_pair_stats(db_client)
+        logger.info(f"Rebuilt pair_stats: {pairs} sender/receiver pairs in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        buckets = await rebuild_daily_stats(db_client)
+        logger.info(f"Rebuilt daily stats: {buckets} sender/receiver days in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the pair_stats and daily trend rollups")
+    parser.parse_args()
+
+    # Set environment variables if not already set
+    if "POSTGRES_HOST" not in os.environ:
+        raise ValueError("Environment variables are not set")
+
+    db_params = ConnParams(
+        db_user=os.environ["POSTGRES_USER"],
+        db_pass=os.environ["POSTGRES_PASS"],
+        db_host=os.environ["POSTGRES_HOST"],
+        db_name=os.environ["POSTGRES_DB"],
+        db_port=int(os.environ["POSTGRES_PORT"]),
+    )
+
+    # Set the proper event loop policy for Windows to work with psycopg
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(rebuild(db_params))
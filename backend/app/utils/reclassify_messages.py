@@ -0,0 +1,232 @@
+"""Re-run the classifier over every stored message.
+
+When a new `manipulative_classifier.pkl` ships, older rows keep the labels
+of the previous model. This job streams `messages` in keyset-paginated
+chunks ordered by `message_id` (served by the primary key index, so every
+page costs the same no matter how far the job has progressed), classifies
+each chunk across a process pool, and writes the labels back with one
+`UPDATE ... FROM (VALUES ...)` per chunk (`update_message_classifications`),
+touching only rows whose labels changed.
+
+Progress is checkpointed after every committed chunk, so the job can be
+stopped at any time and resumed with the same command:
+```
+python app/utils/reclassify_messages.py --workers 4 --chunk-size 5000
+```
+A checkpoint written for a different model is ignored and the job starts
+over; use `--restart` to discard a checkpoint explicitly.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy import select
+
+load_dotenv()
+
+# Add parent directory to path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.models import Message
+from app.db.postgres import ConnParams, Postgres
+from app.service.classification.artifact import artifact_sha256, ensure_artifact, file_sha256
+from app.service.classification.classifier import ManipulativeMessageClassifier
+from app.service.chat_service import update_message_classifications
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MODEL_PATH = BASE_DIR / "service" / "classification" / "manipulative_classifier.pkl"
+MODEL_ARTIFACT_DIR = BASE_DIR / "service" / "classification" / "manipulative_classifier"
+CHECKPOINT_PATH = BASE_DIR.parent / ".reclassify_checkpoint.json"
+
+Labels = Tuple[bool, Optional[List[str]], Optional[List[str]], float]
+
+# Classifier of each pool process, loaded once by `_init_worker`
+_worker_classifier: Optional[ManipulativeMessageClassifier] = None
+
+
+def _init_worker(model_path: str):
+    global _worker_classifier
+    _worker_classifier = ManipulativeMessageClassifier()
+    _worker_classifier.load_model(model_path)
+
+
+def _classify(contents: List[str]) -> List[Labels]:
+    """Classify a slice of a chunk inside a pool process"""
+    labels = []
+    for result in _worker_classifier.predict_batch(contents):
+        is_manipulative = result["is_manipulative"]
+        labels.append((
+            is_manipulative,
+            result["techniques"] if is_manipulative else None,
+            result["vulnerabilities"] if is_manipulative else None,
+            result["confidence"],
+        ))
+    return labels
+
+
+def load_checkpoint(path: Path, model_sha256: str) -> Dict[str, Any]:
+    fresh = {
+        "model_sha256": model_sha256,
+        "last_message_id": None,
+        "processed": 0,
+        "updated": 0,
+        "started_at": datetime.now(tz=timezone.utc).isoformat(),
+    }
+    if not path.exists():
+        return fresh
+
+    with open(path) as f:
+        checkpoint = json.load(f)
+
+    if checkpoint.get("model_sha256") != model_sha256:
+        logger.warning("Checkpoint was written for a different model, starting over")
+        return fresh
+
+    logger.info(
+        f"Resuming after message {checkpoint['last_message_id']} "
+        f"({checkpoint['processed']} rows already processed)"
+    )
+    return checkpoint
+
+
+def save_checkpoint(path: Path, checkpoint: Dict[str, Any]):
+    # Write-then-rename so an interrupted write never corrupts the checkpoint
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+async def fetch_chunk(
+    db_client: Postgres, after: Optional[UUID], chunk_size: int
+) -> List[Tuple[UUID, str]]:
+    stmt = select(Message.message_id, Message.content).order_by(Message.message_id).limit(chunk_size)
+    if after is not None:
+        stmt = stmt.where(Message.message_id > after)
+
+    result = await db_client.select(stmt)
+    return [(row.message_id, row.content) for row in result.all()]
+
+
+async def reclassify_messages(
+    db_params: ConnParams,
+    model_path: str,
+    chunk_size: int,
+    workers: int,
+    checkpoint_path: Path,
+    restart: bool = False,
+):
+    # The memory-mapped artifact lets every pool process share the model pages
+    if model_path.endswith(".pkl"):
+        model_sha256 = file_sha256(model_path)
+        try:
+            model_path = ensure_artifact(model_path, str(MODEL_ARTIFACT_DIR))
+        except Exception as e:
+            logger.warning(f"Using pickled model in every worker: {str(e)}")
+    else:
+        model_sha256 = artifact_sha256(model_path)
+
+    if restart and checkpoint_path.exists():
+        checkpoint_path.unlink()
+    checkpoint = load_checkpoint(checkpoint_path, model_sha256)
+    last_id = UUID(checkpoint["last_message_id"]) if checkpoint["last_message_id"] else None
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    processed = 0
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(model_path,)
+    ) as pool:
+        async with Postgres.init(**db_params) as db_client:
+            next_chunk = asyncio.create_task(fetch_chunk(db_client, last_id, chunk_size))
+
+            while True:
+                chunk = await next_chunk
+                if not chunk:
+                    break
+
+                # Read the following page while this one is classified and written
+                last_id = chunk[-1][0]
+                next_chunk = asyncio.create_task(fetch_chunk(db_client, last_id, chunk_size))
+
+                message_ids = [message_id for message_id, _ in chunk]
+                contents = [content for _, content in chunk]
+                step = -(-len(contents) // workers)
+                parts = await asyncio.gather(*(
+                    loop.run_in_executor(pool, _classify, contents[i:i + step])
+                    for i in range(0, len(contents), step)
+                ))
+                labels = [label for part in parts for label in part]
+
+                updated = await update_message_classifications(
+                    db_client,
+                    [(message_id, *label) for message_id, label in zip(message_ids, labels)]
+                )
+
+                processed += len(chunk)
+                checkpoint["last_message_id"] = str(last_id)
+                checkpoint["processed"] += len(chunk)
+                checkpoint["updated"] += updated
+                save_checkpoint(checkpoint_path, checkpoint)
+
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    f"{checkpoint['processed']} rows processed, {checkpoint['updated']} updated "
+                    f"({processed / elapsed:.0f} rows/sec)"
+                )
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Reclassification finished: {checkpoint['processed']} rows processed, "
+        f"{checkpoint['updated']} updated in this run and earlier ones; "
+        f"{processed} rows in {elapsed:.1f}s ({processed / elapsed if elapsed > 0 else 0:.0f} rows/sec)"
+    )
+    checkpoint["finished_at"] = datetime.now(tz=timezone.utc).isoformat()
+    save_checkpoint(checkpoint_path, checkpoint)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reclassify stored messages with the current model")
+    parser.add_argument("--model", default=str(MODEL_PATH), help="Model pickle or artifact directory")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Messages per keyset page")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Classifier processes")
+    parser.add_argument("--checkpoint", default=str(CHECKPOINT_PATH), help="Checkpoint file")
+    parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    # Set environment variables if not already set
+    if "POSTGRES_HOST" not in os.environ:
+        raise ValueError("Environment variables are not set")
+
+    db_params = ConnParams(
+        db_user=os.environ["POSTGRES_USER"],
+        db_pass=os.environ["POSTGRES_PASS"],
+        db_host=os.environ["POSTGRES_HOST"],
+        db_name=os.environ["POSTGRES_DB"],
+        db_port=int(os.environ["POSTGRES_PORT"]),
+    )
+
+    # Set the proper event loop policy for Windows to work with psycopg
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(reclassify_messages(
+        db_params,
+        args.model,
+        max(1, args.chunk_size),
+        max(1, args.workers),
+        Path(args.checkpoint),
+        args.restart,
+    ))
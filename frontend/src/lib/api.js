@@ -67,14 +67,17 @@ export const authApi = {
 
 // Chat related endpoints
 export const chatApi = {
-  // Get message history between two users
-  getMessages: async (userId, otherUserId, limit = 50) => {
+  // Get message history between two users; pass the response's
+  // before_cursor / after_cursor to page to older / newer messages
+  getMessages: async (userId, otherUserId, limit = 50, { before, after } = {}) => {
     try {
       const response = await api.get(`/chat/messages`, {
         params: {
           user_id: userId,
           other_user_id: otherUserId,
-          limit
+          limit,
+          before,
+          after
         }
       });
       return response.data;